@@ -0,0 +1,688 @@
+# -*- coding:utf-8 -*-
+"""
+Author:
+    Weichen Shen,weichenswc@163.com
+"""
+import hashlib
+import inspect
+import json
+import os
+import random
+from collections import OrderedDict
+from itertools import chain
+from threading import Thread, Event
+
+try:
+    from queue import Queue, Full, Empty
+except ImportError:
+    from Queue import Queue, Full, Empty
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from .inputs import FeatureBatch, get_hash_features, SparseFeat, DenseFeat, VarLenSparseFeat, SPARSE_INPUT, \
+    DENSE_INPUT, LENGTH_INPUT, RAGGED_INPUT
+
+COLUMNAR_META_FILE = "meta.json"
+COLUMNAR_LABEL_NAME = "_label"
+COLUMNAR_OFFSETS_SUFFIX = ".offsets"
+
+
+def is_batch_stream(data):
+    """Return True if ``data`` is a stream of batches instead of in-memory arrays.
+
+    A stream is a ``torch.utils.data.IterableDataset``, a Python generator, or a function that returns a
+    new iterator of batches every time it is called.
+    """
+    return isinstance(data, IterableDataset) or inspect.isgenerator(data) or callable(data)
+
+
+def is_reiterable(data):
+    """Return True if ``data`` can be iterated more than once, i.e. it is not a bare generator."""
+    return not inspect.isgenerator(data)
+
+
+def iter_stream(data):
+    """Return a fresh iterator over the batches of a stream."""
+    if callable(data) and not isinstance(data, IterableDataset):
+        data = data()
+    return iter(data)
+
+
+def stream_length(data):
+    """Return the number of batches in a stream, or None when it is unknown."""
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+
+def split_batch(batch):
+    """Split a stream element into ``(x, y)``. ``y`` is None for unlabeled batches.
+
+    Batches can be given as ``(x, y)``, ``(x, y, sample_weight)`` or just ``x``, where ``x`` is a dict mapping
+    feature names to arrays (or tensors) of the batch.
+    """
+    if isinstance(batch, (tuple, list)):
+        if len(batch) == 2 or len(batch) == 3:
+            return batch[0], batch[1]
+        raise ValueError('A batch must be `x`, `(x, y)` or `(x, y, sample_weight)`, '
+                         'but got a sequence of length %d' % len(batch))
+    return batch, None
+
+
+class RaggedArray(object):
+    """Rows of different lengths stored as one flat array of ``values`` and the ``offsets`` of the rows.
+
+    Row ``i`` is ``values[offsets[i]:offsets[i + 1]]``, so ``offsets`` has one more element than the number of rows.
+    This is the input format of a ragged ``VarLenSparseFeat``, no padding is stored nor computed.
+
+    :param values: 1D array of ids.
+    :param offsets: 1D integer array, starting with 0 and ending with ``len(values)``.
+    """
+
+    def __init__(self, values, offsets):
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_lengths(cls, values, lengths):
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(values, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __getitem__(self, index):
+        """Return the rows selected by a slice or an integer array as a new ``RaggedArray``."""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                offsets = self.offsets[start:stop + 1]
+                return RaggedArray(self.values[offsets[0]:offsets[-1]], offsets - offsets[0])
+            index = np.arange(start, stop, step)
+        index = np.asarray(index)
+        starts = self.offsets[index]
+        lengths = self.offsets[index + 1] - starts
+        result = RaggedArray.from_lengths(None, lengths)
+        result.values = self.values[_ragged_positions(starts, lengths, result.offsets)]
+        return result
+
+
+def _ragged_positions(starts, lengths, offsets):
+    # positions in the source values of the rows starting at `starts`, concatenated into `offsets`
+    return np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], lengths)
+
+
+def pack_sequences(sequences, dtype=None):
+    """Pack a list of sequences into a ``RaggedArray``.
+
+    :param sequences: iterable of lists (or arrays) of ids, or a ``RaggedArray``.
+    :param dtype: numpy dtype of the values. If given, the values are read in a single ``np.fromiter`` pass.
+    :return: A ``RaggedArray``.
+    """
+    if isinstance(sequences, RaggedArray):
+        return sequences
+    sequences = list(sequences)
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    if dtype is not None:
+        values = np.fromiter(chain.from_iterable(sequences), dtype=dtype, count=int(lengths.sum()))
+    elif lengths.sum() > 0:
+        values = np.concatenate([np.asarray(sequence) for sequence in sequences if len(sequence) > 0])
+    else:
+        values = np.empty(0, dtype=np.int64)
+    return RaggedArray.from_lengths(values, lengths)
+
+
+def pad_sequences(sequences, maxlen=None, dtype='int32', padding='pre', truncating='pre', value=0.):
+    """Pad sequences to the same length, a vectorised drop-in for ``keras.preprocessing.sequence.pad_sequences``.
+
+    :param sequences: list of sequences, or a ``RaggedArray``.
+    :param maxlen: int, length of the output rows. If None, the length of the longest sequence.
+    :param dtype: dtype of the output.
+    :param padding: str, ``'pre'`` or ``'post'``, pad before or after each sequence.
+    :param truncating: str, ``'pre'`` or ``'post'``, remove values from the beginning or the end of longer sequences.
+    :param value: padding value.
+    :return: 2D numpy array with shape ``(len(sequences), maxlen)``.
+    """
+    if padding not in ('pre', 'post') or truncating not in ('pre', 'post'):
+        raise ValueError("padding and truncating should be 'pre' or 'post'")
+    sequences = pack_sequences(sequences)
+    lengths = sequences.lengths()
+    if maxlen is None:
+        maxlen = int(lengths.max()) if len(lengths) > 0 else 0
+    kept = np.minimum(lengths, maxlen)
+    starts = sequences.offsets[:-1] + (lengths - kept if truncating == 'pre' else 0)
+    columns = maxlen - kept if padding == 'pre' else np.zeros_like(kept)
+
+    result = np.full((len(sequences), maxlen), value, dtype=dtype)
+    kept_offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+    np.cumsum(kept, out=kept_offsets[1:])
+    rows = np.repeat(np.arange(len(kept)), kept)
+    columns = np.arange(kept_offsets[-1]) + np.repeat(columns - kept_offsets[:-1], kept)
+    result[rows, columns] = sequences.values[_ragged_positions(starts, kept, kept_offsets)]
+    return result
+
+
+def take_ragged(values, offsets, index):
+    """Select rows of a ragged ``(values, offsets)`` pair of tensors, ``offsets`` holding the start of every row.
+
+    :return: The ``(values, offsets)`` pair of the rows ``index``.
+    """
+    ends = torch.cat([offsets[1:], offsets.new_tensor([values.shape[0]])])
+    starts = offsets[index]
+    lengths = ends[index] - starts
+    new_offsets = torch.cumsum(lengths, 0) - lengths
+    positions = torch.arange(int(lengths.sum()), dtype=offsets.dtype) + torch.repeat_interleave(
+        starts - new_offsets, lengths)
+    return values[positions], new_offsets
+
+
+# multipliers of the splitmix64 finalizer
+_HASH_MULTIPLIERS = (np.uint64(0xbf58476d1ce4e5b9), np.uint64(0x94d049bb133111eb))
+_HASH_PADDING_VALUES = ("", "0", b"", b"0")
+
+
+def _mix64(h):
+    # splitmix64 finalizer, a bijection of uint64 spreading every input bit over the output
+    with np.errstate(over="ignore"):
+        h = (h ^ (h >> np.uint64(30))) * _HASH_MULTIPLIERS[0]
+        h = (h ^ (h >> np.uint64(27))) * _HASH_MULTIPLIERS[1]
+    return h ^ (h >> np.uint64(31))
+
+
+def _hash_string(value):
+    if not isinstance(value, bytes):
+        value = str(value).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def hash_ids(values, num_buckets, mask_zero=False):
+    """Hash raw ids into ``[0, num_buckets)``, vectorised over the whole array.
+
+    Integer ids are hashed with the splitmix64 finalizer. Strings (and other objects, through ``str``) are
+    hashed once per distinct value with a 64 bits blake2b digest. Hashes do not depend on the process, so a
+    model can be served with the ids used in training.
+
+    :param values: array-like of integer or string ids, of any shape.
+    :param num_buckets: int, number of hash buckets, i.e. the ``vocabulary_size`` of the feature.
+    :param mask_zero: bool, if True, padding values (``0``, ``"0"`` and ``""``) are mapped to 0 and
+        the other ids to ``[1, num_buckets)``.
+    :return: int64 array of bucket ids with the shape of ``values``.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        hashes = _mix64(values.astype(np.int64).view(np.uint64))
+        padding = values == 0 if mask_zero else None
+    else:
+        if values.dtype.kind == "f":
+            raise TypeError("Hashed ids should be integers or strings, got %s" % values.dtype)
+        if values.dtype.kind == "O":
+            values = values.astype(np.str_)
+        uniques, inverse = np.unique(values, return_inverse=True)
+        unique_hashes = np.fromiter((_hash_string(value) for value in uniques), dtype=np.uint64,
+                                    count=len(uniques))
+        hashes = unique_hashes[inverse.reshape(values.shape)]
+        if mask_zero:
+            unique_padding = np.fromiter((value in _HASH_PADDING_VALUES for value in uniques), dtype=bool,
+                                         count=len(uniques))
+            padding = unique_padding[inverse.reshape(values.shape)]
+    if not mask_zero:
+        return (hashes % np.uint64(num_buckets)).astype(np.int64)
+    bucket = (hashes % np.uint64(num_buckets - 1)).astype(np.int64) + 1
+    bucket[padding] = 0
+    return bucket
+
+
+def hash_collision_report(x, feature_columns):
+    """Measure hash collisions of the ``use_hash`` features on a sample of raw data.
+
+    :param x: dict mapping feature names to raw ids, or a pandas DataFrame.
+    :param feature_columns: list of ``SparseFeat`` and ``VarLenSparseFeat``, features without ``use_hash`` are ignored.
+    :return: OrderedDict ``{feature_name: {...}}`` with, for every hashed feature, the number of ``distinct_ids``,
+        of ``used_buckets``, the ``collision_rate`` (fraction of distinct ids sharing their bucket with an id seen
+        before) and the ``expected_collision_rate`` of an ideal hash with the same number of buckets.
+    """
+    report = OrderedDict()
+    for name, (num_buckets, mask_zero) in get_hash_features(feature_columns).items():
+        values = np.asarray(x[name]).ravel()
+        buckets = hash_ids(values, num_buckets, mask_zero)
+        if mask_zero:
+            values, buckets = values[buckets != 0], buckets[buckets != 0]
+            num_buckets -= 1
+        distinct_ids = len(np.unique(values))
+        used_buckets = len(np.unique(buckets))
+        expected_buckets = num_buckets * (1 - (1 - 1. / num_buckets) ** distinct_ids)
+        report[name] = {"distinct_ids": distinct_ids,
+                        "used_buckets": used_buckets,
+                        "collision_rate": 1 - float(used_buckets) / max(distinct_ids, 1),
+                        "expected_collision_rate": 1 - expected_buckets / max(distinct_ids, 1)}
+    return report
+
+
+def build_feature_batch(x, feature_index, sparse_dtype=np.int64, hash_features=None):
+    """Convert input arrays into a ``FeatureBatch``.
+
+    :param x: dict mapping feature names to arrays (or tensors), a pandas DataFrame, or a list of arrays ordered as
+        ``feature_index``. Every feature is copied once, straight into the output tensors.
+    :param feature_index: OrderedDict returned by ``build_typed_input_features``.
+    :param sparse_dtype: numpy dtype used to store sparse ids.
+    :param hash_features: OrderedDict returned by ``get_hash_features``, the raw ids of these features are hashed.
+    :return: A ``FeatureBatch`` of CPU tensors.
+    """
+    if isinstance(x, FeatureBatch):
+        return x
+    if not isinstance(x, dict) and not hasattr(x, "columns"):
+        x = dict(zip(feature_index.keys(), x))
+
+    num_samples = len(x[next(iter(feature_index))])
+    widths = [0, 0, 0, 0]
+    for group, _, end in feature_index.values():
+        widths[group] = max(widths[group], end)
+
+    arrays = [None, None, None, [None] * widths[RAGGED_INPUT]]
+    arrays[SPARSE_INPUT] = np.empty((num_samples, widths[SPARSE_INPUT]), dtype=sparse_dtype)
+    arrays[DENSE_INPUT] = np.empty((num_samples, widths[DENSE_INPUT]), dtype=np.float32)
+    arrays[LENGTH_INPUT] = np.empty((num_samples, widths[LENGTH_INPUT]), dtype=np.int64)
+    for name, (group, start, end) in feature_index.items():
+        if group == RAGGED_INPUT:
+            value = pack_sequences(x[name])
+            values = value.values
+            if hash_features and name in hash_features:
+                values = hash_ids(values, *hash_features[name])
+            arrays[group][start] = (torch.from_numpy(np.ascontiguousarray(values, dtype=sparse_dtype)),
+                                    torch.from_numpy(value.offsets[:-1].copy()))
+            continue
+        value = np.asarray(x[name])
+        if hash_features and name in hash_features:
+            value = hash_ids(value, *hash_features[name])
+        arrays[group][:, start:end] = value.reshape(num_samples, end - start)
+    return FeatureBatch(*[torch.from_numpy(array) for array in arrays[:RAGGED_INPUT]], ragged=arrays[RAGGED_INPUT])
+
+
+def slice_feature_batch(batch, start, stop=None):
+    """Return the rows ``[start, stop)`` of a ``FeatureBatch``, as views of its tensors."""
+    ragged = []
+    for values, offsets in batch.ragged:
+        num_rows = offsets.shape[0]
+        row_stop = num_rows if stop is None else min(stop, num_rows)
+        begin = int(offsets[start]) if start < num_rows else values.shape[0]
+        end = int(offsets[row_stop]) if row_stop < num_rows else values.shape[0]
+        ragged.append((values[begin:end], offsets[start:row_stop] - begin))
+    return FeatureBatch(batch.sparse[start:stop], batch.dense[start:stop], batch.length[start:stop], ragged)
+
+
+def take_feature_batch(batch, index):
+    """Return the rows ``index`` (a 1D integer tensor) of a ``FeatureBatch``."""
+    return FeatureBatch(batch.sparse[index], batch.dense[index], batch.length[index],
+                        [take_ragged(values, offsets, index) for values, offsets in batch.ragged])
+
+
+def convert_batch(batch, feature_index, sparse_dtype=np.int64, hash_features=None):
+    """Convert a stream element into a ``(FeatureBatch, y)`` tuple of CPU tensors, ``y`` may be None."""
+    x, y = split_batch(batch)
+    x = build_feature_batch(x, feature_index, sparse_dtype, hash_features)
+    if y is not None and not isinstance(y, torch.Tensor):
+        y = torch.from_numpy(np.asarray(y))
+    return x, y
+
+
+def split_tensor_batch(batch, ragged=()):
+    """Convert a ``[sparse, dense, length(, y)]`` batch of ``TensorBatchIterator`` into ``(FeatureBatch, y)``.
+
+    :param ragged: ``FeatureBatch.ragged`` of the whole dataset. If not empty, the last tensor of ``batch`` holds
+        the row numbers of the batch, used to take the rows of the ragged features.
+    """
+    if len(ragged) > 0:
+        index, batch = batch[-1], batch[:-1]
+        ragged = [take_ragged(values, offsets, index) for values, offsets in ragged]
+    return FeatureBatch(*batch[:3], ragged=ragged), batch[3] if len(batch) > 3 else None
+
+
+def batch_to_device(batch, device, pin_memory=False):
+    """Move a ``(FeatureBatch, y)`` batch to ``device``, through pinned memory if ``pin_memory`` is True."""
+    x, y = batch
+    if pin_memory:
+        x = x.pin_memory()
+        y = None if y is None else y.pin_memory()
+    x = x.to(device, non_blocking=pin_memory)
+    y = None if y is None else y.to(device, non_blocking=pin_memory)
+    return x, y
+
+
+class BatchLoader(object):
+    """Re-iterable view of an input pipeline as ``(FeatureBatch, y)`` batches.
+
+    :param batches: a ``TensorBatchIterator``, a ``DataLoader`` or a stream of batches.
+    :param convert: function applied to every element of ``batches``, or None.
+    """
+
+    def __init__(self, batches, convert=None):
+        self.batches = batches
+        self.convert = convert
+
+    def __len__(self):
+        # raise TypeError when the length is unknown, like `len` does for generators
+        return len(self.batches)
+
+    def __iter__(self):
+        for batch in iter_stream(self.batches):
+            yield batch if self.convert is None else self.convert(batch)
+
+
+class BackgroundPrefetcher(object):
+    """Iterate over ``iterable`` in a background thread, keeping up to ``max_prefetch`` items ready.
+
+    The next batches are prepared (and moved to the device with ``transform``) while the model computes
+    the current one. Exceptions raised while preparing a batch are re-raised in the consuming thread.
+
+    :param iterable: re-iterable source of items, a new thread is started for every iteration.
+    :param max_prefetch: int, maximum number of items prepared in advance.
+    :param transform: function applied to every item in the background thread, or None.
+    """
+
+    def __init__(self, iterable, max_prefetch=1, transform=None):
+        self.iterable = iterable
+        self.max_prefetch = max_prefetch
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.iterable)
+
+    def __iter__(self):
+        queue = Queue(maxsize=self.max_prefetch)
+        stop = Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for item in self.iterable:
+                    if self.transform is not None:
+                        item = self.transform(item)
+                    if not put((item, None)):
+                        return
+                put((end, None))
+            except BaseException as e:  # re-raised by the consumer
+                put((None, e))
+
+        thread = Thread(target=produce)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                try:
+                    item, error = queue.get(timeout=0.1)
+                except Empty:
+                    if not thread.is_alive() and queue.empty():
+                        raise RuntimeError("The prefetching thread exited unexpectedly")
+                    continue
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+
+class TensorBatchIterator(object):
+    """Iterate over in-memory tensors batch by batch.
+
+    Each batch is produced with a single slice (no shuffling) or a single ``index_select`` (shuffling) per tensor,
+    instead of fetching every sample separately and stacking them like the default ``DataLoader`` does.
+    Shuffling permutes blocks of ``block_size`` consecutive rows, ``block_size=1`` shuffles every sample.
+
+    :param tensors: list of tensors with the same first dimension.
+    :param batch_size: int, number of rows per batch.
+    :param shuffle: bool, whether to shuffle the rows at the beginning of every iteration.
+    :param block_size: int, number of consecutive rows kept together when shuffling.
+    :param drop_last: bool, whether to drop the last incomplete batch.
+    """
+
+    def __init__(self, tensors, batch_size=256, shuffle=False, block_size=1, drop_last=False):
+        self.tensors = list(tensors)
+        self.num_samples = self.tensors[0].shape[0]
+        for tensor in self.tensors:
+            if tensor.shape[0] != self.num_samples:
+                raise ValueError("All tensors must have the same number of rows")
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.block_size = block_size
+        self.drop_last = drop_last
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples - 1) // self.batch_size + 1
+
+    def __iter__(self):
+        num_batches = len(self)
+        if not self.shuffle:
+            for i in range(num_batches):
+                start = i * self.batch_size
+                yield [tensor[start:start + self.batch_size] for tensor in self.tensors]
+            return
+
+        num_blocks = (self.num_samples - 1) // self.block_size + 1
+        block_index = torch.randperm(num_blocks)
+        if self.block_size == 1:
+            index = block_index
+        else:
+            index = (block_index.unsqueeze(1) * self.block_size + torch.arange(self.block_size)).flatten()
+            index = index[index < self.num_samples]
+        for i in range(num_batches):
+            batch_index = index[i * self.batch_size:(i + 1) * self.batch_size]
+            yield [tensor.index_select(0, batch_index) for tensor in self.tensors]
+
+
+def _to_numpy_dtype(dtype):
+    if dtype in ("string", "str"):
+        # raw ids of hashed features, the width of the strings is found when writing
+        return np.dtype(np.str_)
+    try:
+        return np.dtype(dtype)
+    except TypeError:
+        # torch dtypes, e.g. torch.int32
+        return np.dtype(str(dtype).replace("torch.", ""))
+
+
+def get_input_dtypes(feature_columns):
+    # Return OrderedDict: {feature_name: numpy dtype used to store the feature}
+    dtypes = OrderedDict()
+    for feat in feature_columns:
+        if feat.name in dtypes:
+            continue
+        if isinstance(feat, (SparseFeat, VarLenSparseFeat, DenseFeat)):
+            dtypes[feat.name] = _to_numpy_dtype(feat.dtype)
+        else:
+            raise TypeError("Invalid feature column type,got", type(feat))
+        if isinstance(feat, VarLenSparseFeat) and feat.length_name is not None and feat.length_name not in dtypes:
+            dtypes[feat.length_name] = np.dtype(np.int32)
+    return dtypes
+
+
+def _columnar_shard_file(path, name, shard):
+    return os.path.join(path, "%s.%05d.npy" % (name, shard))
+
+
+class ColumnarDatasetWriter(object):
+    """Write features into a directory of per-feature ``.npy`` shards, typed by the feature columns.
+
+    Every call to ``write`` appends one shard: a ``<feature_name>.<shard>.npy`` file per feature and, if labels
+    are given, a ``_label.<shard>.npy`` file. Ragged ``VarLenSparseFeat`` also get a ``<feature_name>.offsets.<shard>.npy``
+    file. The layout is recorded in ``meta.json`` when the writer is closed.
+    The directory can then be read with ``ColumnarDataset``.
+
+    :param path: str, output directory.
+    :param feature_columns: list of ``SparseFeat``, ``DenseFeat`` and ``VarLenSparseFeat``.
+    """
+
+    def __init__(self, path, feature_columns):
+        self.path = path
+        self.dtypes = get_input_dtypes(feature_columns)
+        self.ragged = [feat.name for feat in feature_columns if isinstance(feat, VarLenSparseFeat) and feat.ragged]
+        self.shard_rows = []
+        self.has_label = None
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def write(self, x, y=None):
+        """Append one shard.
+
+        :param x: dict mapping feature names to arrays, or a pandas DataFrame.
+        :param y: optional array of labels.
+        """
+        if self.has_label is None:
+            self.has_label = y is not None
+        elif self.has_label != (y is not None):
+            raise ValueError("Either all shards or none of them should have labels")
+
+        shard = len(self.shard_rows)
+        num_rows = None
+        for name, dtype in self.dtypes.items():
+            if name in self.ragged:
+                value = pack_sequences(x[name])
+                np.save(self._shard_file(name + COLUMNAR_OFFSETS_SUFFIX, shard), value.offsets)
+                np.save(self._shard_file(name, shard), np.ascontiguousarray(value.values, dtype=dtype))
+            else:
+                value = np.ascontiguousarray(np.asarray(x[name]), dtype=dtype)
+                np.save(self._shard_file(name, shard), value)
+            if num_rows is None:
+                num_rows = len(value)
+            elif len(value) != num_rows:
+                raise ValueError("Feature %s has %d rows, expected %d" % (name, len(value), num_rows))
+        if y is not None:
+            np.save(self._shard_file(COLUMNAR_LABEL_NAME, shard), np.ascontiguousarray(np.asarray(y)))
+        self.shard_rows.append(num_rows)
+
+    def close(self):
+        meta = {"features": OrderedDict((name, dtype.name) for name, dtype in self.dtypes.items()),
+                "shard_rows": self.shard_rows,
+                "has_label": bool(self.has_label),
+                "ragged": self.ragged}
+        with open(os.path.join(self.path, COLUMNAR_META_FILE), "w") as f:
+            json.dump(meta, f)
+
+    def _shard_file(self, name, shard):
+        return _columnar_shard_file(self.path, name, shard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def save_columnar_dataset(path, x, feature_columns, y=None, shard_size=1000000):
+    """Save a feature dict (or a pandas DataFrame) as a columnar dataset readable by ``ColumnarDataset``.
+
+    :param path: str, output directory.
+    :param x: dict mapping feature names to arrays, or a pandas DataFrame.
+    :param feature_columns: list of ``SparseFeat``, ``DenseFeat`` and ``VarLenSparseFeat``.
+    :param y: optional array of labels.
+    :param shard_size: int, number of rows per shard.
+    """
+    with ColumnarDatasetWriter(path, feature_columns) as writer:
+        num_rows = len(x[next(iter(writer.dtypes))])
+        for start in range(0, num_rows, shard_size):
+            end = min(start + shard_size, num_rows)
+            writer.write({name: pack_sequences(x[name])[start:end] if name in writer.ragged else
+                          np.asarray(x[name])[start:end] for name in writer.dtypes},
+                         None if y is None else np.asarray(y)[start:end])
+
+
+class ColumnarDataset(IterableDataset):
+    """Memory-mapped reader of a dataset written by ``ColumnarDatasetWriter``.
+
+    It yields ``(x_dict, y)`` batches (or ``x_dict`` when the dataset has no labels) that can be passed
+    directly to ``fit``, ``evaluate`` and ``predict``. Shards are memory-mapped, so only the rows of the
+    current batch are read from disk, and only the requested columns are opened.
+
+    :param path: str, dataset directory.
+    :param columns: iterable of feature names to read, e.g. ``model.feature_index``. If None, read all features.
+    :param batch_size: int, number of rows per batch. Batches do not cross shard boundaries.
+    :param shuffle: bool, whether to shuffle the order of shards and of batches inside each shard every epoch.
+    :param seed: int, random seed used for shuffling.
+
+    The order of an epoch is drawn from ``seed`` and the epoch number, which is incremented by every iteration.
+    DataLoader workers iterate a copy of the dataset, so when they are not persistent call ``set_epoch`` before
+    each epoch (``fit`` does it) to get a new order every epoch.
+    """
+
+    def __init__(self, path, columns=None, batch_size=256, shuffle=False, seed=1024):
+        super(ColumnarDataset, self).__init__()
+        with open(os.path.join(path, COLUMNAR_META_FILE)) as f:
+            meta = json.load(f)
+        self.path = path
+        self.shard_rows = meta["shard_rows"]
+        self.has_label = meta["has_label"]
+        self.ragged = set(meta.get("ragged", []))
+        self.columns = list(meta["features"]) if columns is None else list(columns)
+        for name in self.columns:
+            if name not in meta["features"]:
+                raise KeyError("Feature %s is not in the dataset at %s" % (name, path))
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return sum((num_rows - 1) // self.batch_size + 1 for num_rows in self.shard_rows if num_rows > 0)
+
+    def num_samples(self):
+        return sum(self.shard_rows)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def load_shard(self, shard):
+        x = {name: self._load_column(name, shard) for name in self.columns}
+        y = np.load(self._shard_file(COLUMNAR_LABEL_NAME, shard), mmap_mode="r") if self.has_label else None
+        return x, y
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        self.epoch += 1
+        shards = list(range(len(self.shard_rows)))
+        if self.shuffle:
+            rng.shuffle(shards)
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            shards = shards[worker_info.id::worker_info.num_workers]
+
+        for shard in shards:
+            x, y = self.load_shard(shard)
+            starts = list(range(0, self.shard_rows[shard], self.batch_size))
+            if self.shuffle:
+                rng.shuffle(starts)
+            for start in starts:
+                end = start + self.batch_size
+                x_batch = {name: value[start:end] for name, value in x.items()}
+                if y is None:
+                    yield x_batch
+                else:
+                    yield x_batch, np.array(y[start:end])
+
+    def _load_column(self, name, shard):
+        value = np.load(self._shard_file(name, shard), mmap_mode="r")
+        if name in self.ragged:
+            return RaggedArray(value, np.load(self._shard_file(name + COLUMNAR_OFFSETS_SUFFIX, shard), mmap_mode="r"))
+        return value
+
+    def _shard_file(self, name, shard):
+        return _columnar_shard_file(self.path, name, shard)
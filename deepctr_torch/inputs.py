@@ -9,6 +9,7 @@ from itertools import chain
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 
 from .layers.sequence import SequencePoolingLayer
@@ -16,6 +17,12 @@ from .layers.utils import concat_fun
 
 DEFAULT_GROUP_NAME = "default_group"
 
+# positions of the input tensors in `FeatureBatch`
+SPARSE_INPUT = 0
+DENSE_INPUT = 1
+LENGTH_INPUT = 2
+RAGGED_INPUT = 3
+
 
 class SparseFeat(namedtuple('SparseFeat',
                             ['name', 'vocabulary_size', 'embedding_dim', 'use_hash', 'dtype', 'embedding_name',
@@ -28,9 +35,6 @@ class SparseFeat(namedtuple('SparseFeat',
             embedding_name = name
         if embedding_dim == "auto":
             embedding_dim = 6 * int(pow(vocabulary_size, 0.25))
-        if use_hash:
-            print(
-                "Notice! Feature Hashing on the fly currently is not supported in torch version,you can use tensorflow version!")
         return super(SparseFeat, cls).__new__(cls, name, vocabulary_size, embedding_dim, use_hash, dtype,
                                               embedding_name, group_name)
 
@@ -39,11 +43,13 @@ class SparseFeat(namedtuple('SparseFeat',
 
 
 class VarLenSparseFeat(namedtuple('VarLenSparseFeat',
-                                  ['sparsefeat', 'maxlen', 'combiner', 'length_name'])):
+                                  ['sparsefeat', 'maxlen', 'combiner', 'length_name', 'ragged'])):
     __slots__ = ()
 
-    def __new__(cls, sparsefeat, maxlen, combiner="mean", length_name=None):
-        return super(VarLenSparseFeat, cls).__new__(cls, sparsefeat, maxlen, combiner, length_name)
+    def __new__(cls, sparsefeat, maxlen, combiner="mean", length_name=None, ragged=False):
+        if ragged and length_name is not None:
+            raise ValueError("length_name should be None for a ragged VarLenSparseFeat, lengths are given by offsets")
+        return super(VarLenSparseFeat, cls).__new__(cls, sparsefeat, maxlen, combiner, length_name, ragged)
 
     @property
     def name(self):
@@ -87,6 +93,36 @@ class DenseFeat(namedtuple('DenseFeat', ['name', 'dimension', 'dtype'])):
         return self.name.__hash__()
 
 
+class FeatureBatch(namedtuple('FeatureBatch', ['sparse', 'dense', 'length', 'ragged'])):
+    """A batch of model inputs, grouped by type instead of packed into one float matrix.
+
+    - sparse : 2D integer tensor with the ids of ``SparseFeat`` and the padded ids of ``VarLenSparseFeat``.
+    - dense : 2D float tensor with the values of ``DenseFeat``.
+    - length : 2D integer tensor with the lengths of ``VarLenSparseFeat`` given by ``length_name``.
+    - ragged : tuple with a ``(values, offsets)`` pair of 1D integer tensors per ragged ``VarLenSparseFeat``,
+      ``offsets`` holds the start of every row in ``values``, as expected by ``nn.EmbeddingBag``.
+
+    Columns of each tensor are located with the index returned by ``build_typed_input_features``.
+    An empty group is a tensor with 0 columns, so every tensor carries the batch size.
+    """
+    __slots__ = ()
+
+    def __new__(cls, sparse, dense, length, ragged=()):
+        return super(FeatureBatch, cls).__new__(cls, sparse, dense, length, tuple(ragged))
+
+    def to(self, device, non_blocking=False):
+        # ids are kept as narrow as possible on the host, cast once per batch instead of once per feature
+        return FeatureBatch(self.sparse.to(device, non_blocking=non_blocking).long(),
+                            self.dense.to(device, non_blocking=non_blocking).float(),
+                            self.length.to(device, non_blocking=non_blocking).long(),
+                            [(values.to(device, non_blocking=non_blocking).long(),
+                              offsets.to(device, non_blocking=non_blocking).long()) for values, offsets in self.ragged])
+
+    def pin_memory(self):
+        return FeatureBatch(self.sparse.pin_memory(), self.dense.pin_memory(), self.length.pin_memory(),
+                            [(values.pin_memory(), offsets.pin_memory()) for values, offsets in self.ragged])
+
+
 def get_feature_names(feature_columns):
     features = build_input_features(feature_columns)
     return list(features.keys())
@@ -112,6 +148,9 @@ def build_input_features(feature_columns):
         elif isinstance(feat, DenseFeat):
             features[feat_name] = (start, start + feat.dimension)
             start += feat.dimension
+        elif isinstance(feat, VarLenSparseFeat) and feat.ragged:
+            features[feat_name] = (start, start + 1)
+            start += 1
         elif isinstance(feat, VarLenSparseFeat):
             features[feat_name] = (start, start + feat.maxlen)
             start += feat.maxlen
@@ -123,7 +162,80 @@ def build_input_features(feature_columns):
     return features
 
 
+def build_typed_input_features(feature_columns):
+    # Return OrderedDict: {feature_name:(input_group, start, start+dimension)}
+    # input_group is the position in `FeatureBatch` of the tensor holding the feature,
+    # for ragged features `start` is the position of the `(values, offsets)` pair in `FeatureBatch.ragged`
+
+    features = OrderedDict()
+
+    starts = [0, 0, 0, 0]
+
+    def add(feat_name, group, dimension):
+        features[feat_name] = (group, starts[group], starts[group] + dimension)
+        starts[group] += dimension
+
+    for feat in feature_columns:
+        feat_name = feat.name
+        if feat_name in features:
+            continue
+        if isinstance(feat, SparseFeat):
+            add(feat_name, SPARSE_INPUT, 1)
+        elif isinstance(feat, DenseFeat):
+            add(feat_name, DENSE_INPUT, feat.dimension)
+        elif isinstance(feat, VarLenSparseFeat) and feat.ragged:
+            add(feat_name, RAGGED_INPUT, 1)
+        elif isinstance(feat, VarLenSparseFeat):
+            add(feat_name, SPARSE_INPUT, feat.maxlen)
+            if feat.length_name is not None and feat.length_name not in features:
+                add(feat.length_name, LENGTH_INPUT, 1)
+        else:
+            raise TypeError("Invalid feature column type,got", type(feat))
+    return features
+
+
+def get_sparse_input_dtype(feature_columns):
+    # Sparse ids are stored as int32 unless a sparse feature declares 64-bit ids
+    for feat in feature_columns:
+        if isinstance(feat, (SparseFeat, VarLenSparseFeat)) and "int64" in str(feat.dtype):
+            return np.int64
+    return np.int32
+
+
+def get_hash_features(feature_columns):
+    # Return OrderedDict: {feature_name: (num_buckets, mask_zero)} for the features with `use_hash=True`.
+    # Ids of VarLenSparseFeat are padded with 0, so 0 is kept for padding and the other ids are hashed into
+    # [1, num_buckets). Features sharing an embedding with a VarLenSparseFeat are hashed the same way, so that
+    # the same raw id always hits the same embedding row.
+    masked_embeddings = set(feat.embedding_name for feat in feature_columns if isinstance(feat, VarLenSparseFeat))
+    hash_features = OrderedDict()
+    for feat in feature_columns:
+        if isinstance(feat, (SparseFeat, VarLenSparseFeat)) and feat.use_hash and feat.name not in hash_features:
+            hash_features[feat.name] = (feat.vocabulary_size, feat.embedding_name in masked_embeddings)
+    return hash_features
+
+
+def get_feature_input(X, feature_index, feature_name):
+    """Return the columns of ``feature_name`` from a ``FeatureBatch``, as a 2D tensor view.
+
+    For a ragged ``VarLenSparseFeat``, return its ``(values, offsets)`` pair.
+    """
+    group, start, end = feature_index[feature_name]
+    if group == RAGGED_INPUT:
+        return X[group][start]
+    return X[group][:, start:end]
+
+
 def combined_dnn_input(sparse_embedding_list, dense_value_list):
+    if sparse_embedding_list is None:
+        # `FeaturePlan.stacked_embeddings` without sparse features
+        sparse_embedding_list = []
+    if isinstance(sparse_embedding_list, torch.Tensor):
+        # the (batch_size, num_features, embedding_dim) embeddings of `FeaturePlan.stacked_embeddings`
+        sparse_dnn_input = torch.flatten(sparse_embedding_list, start_dim=1)
+        if len(dense_value_list) == 0:
+            return sparse_dnn_input
+        return concat_fun([sparse_dnn_input, torch.flatten(torch.cat(dense_value_list, dim=-1), start_dim=1)])
     if len(sparse_embedding_list) > 0 and len(dense_value_list) > 0:
         sparse_dnn_input = torch.flatten(
             torch.cat(sparse_embedding_list, dim=-1), start_dim=1)
@@ -138,17 +250,182 @@ def combined_dnn_input(sparse_embedding_list, dense_value_list):
         raise NotImplementedError
 
 
+def _input_slice(feature_index, feature_name):
+    # (input_group, columns) of a feature, `columns` is the position of the pair of a ragged feature
+    group, start, end = feature_index[feature_name]
+    if group == RAGGED_INPUT:
+        return group, start
+    return group, slice(start, end)
+
+
+def _embedding_bag(embedding, values, offsets, mode):
+    # pooled (batch_size, 1, embedding_dim) bags, on the rows of the fused table for an `EmbeddingView`
+    if isinstance(embedding, EmbeddingColumns):
+        return _embedding_bag(embedding.table, values, offsets, mode)[..., embedding.start:embedding.end]
+    if isinstance(embedding, EmbeddingView):
+        values, embedding = values + embedding.offset, embedding.fused
+    return F.embedding_bag(values, embedding.weight, offsets, mode=mode, sparse=embedding.sparse).unsqueeze(1)
+
+
+def _lookup(X, embedding, group, columns, compute):
+    # `compute(embedding)` of the feature at `group, columns`. The whole rows of a table shared by the first-order
+    # and the DNN embeddings are computed once per batch, and each `EmbeddingColumns` keeps its own columns
+    if isinstance(embedding, EmbeddingColumns):
+        key = (group, columns if group == RAGGED_INPUT else columns.start)
+        return embedding.lookups.get(X, key, lambda: compute(embedding.table))[..., embedding.start:embedding.end]
+    return compute(embedding)
+
+
+class FeaturePlan(nn.Module):
+    """Lookups of a list of feature columns, resolved once when a model is built.
+
+    The columns are split by type, the slices of their inputs in a ``FeatureBatch`` and the pooling layers of the
+    ``VarLenSparseFeat`` are created at construction, so that a forward pass only slices the inputs and calls the
+    embedding tables.
+
+    :param feature_columns: list of feature columns.
+    :param feature_index: OrderedDict ``{feature_name: (input_group, start, end)}``, see ``build_typed_input_features``.
+    :param device: str, ``"cpu"`` or ``"cuda:0"``.
+    """
+
+    def __init__(self, feature_columns, feature_index, device='cpu'):
+        super(FeaturePlan, self).__init__()
+        feature_columns = list(feature_columns) if feature_columns else []
+        sparse_feature_columns = [fc for fc in feature_columns if isinstance(fc, SparseFeat)]
+        varlen_sparse_feature_columns = [fc for fc in feature_columns if isinstance(fc, VarLenSparseFeat)]
+        dense_feature_columns = [fc for fc in feature_columns if isinstance(fc, DenseFeat)]
+
+        self.sparse_features = [(fc.embedding_name,) + _input_slice(feature_index, fc.name)
+                                for fc in sparse_feature_columns]
+        self.varlen_features = [(fc.embedding_name, fc.combiner, fc.ragged) + _input_slice(feature_index, fc.name) +
+                                (None if fc.length_name is None else _input_slice(feature_index, fc.length_name),)
+                                for fc in varlen_sparse_feature_columns]
+        self.dense_features = [_input_slice(feature_index, fc.name) for fc in dense_feature_columns]
+        self.pooling = nn.ModuleList(
+            [SequencePoolingLayer(mode=fc.combiner, supports_masking=fc.length_name is None, device=device)
+             for fc in varlen_sparse_feature_columns])
+
+        # unpooled lookups of the sparse and padded varlen sparse features, ordered by group as `embedding_lookup`
+        groups = OrderedDict()
+        for fc in feature_columns:
+            if isinstance(fc, SparseFeat) or isinstance(fc, VarLenSparseFeat) and not fc.ragged:
+                groups.setdefault(fc.group_name, []).append(
+                    (fc.embedding_name,) + _input_slice(feature_index, fc.name))
+        self.unpooled_features = list(chain.from_iterable(groups.values()))
+        # (fused_name, columns, offsets, positions) of the `SparseFeat` looked up with one gather, see `fuse`
+        self.fused_features = []
+
+    def fuse(self, embedding_dict):
+        """Look up the ``SparseFeat`` whose tables are packed in the same ``FusedEmbedding`` with a single gather.
+
+        :param embedding_dict: nn.ModuleDict transformed by ``fuse_embedding_matrix``, the plan must then be called
+            with this dict.
+        """
+        groups = OrderedDict()
+        for position, (embedding_name, group, columns) in enumerate(self.sparse_features):
+            embedding = embedding_dict[embedding_name] if embedding_name in embedding_dict else None
+            if isinstance(embedding, EmbeddingView):
+                groups.setdefault(embedding.fused_name, []).append((position, columns.start, embedding.offset))
+        self.fused_features = []
+        for fused_name, features in groups.items():
+            positions, columns, offsets = zip(*features)
+            device = embedding_dict[fused_name].weight.device
+            self.fused_features.append((fused_name, torch.tensor(columns, dtype=torch.long, device=device),
+                                        torch.tensor(offsets, dtype=torch.long, device=device), positions))
+
+    def _apply(self, fn):
+        # the index tensors of the fused lookups are not buffers, so that they stay out of the state_dict
+        super(FeaturePlan, self)._apply(fn)
+        self.fused_features = [(fused_name, fn(columns), fn(offsets), positions)
+                               for fused_name, columns, offsets, positions in self.fused_features]
+        return self
+
+    def sparse_embeddings(self, X, embedding_dict):
+        """Return the list of ``(batch_size, 1, embedding_dim)`` embeddings of the ``SparseFeat``."""
+        return self._sparse_embeddings(X, embedding_dict, self._fused_embeddings(X, embedding_dict))
+
+    def stacked_embeddings(self, X, embedding_dict):
+        """Return the ``(batch_size, num_features, embedding_dim)`` embeddings of the ``SparseFeat`` followed by the
+        pooled ``VarLenSparseFeat``, as ``torch.cat(sparse_embeddings + varlen_embeddings, dim=1)``, or None without
+        such features. All the features must have the same ``embedding_dim``.
+
+        When one ``FusedEmbedding`` holds all the ``SparseFeat``, its gather is used as is instead of being split into
+        features and concatenated again.
+        """
+        fused = self._fused_embeddings(X, embedding_dict)
+        if len(fused) == 1 and len(fused[0][0]) == len(self.sparse_features):
+            # the positions of a fused table are in increasing order
+            embedding_list = [fused[0][1]]
+        else:
+            embedding_list = self._sparse_embeddings(X, embedding_dict, fused)
+        embedding_list += self.varlen_embeddings(X, embedding_dict)
+        if len(embedding_list) == 0:
+            return None
+        return embedding_list[0] if len(embedding_list) == 1 else torch.cat(embedding_list, dim=1)
+
+    def _fused_embeddings(self, X, embedding_dict):
+        # (positions, (batch_size, num_features, embedding_dim) gather) of every fused table
+        return [(positions, embedding_dict[fused_name](X[SPARSE_INPUT].index_select(1, columns) + offsets))
+                for fused_name, columns, offsets, positions in self.fused_features]
+
+    def _sparse_embeddings(self, X, embedding_dict, fused):
+        if len(self.fused_features) == 0:
+            return [_lookup(X, embedding_dict[embedding_name], group, columns,
+                            lambda embedding: embedding(X[group][:, columns]))
+                    for embedding_name, group, columns in self.sparse_features]
+        embedding_list = [None] * len(self.sparse_features)
+        for positions, embeddings in fused:
+            # views of the features of one gather
+            for position, embedding in zip(positions, embeddings.split(1, dim=1)):
+                embedding_list[position] = embedding
+        for position, (embedding_name, group, columns) in enumerate(self.sparse_features):
+            if embedding_list[position] is None:
+                embedding_list[position] = embedding_dict[embedding_name](X[group][:, columns])
+        return embedding_list
+
+    def varlen_embeddings(self, X, embedding_dict):
+        """Return the list of pooled ``(batch_size, 1, embedding_dim)`` embeddings of the ``VarLenSparseFeat``."""
+        embedding_list = []
+        for (embedding_name, combiner, ragged, group, columns, length), pooling in zip(self.varlen_features,
+                                                                                         self.pooling):
+            def pool(embedding):
+                if ragged:
+                    values, offsets = X[group][columns]
+                    return _embedding_bag(embedding, values, offsets, combiner)
+                seq_input = X[group][:, columns]
+                if length is None:
+                    return pooling([embedding(seq_input), seq_input != 0])
+                return pooling([embedding(seq_input), X[length[0]][:, length[1]]])
+
+            embedding_list.append(_lookup(X, embedding_dict[embedding_name], group, columns, pool))
+        return embedding_list
+
+    def lookup(self, X, embedding_dict):
+        """Return the unpooled embeddings of the sparse and padded varlen sparse features, as
+        ``embedding_lookup(..., to_list=True)``."""
+        return [embedding_dict[embedding_name](X[group][:, columns])
+                for embedding_name, group, columns in self.unpooled_features]
+
+    def dense_values(self, X):
+        """Return the list of ``(batch_size, dimension)`` inputs of the ``DenseFeat``."""
+        return [X[group][:, columns] for group, columns in self.dense_features]
+
+
 def get_varlen_pooling_list(embedding_dict, features, feature_index, varlen_sparse_feature_columns, device):
+    # creates the pooling layers at every call, models use the ones of `FeaturePlan` instead
     varlen_sparse_embedding_list = []
     for feat in varlen_sparse_feature_columns:
         seq_emb = embedding_dict[feat.name]
-        if feat.length_name is None:
-            seq_mask = features[:, feature_index[feat.name][0]:feature_index[feat.name][1]].long() != 0
+        if feat.ragged:
+            # already pooled by `varlen_embedding_lookup`
+            emb = seq_emb
+        elif feat.length_name is None:
+            seq_mask = get_feature_input(features, feature_index, feat.name) != 0
 
             emb = SequencePoolingLayer(mode=feat.combiner, supports_masking=True, device=device)(
                 [seq_emb, seq_mask])
         else:
-            seq_length = features[:, feature_index[feat.length_name][0]:feature_index[feat.length_name][1]].long()
+            seq_length = get_feature_input(features, feature_index, feat.length_name)
             emb = SequencePoolingLayer(mode=feat.combiner, supports_masking=False, device=device)(
                 [seq_emb, seq_length])
         varlen_sparse_embedding_list.append(emb)
@@ -156,8 +433,8 @@ def get_varlen_pooling_list(embedding_dict, features, feature_index, varlen_spar
 
 
 def create_embedding_matrix(feature_columns, init_std=0.0001, linear=False, sparse=False, device='cpu'):
-    # Return nn.ModuleDict: for sparse features, {embedding_name: nn.Embedding}
-    # for varlen sparse features, {embedding_name: nn.EmbeddingBag}
+    # Return nn.ModuleDict: for sparse and varlen sparse features, {embedding_name: nn.Embedding}
+    # ragged varlen sparse features are pooled with `F.embedding_bag` on the same weight
     sparse_feature_columns = list(
         filter(lambda x: isinstance(x, SparseFeat), feature_columns)) if len(feature_columns) else []
 
@@ -170,26 +447,235 @@ def create_embedding_matrix(feature_columns, init_std=0.0001, linear=False, spar
          sparse_feature_columns + varlen_sparse_feature_columns}
     )
 
-    # for feat in varlen_sparse_feature_columns:
-    #     embedding_dict[feat.embedding_name] = nn.EmbeddingBag(
-    #         feat.dimension, embedding_size, sparse=sparse, mode=feat.combiner)
-
     for tensor in embedding_dict.values():
         nn.init.normal_(tensor.weight, mean=0, std=init_std)
 
     return embedding_dict.to(device)
 
 
+FUSED_EMBEDDING_NAME = "__fused_{0}"
+
+
+class FusedEmbedding(nn.Embedding):
+    """Embedding tables of the same dimension packed one after another into a single table.
+
+    :param tables: OrderedDict ``{embedding_name: nn.Embedding}`` of tables with the same ``embedding_dim``, their
+        weights are copied into the fused table.
+    """
+
+    def __init__(self, tables):
+        weights = [table.weight.detach() for table in tables.values()]
+        super(FusedEmbedding, self).__init__(sum(weight.shape[0] for weight in weights), weights[0].shape[1],
+                                             sparse=any(table.sparse for table in tables.values()),
+                                             _weight=torch.cat(weights))
+        # {embedding_name: first row}, {embedding_name: number of rows}
+        self.offsets = OrderedDict()
+        self.sizes = OrderedDict()
+        offset = 0
+        for name, weight in zip(tables, weights):
+            self.offsets[name] = offset
+            self.sizes[name] = weight.shape[0]
+            offset += weight.shape[0]
+
+    def view(self, embedding_name, fused_name):
+        return EmbeddingView(self, embedding_name, fused_name)
+
+
+class EmbeddingView(nn.Module):
+    """The rows of one table of a ``FusedEmbedding``, called with the ids of the table it replaces.
+
+    :param fused: FusedEmbedding, not registered as a submodule, it is owned by the embedding dict.
+    :param embedding_name: str, name of the table in ``fused``.
+    :param fused_name: str, key of ``fused`` in the embedding dict.
+    """
+
+    def __init__(self, fused, embedding_name, fused_name):
+        super(EmbeddingView, self).__init__()
+        self.__dict__['fused'] = fused
+        self.fused_name = fused_name
+        self.offset = fused.offsets[embedding_name]
+        self.num_embeddings = fused.sizes[embedding_name]
+        self.embedding_dim = fused.embedding_dim
+
+    @property
+    def weight(self):
+        return self.fused.weight[self.offset:self.offset + self.num_embeddings]
+
+    @property
+    def sparse(self):
+        return self.fused.sparse
+
+    def forward(self, input):
+        return self.fused(input + self.offset)
+
+    def extra_repr(self):
+        return '{0}, rows {1}:{2}'.format(self.fused_name, self.offset, self.offset + self.num_embeddings)
+
+
+def fuse_embedding_matrix(embedding_dict):
+    """Pack the tables of ``embedding_dict`` with the same ``embedding_dim`` into one ``FusedEmbedding``, in place.
+
+    The fused table of dimension ``d`` is added under the key ``"__fused_d"``, every packed table is replaced by an
+    ``EmbeddingView`` of its rows, so that features sharing an ``embedding_name`` keep sharing them. Dimensions with
+    a single table are left as they are.
+
+    :param embedding_dict: nn.ModuleDict ``{embedding_name: nn.Embedding}``, see ``create_embedding_matrix``.
+    :return: dict ``{weight of a packed table: (weight of the fused table, offset of its rows)}``.
+    """
+    tables = OrderedDict()
+    for name, embedding in embedding_dict.items():
+        if type(embedding) is nn.Embedding and embedding.padding_idx is None and embedding.max_norm is None:
+            tables.setdefault(embedding.embedding_dim, OrderedDict())[name] = embedding
+    fused_weights = {}
+    for embedding_dim, group in tables.items():
+        if len(group) < 2:
+            continue
+        fused_name = FUSED_EMBEDDING_NAME.format(embedding_dim)
+        if fused_name in embedding_dict:
+            raise ValueError("The embedding dict already has a table named '{0}'".format(fused_name))
+        fused = FusedEmbedding(group)
+        embedding_dict[fused_name] = fused
+        for name, embedding in group.items():
+            embedding_dict[name] = fused.view(name, fused_name)
+            fused_weights[embedding.weight] = (fused.weight, fused.offsets[name])
+    return fused_weights
+
+
+SHARED_EMBEDDING_NAME = "__shared_{0}"
+
+
+class BatchLookups(object):
+    """Embeddings computed once per batch and read by several lookups, see ``share_linear_embedding``."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self, *args):
+        # also a forward hook of the model, so that the embeddings of a batch do not outlive its forward pass
+        self.batch = None
+        self.embeddings = {}
+
+    def get(self, X, key, compute):
+        if self.batch is not X:
+            self.batch = X
+            self.embeddings = {}
+        if key not in self.embeddings:
+            self.embeddings[key] = compute()
+        return self.embeddings[key]
+
+
+class EmbeddingColumns(nn.Module):
+    """The columns ``start:end`` of a shared table, called with the ids of the table it replaces.
+
+    :param table: nn.Embedding, not registered as a submodule, it is owned by the embedding dict.
+    :param start: int, first column.
+    :param end: int, end of the columns.
+    :param lookups: BatchLookups, rows of ``table`` looked up in the current batch, shared by the views of ``table``.
+    """
+
+    def __init__(self, table, start, end, lookups):
+        super(EmbeddingColumns, self).__init__()
+        self.__dict__['table'] = table
+        self.lookups = lookups
+        self.start = start
+        self.end = end
+        self.num_embeddings = table.num_embeddings
+        self.embedding_dim = end - start
+
+    @property
+    def weight(self):
+        return self.table.weight[:, self.start:self.end]
+
+    @property
+    def sparse(self):
+        return self.table.sparse
+
+    def forward(self, input):
+        return self.table(input)[..., self.start:self.end]
+
+    def extra_repr(self):
+        return 'columns {0}:{1}'.format(self.start, self.end)
+
+
+def share_linear_embedding(embedding_dict, linear_embedding_dict, embedding_names, lookups):
+    """Store the first-order weights of ``linear_embedding_dict`` as the last column of the tables of
+    ``embedding_dict``, in place.
+
+    The table ``name`` of dimension ``d`` is replaced by a table of dimension ``d + 1`` added under the key
+    ``"__shared_name"``, and both dicts get an ``EmbeddingColumns`` of their columns. ``FeaturePlan`` then looks up
+    and pools each shared row once per batch, for the first-order and the DNN embeddings.
+
+    :param embedding_dict: nn.ModuleDict ``{embedding_name: nn.Embedding}``, see ``create_embedding_matrix``.
+    :param linear_embedding_dict: nn.ModuleDict ``{embedding_name: nn.Embedding}`` of dimension 1.
+    :param embedding_names: list of the names of the tables to share, with the same vocabulary in both dicts.
+    :param lookups: BatchLookups, to be cleared before and after each forward pass.
+    :return: dict ``{weight of a replaced table: (weight of the shared table, slice of its columns)}``.
+    """
+    shared_weights = {}
+    for name in embedding_names:
+        embedding, linear = embedding_dict[name], linear_embedding_dict[name]
+        if embedding.num_embeddings != linear.num_embeddings or linear.embedding_dim != 1:
+            raise ValueError("The tables of '{0}' can not be shared".format(name))
+        dim = embedding.embedding_dim
+        table = nn.Embedding(embedding.num_embeddings, dim + 1, sparse=embedding.sparse,
+                             _weight=torch.cat([embedding.weight.detach(), linear.weight.detach()], dim=1))
+        embedding_dict[SHARED_EMBEDDING_NAME.format(name)] = table
+        embedding_dict[name] = EmbeddingColumns(table, 0, dim, lookups)
+        linear_embedding_dict[name] = EmbeddingColumns(table, dim, dim + 1, lookups)
+        shared_weights[embedding.weight] = (table.weight, slice(0, dim))
+        shared_weights[linear.weight] = (table.weight, slice(dim, dim + 1))
+    return shared_weights
+
+
+def _fused_tables(model):
+    # (state_dict key of the fused weight, key prefix of the packed tables, FusedEmbedding) of the model
+    for module_name, module in model.named_modules():
+        if isinstance(module, FusedEmbedding):
+            prefix = module_name.rsplit('.', 1)[0] + '.' if '.' in module_name else ''
+            yield module_name + '.weight', prefix, module
+
+
+def fuse_state_dict(state_dict, model):
+    """Convert a state_dict with one weight per embedding table into the layout of ``model``, whose tables are
+    fused by ``fuse_embedding_matrix``.
+
+    :param state_dict: dict, e.g. saved before ``BaseModel.fuse_embeddings``.
+    :param model: nn.Module with ``FusedEmbedding`` tables.
+    :return: a new OrderedDict, to be passed to ``model.load_state_dict``.
+    """
+    state_dict = OrderedDict(state_dict)
+    for key, prefix, fused in _fused_tables(model):
+        state_dict[key] = torch.cat([state_dict.pop(prefix + name + '.weight') for name in fused.offsets])
+    return state_dict
+
+
+def unfuse_state_dict(state_dict, model):
+    """Convert a state_dict of ``model``, whose tables are fused by ``fuse_embedding_matrix``, into the layout with
+    one weight per embedding table, e.g. to load it into a model built without ``BaseModel.fuse_embeddings``.
+
+    :param state_dict: dict, e.g. ``model.state_dict()``.
+    :param model: nn.Module with ``FusedEmbedding`` tables.
+    :return: a new OrderedDict.
+    """
+    state_dict = OrderedDict(state_dict)
+    for key, prefix, fused in _fused_tables(model):
+        weight = state_dict.pop(key)
+        for name, offset in fused.offsets.items():
+            state_dict[prefix + name + '.weight'] = weight[offset:offset + fused.sizes[name]].clone()
+    return state_dict
+
+
 def embedding_lookup(X, sparse_embedding_dict, sparse_input_dict, sparse_feature_columns, return_feat_list=(),
                      mask_feat_list=(), to_list=False):
     """
         Args:
-            X: input Tensor [batch_size x hidden_dim]
+            X: input FeatureBatch
             sparse_embedding_dict: nn.ModuleDict, {embedding_name: nn.Embedding}
-            sparse_input_dict: OrderedDict, {feature_name:(start, start+dimension)}
+            sparse_input_dict: OrderedDict, {feature_name:(input_group, start, start+dimension)}
             sparse_feature_columns: list, sparse features
             return_feat_list: list, names of feature to be returned, defualt () -> return all features
-            mask_feat_list, list, names of feature to be masked in hash transform
+            mask_feat_list, list, unused, ids of `use_hash` features are hashed in the input pipeline,
+                see `get_hash_features`
         Return:
             group_embedding_dict: defaultdict(list)
     """
@@ -198,11 +684,7 @@ def embedding_lookup(X, sparse_embedding_dict, sparse_input_dict, sparse_feature
         feature_name = fc.name
         embedding_name = fc.embedding_name
         if (len(return_feat_list) == 0 or feature_name in return_feat_list):
-            # TODO: add hash function
-            # if fc.use_hash:
-            #     raise NotImplementedError("hash function is not implemented in this version!")
-            lookup_idx = np.array(sparse_input_dict[feature_name])
-            input_tensor = X[:, lookup_idx[0]:lookup_idx[1]].long()
+            input_tensor = get_feature_input(X, sparse_input_dict, feature_name)
             emb = sparse_embedding_dict[embedding_name](input_tensor)
             group_embedding_dict[fc.group_name].append(emb)
     if to_list:
@@ -215,14 +697,14 @@ def varlen_embedding_lookup(X, embedding_dict, sequence_input_dict, varlen_spars
     for fc in varlen_sparse_feature_columns:
         feature_name = fc.name
         embedding_name = fc.embedding_name
-        if fc.use_hash:
-            # lookup_idx = Hash(fc.vocabulary_size, mask_zero=True)(sequence_input_dict[feature_name])
-            # TODO: add hash function
-            lookup_idx = sequence_input_dict[feature_name]
-        else:
-            lookup_idx = sequence_input_dict[feature_name]
+        if fc.ragged:
+            # pool the bags directly, the weights stay shared with the other features of `embedding_name`
+            values, offsets = get_feature_input(X, sequence_input_dict, feature_name)
+            varlen_embedding_vec_dict[feature_name] = _embedding_bag(embedding_dict[embedding_name], values, offsets,
+                                                                     fc.combiner)
+            continue
         varlen_embedding_vec_dict[feature_name] = embedding_dict[embedding_name](
-            X[:, lookup_idx[0]:lookup_idx[1]].long())  # (lookup_idx)
+            get_feature_input(X, sequence_input_dict, feature_name))
 
     return varlen_embedding_vec_dict
 
@@ -232,14 +714,11 @@ def get_dense_input(X, features, feature_columns):
         x, DenseFeat), feature_columns)) if feature_columns else []
     dense_input_list = []
     for fc in dense_feature_columns:
-        lookup_idx = np.array(features[fc.name])
-        input_tensor = X[:, lookup_idx[0]:lookup_idx[1]].float()
-        dense_input_list.append(input_tensor)
+        dense_input_list.append(get_feature_input(X, features, fc.name))
     return dense_input_list
 
 
 def maxlen_lookup(X, sparse_input_dict, maxlen_column):
     if maxlen_column is None or len(maxlen_column)==0:
         raise ValueError('please add max length column for VarLenSparseFeat of DIN/DIEN input')
-    lookup_idx = np.array(sparse_input_dict[maxlen_column[0]])
-    return X[:, lookup_idx[0]:lookup_idx[1]].long()
+    return get_feature_input(X, sparse_input_dict, maxlen_column[0])
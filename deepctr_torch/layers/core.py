@@ -154,7 +154,7 @@ class PredictionLayer(nn.Module):
     def forward(self, X):
         output = X
         if self.use_bias:
-            output += self.bias
+            output = output + self.bias
         if self.task == "binary":
             output = torch.sigmoid(output)
         return output
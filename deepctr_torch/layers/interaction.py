@@ -1,13 +1,44 @@
-import itertools
+import functools
+import inspect
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 
 from ..layers.activation import activation_layer
 from ..layers.core import Conv2dSame
 from ..layers.sequence import KMaxPooling
 
+# the non-reentrant checkpoint also gives gradients to the parameters when no input requires grad
+_CHECKPOINT_KWARGS = {'use_reentrant': False} if 'use_reentrant' in inspect.signature(checkpoint).parameters else {}
+
+
+class PairIndex(object):
+    """Indices ``(row, col)`` of the pairs ``i < j`` of ``num_fields`` fields, ordered as the nested loops over
+    ``i`` and ``j``, built once per number of fields and device. They are not buffers, so that the state_dict of
+    the layers using them is unchanged."""
+
+    def __init__(self):
+        self.index = {}
+
+    def __call__(self, num_fields, device):
+        key = (num_fields, str(device))
+        if key not in self.index:
+            self.index[key] = torch.triu_indices(num_fields, num_fields, offset=1, device=device)
+        return self.index[key]
+
+    def pairs(self, inputs):
+        """Return the ``(batch_size, num_pairs, embedding_size)`` tensors ``p`` and ``q`` of the first and the second
+        field of every pair.
+
+        :param inputs: list of ``(batch_size, 1, embedding_size)`` tensors, or a ``(batch_size, num_fields,
+            embedding_size)`` tensor.
+        """
+        embeddings = inputs if isinstance(inputs, torch.Tensor) else torch.cat(inputs, dim=1)
+        row, col = self(embeddings.shape[1], embeddings.device)
+        return embeddings.index_select(1, row), embeddings.index_select(1, col)
+
 
 class FM(nn.Module):
     """Factorization Machine models pairwise (order-2) feature interactions
@@ -121,18 +152,16 @@ Tongwen](https://arxiv.org/pdf/1905.09433.pdf)
         super(BilinearInteraction, self).__init__()
         self.bilinear_type = bilinear_type
         self.seed = seed
-        self.bilinear = nn.ModuleList()
+        self.pair_index = PairIndex()
         if self.bilinear_type == "all":
             self.bilinear = nn.Linear(
                 embedding_size, embedding_size, bias=False)
-        elif self.bilinear_type == "each":
-            for _ in range(filed_size):
-                self.bilinear.append(
-                    nn.Linear(embedding_size, embedding_size, bias=False))
-        elif self.bilinear_type == "interaction":
-            for _, _ in itertools.combinations(range(filed_size), 2):
-                self.bilinear.append(
-                    nn.Linear(embedding_size, embedding_size, bias=False))
+        elif self.bilinear_type in ("each", "interaction"):
+            num_weights = filed_size if self.bilinear_type == "each" else filed_size * (filed_size - 1) // 2
+            # one (embedding_size, embedding_size) matrix per field or per pair, stacked in the layout of the weight
+            # of nn.Linear and initialized as one
+            self.weight = nn.Parameter(torch.stack(
+                [nn.Linear(embedding_size, embedding_size, bias=False).weight.data for _ in range(num_weights)]))
         else:
             raise NotImplementedError
         self.to(device)
@@ -141,19 +170,27 @@ Tongwen](https://arxiv.org/pdf/1905.09433.pdf)
         if len(inputs.shape) != 3:
             raise ValueError(
                 "Unexpected inputs dimensions %d, expect to be 3 dimensions" % (len(inputs.shape)))
-        inputs = torch.split(inputs, 1, dim=1)
+        row, col = self.pair_index(inputs.shape[1], inputs.device)
         if self.bilinear_type == "all":
-            p = [torch.mul(self.bilinear(v_i), v_j)
-                 for v_i, v_j in itertools.combinations(inputs, 2)]
+            # every field is transformed once, then gathered for the pairs it starts
+            p = self.bilinear(inputs).index_select(1, row)
         elif self.bilinear_type == "each":
-            p = [torch.mul(self.bilinear[i](inputs[i]), inputs[j])
-                 for i, j in itertools.combinations(range(len(inputs)), 2)]
+            p = torch.bmm(inputs.transpose(0, 1), self.weight.transpose(1, 2)).transpose(0, 1).index_select(1, row)
         elif self.bilinear_type == "interaction":
-            p = [torch.mul(bilinear(v[0]), v[1])
-                 for v, bilinear in zip(itertools.combinations(inputs, 2), self.bilinear)]
+            p = torch.bmm(inputs.index_select(1, row).transpose(0, 1), self.weight.transpose(1, 2)).transpose(0, 1)
         else:
             raise NotImplementedError
-        return torch.cat(p, dim=1)
+        return p * inputs.index_select(1, col)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved before the weights were stacked hold one nn.Linear per field or pair
+        old_prefix = prefix + 'bilinear.'
+        index = {int(key[len(old_prefix):-len('.weight')]): key for key in state_dict
+                 if key.startswith(old_prefix) and key.endswith('.weight') and
+                 key[len(old_prefix):-len('.weight')].isdigit()}
+        if self.bilinear_type != "all" and prefix + 'weight' not in state_dict and len(index) > 0:
+            state_dict[prefix + 'weight'] = torch.stack([state_dict.pop(index[i]) for i in sorted(index)])
+        super(BilinearInteraction, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
 
 class CIN(nn.Module):
@@ -168,16 +205,23 @@ class CIN(nn.Module):
         - **activation** : activation function name used on feature maps.
         - **split_half** : bool.if set to False, half of the feature maps in each hidden will connect to output unit.
         - **seed** : A Python integer to use as random seed.
+        - **chunk_size** : Positive integer or None. If set, the outer product of each layer with the input fields is
+          built and convolved for at most ``chunk_size`` of its fields at a time, which bounds the intermediate to
+          ``(batch_size, chunk_size * field_size, embedding_size)``. None builds it for all the fields at once.
+        - **use_checkpoint** : bool. Recompute the outer products in the backward pass instead of keeping them for
+          it, one chunk at a time.
       References
         - [Lian J, Zhou X, Zhang F, et al. xDeepFM: Combining Explicit and Implicit Feature Interactions for Recommender Systems[J]. arXiv preprint arXiv:1803.05170, 2018.] (https://arxiv.org/pdf/1803.05170.pdf)
     """
 
     def __init__(self, field_size, layer_size=(128, 128), activation='relu', split_half=True, l2_reg=1e-5, seed=1024,
-                 device='cpu'):
+                 device='cpu', chunk_size=None, use_checkpoint=False):
         super(CIN, self).__init__()
         if len(layer_size) == 0:
             raise ValueError(
                 "layer_size must be a list(tuple) of length greater than 1")
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("chunk_size must be a positive integer or None")
 
         self.layer_size = layer_size
         self.field_nums = [field_size]
@@ -185,6 +229,8 @@ class CIN(nn.Module):
         self.activation = activation_layer(activation)
         self.l2_reg = l2_reg
         self.seed = seed
+        self.chunk_size = chunk_size
+        self.use_checkpoint = use_checkpoint
 
         self.conv1ds = nn.ModuleList()
         for i, size in enumerate(self.layer_size):
@@ -208,20 +254,12 @@ class CIN(nn.Module):
         if len(inputs.shape) != 3:
             raise ValueError(
                 "Unexpected inputs dimensions %d, expect to be 3 dimensions" % (len(inputs.shape)))
-        batch_size = inputs.shape[0]
-        dim = inputs.shape[-1]
         hidden_nn_layers = [inputs]
         final_result = []
 
         for i, size in enumerate(self.layer_size):
-            # x^(k-1) * x^0
-            x = torch.einsum(
-                'bhd,bmd->bhmd', hidden_nn_layers[-1], hidden_nn_layers[0])
-            # x.shape = (batch_size , hi * m, dim)
-            x = x.reshape(
-                batch_size, hidden_nn_layers[-1].shape[1] * hidden_nn_layers[0].shape[1], dim)
             # x.shape = (batch_size , hi, dim)
-            x = self.conv1ds[i](x)
+            x = self._interaction(self.conv1ds[i], hidden_nn_layers[-1], hidden_nn_layers[0])
 
             if self.activation is None or self.activation == 'linear':
                 curr_out = x
@@ -247,12 +285,41 @@ class CIN(nn.Module):
 
         return result
 
+    def _interaction(self, conv1d, hidden, inputs):
+        # the convolution is linear in x^(k-1) * x^0, so it is summed over chunks of the fields of x^(k-1)
+        num_fields = hidden.shape[1]
+        chunk_size = self.chunk_size or num_fields
+        x = None
+        for start in range(0, num_fields, chunk_size):
+            end = min(start + chunk_size, num_fields)
+            # bound with partial, the checkpoint calls it again in the backward pass
+            function = functools.partial(_outer_conv1d, conv1d=conv1d, start=start, end=end)
+            if self.use_checkpoint and torch.is_grad_enabled():
+                part = checkpoint(function, hidden[:, start:end], inputs, **_CHECKPOINT_KWARGS)
+            else:
+                part = function(hidden[:, start:end], inputs)
+            x = part if x is None else x + part
+        return x
+
+
+def _outer_conv1d(hidden, inputs, conv1d, start, end):
+    # x^(k-1) * x^0 for the fields start:end of x^(k-1), convolved with the matching slice of the 1x1 kernel
+    batch_size, num_fields, dim = hidden.shape
+    x = torch.einsum('bhd,bmd->bhmd', hidden, inputs)
+    # x.shape = (batch_size , hi * m, dim)
+    x = x.reshape(batch_size, num_fields * inputs.shape[1], dim)
+    if start == 0 and num_fields == conv1d.in_channels // inputs.shape[1]:
+        return conv1d(x)
+    weight = conv1d.weight[:, start * inputs.shape[1]:end * inputs.shape[1]]
+    return F.conv1d(x, weight, conv1d.bias if start == 0 else None)
+
 
 class AFMLayer(nn.Module):
     """Attentonal Factorization Machine models pairwise (order-2) feature
     interactions without linear term and bias.
       Input shape
-        - A list of 3D tensor with shape: ``(batch_size,1,embedding_size)``.
+        - A list of 3D tensor with shape: ``(batch_size,1,embedding_size)``, or a 3D tensor with shape:
+        ``(batch_size,field_size,embedding_size)``.
       Output shape
         - 2D tensor with shape: ``(batch_size, 1)``.
       Arguments
@@ -293,20 +360,12 @@ class AFMLayer(nn.Module):
             nn.init.zeros_(tensor, )
 
         self.dropout = nn.Dropout(dropout_rate)
+        self.pair_index = PairIndex()
 
         self.to(device)
 
     def forward(self, inputs):
-        embeds_vec_list = inputs
-        row = []
-        col = []
-
-        for r, c in itertools.combinations(embeds_vec_list, 2):
-            row.append(r)
-            col.append(c)
-
-        p = torch.cat(row, dim=1)
-        q = torch.cat(col, dim=1)
+        p, q = self.pair_index.pairs(inputs)
         inner_product = p * q
 
         bi_interaction = inner_product
@@ -336,11 +395,16 @@ class InteractingLayer(nn.Module):
             - **head_num**: int.The head number in multi-head self-attention network.
             - **use_res**: bool.Whether or not use standard residual connections before output.
             - **seed**: A Python integer to use as random seed.
+            - **store_attention**: bool. Whether to compute the attention with an explicit softmax and keep its
+              ``(head_num, batch_size, field_size, field_size)`` scores in ``normalized_att_scores``, instead of the
+              fused ``scaled_dot_product_attention`` that does not return them. It can also be set on the layers of a
+              built model, e.g. ``model.int_layers[0].store_attention = True`` for AutoInt.
       References
             - [Song W, Shi C, Xiao Z, et al. AutoInt: Automatic Feature Interaction Learning via Self-Attentive Neural Networks[J]. arXiv preprint arXiv:1810.11921, 2018.](https://arxiv.org/abs/1810.11921)
     """
 
-    def __init__(self, embedding_size, head_num=2, use_res=True, scaling=False, seed=1024, device='cpu'):
+    def __init__(self, embedding_size, head_num=2, use_res=True, scaling=False, seed=1024, device='cpu',
+                 store_attention=False):
         super(InteractingLayer, self).__init__()
         if head_num <= 0:
             raise ValueError('head_num must be a int > 0')
@@ -351,15 +415,17 @@ class InteractingLayer(nn.Module):
         self.use_res = use_res
         self.scaling = scaling
         self.seed = seed
+        self.store_attention = store_attention
+        self.normalized_att_scores = None
 
-        self.W_Query = nn.Parameter(torch.Tensor(embedding_size, embedding_size))
-        self.W_key = nn.Parameter(torch.Tensor(embedding_size, embedding_size))
-        self.W_Value = nn.Parameter(torch.Tensor(embedding_size, embedding_size))
+        # the query, key and value projections side by side, so that they are computed by one matmul
+        self.W_QKV = nn.Parameter(torch.cat(
+            [nn.init.normal_(torch.Tensor(embedding_size, embedding_size), mean=0.0, std=0.05) for _ in range(3)],
+            dim=1))
 
         if self.use_res:
             self.W_Res = nn.Parameter(torch.Tensor(embedding_size, embedding_size))
-        for tensor in self.parameters():
-            nn.init.normal_(tensor, mean=0.0, std=0.05)
+            nn.init.normal_(self.W_Res, mean=0.0, std=0.05)
 
         self.to(device)
 
@@ -368,31 +434,42 @@ class InteractingLayer(nn.Module):
         if len(inputs.shape) != 3:
             raise ValueError(
                 "Unexpected inputs dimensions %d, expect to be 3 dimensions" % (len(inputs.shape)))
+        batch_size, field_size, embedding_size = inputs.shape
 
-        # None F D
-        querys = torch.tensordot(inputs, self.W_Query, dims=([-1], [0]))
-        keys = torch.tensordot(inputs, self.W_key, dims=([-1], [0]))
-        values = torch.tensordot(inputs, self.W_Value, dims=([-1], [0]))
-
-        # head_num None F D/head_num
-        querys = torch.stack(torch.split(querys, self.att_embedding_size, dim=2))
-        keys = torch.stack(torch.split(keys, self.att_embedding_size, dim=2))
-        values = torch.stack(torch.split(values, self.att_embedding_size, dim=2))
+        # 3 None head_num F D/head_num
+        querys, keys, values = torch.matmul(inputs, self.W_QKV).reshape(
+            batch_size, field_size, 3, self.head_num, self.att_embedding_size).permute(2, 0, 3, 1, 4)
 
-        inner_product = torch.einsum('bnik,bnjk->bnij', querys, keys)  # head_num None F F
-        if self.scaling:
-            inner_product /= self.att_embedding_size ** 0.5
-        self.normalized_att_scores = F.softmax(inner_product, dim=-1)  # head_num None F F
-        result = torch.matmul(self.normalized_att_scores, values)  # head_num None F D/head_num
-
-        result = torch.cat(torch.split(result, 1, ), dim=-1)
-        result = torch.squeeze(result, dim=0)  # None F D
+        if hasattr(F, 'scaled_dot_product_attention') and not self.store_attention:
+            if not self.scaling:
+                # scaled_dot_product_attention divides by sqrt(D/head_num)
+                querys = querys * self.att_embedding_size ** 0.5
+            result = F.scaled_dot_product_attention(querys, keys, values)  # None head_num F D/head_num
+        else:
+            inner_product = torch.matmul(querys, keys.transpose(-1, -2))  # None head_num F F
+            if self.scaling:
+                inner_product = inner_product / self.att_embedding_size ** 0.5
+            normalized_att_scores = F.softmax(inner_product, dim=-1)  # None head_num F F
+            if self.store_attention:
+                self.normalized_att_scores = normalized_att_scores.transpose(0, 1)  # head_num None F F
+            result = torch.matmul(normalized_att_scores, values)  # None head_num F D/head_num
+
+        result = result.transpose(1, 2).reshape(batch_size, field_size, embedding_size)  # None F D
         if self.use_res:
-            result += torch.tensordot(inputs, self.W_Res, dims=([-1], [0]))
-        result = F.relu(result)
+            # the sum is a new tensor, while the merged heads may be a view of the attention output kept for backward
+            result = F.relu(result + torch.matmul(inputs, self.W_Res), inplace=True)
+        else:
+            result = F.relu(result)
 
         return result
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints saved before the projections were fused hold them as W_Query, W_key and W_Value
+        keys = [prefix + 'W_Query', prefix + 'W_key', prefix + 'W_Value']
+        if prefix + 'W_QKV' not in state_dict and all(key in state_dict for key in keys):
+            state_dict[prefix + 'W_QKV'] = torch.cat([state_dict.pop(key) for key in keys], dim=1)
+        super(InteractingLayer, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
 
 class CrossNet(nn.Module):
     """The Cross Network part of Deep&Cross Network model,
@@ -538,7 +615,8 @@ class InnerProductLayer(nn.Module):
     """InnerProduct Layer used in PNN that compute the element-wise
     product or inner product between feature vectors.
       Input shape
-        - a list of 3D tensor with shape: ``(batch_size,1,embedding_size)``.
+        - a list of 3D tensor with shape: ``(batch_size,1,embedding_size)``, or a 3D tensor with shape:
+        ``(batch_size,N,embedding_size)``.
       Output shape
         - 3D tensor with shape: ``(batch_size, N*(N-1)/2 ,1)`` if use reduce_sum. or 3D tensor with shape:
         ``(batch_size, N*(N-1)/2, embedding_size )`` if not use reduce_sum.
@@ -552,23 +630,12 @@ class InnerProductLayer(nn.Module):
     def __init__(self, reduce_sum=True, device='cpu'):
         super(InnerProductLayer, self).__init__()
         self.reduce_sum = reduce_sum
+        self.pair_index = PairIndex()
         self.to(device)
 
     def forward(self, inputs):
 
-        embed_list = inputs
-        row = []
-        col = []
-        num_inputs = len(embed_list)
-
-        for i in range(num_inputs - 1):
-            for j in range(i + 1, num_inputs):
-                row.append(i)
-                col.append(j)
-        p = torch.cat([embed_list[idx]
-                       for idx in row], dim=1)  # batch num_pairs k
-        q = torch.cat([embed_list[idx]
-                       for idx in col], dim=1)
+        p, q = self.pair_index.pairs(inputs)  # batch num_pairs k
 
         inner_product = p * q
         if self.reduce_sum:
@@ -581,7 +648,8 @@ class OutterProductLayer(nn.Module):
     """OutterProduct Layer used in PNN.This implemention is
     adapted from code that the author of the paper published on https://github.com/Atomu2014/product-nets.
       Input shape
-            - A list of N 3D tensor with shape: ``(batch_size,1,embedding_size)``.
+            - A list of N 3D tensor with shape: ``(batch_size,1,embedding_size)``, or a 3D tensor with shape:
+            ``(batch_size,N,embedding_size)``.
       Output shape
             - 2D tensor with shape:``(batch_size,N*(N-1)/2 )``.
       Arguments
@@ -610,54 +678,21 @@ class OutterProductLayer(nn.Module):
         elif self.kernel_type == 'num':
             self.kernel = nn.Parameter(torch.Tensor(num_pairs, 1))
         nn.init.xavier_uniform_(self.kernel)
+        self.pair_index = PairIndex()
 
         self.to(device)
 
     def forward(self, inputs):
-        embed_list = inputs
-        row = []
-        col = []
-        num_inputs = len(embed_list)
-        for i in range(num_inputs - 1):
-            for j in range(i + 1, num_inputs):
-                row.append(i)
-                col.append(j)
-        p = torch.cat([embed_list[idx]
-                       for idx in row], dim=1)  # batch num_pairs k
-        q = torch.cat([embed_list[idx] for idx in col], dim=1)
+        p, q = self.pair_index.pairs(inputs)  # batch num_pairs k
 
         # -------------------------
         if self.kernel_type == 'mat':
-            p.unsqueeze_(dim=1)
-            # k     k* pair* k
+            # kp[b, n] = sum_ij q[b, n, i] * kernel[i, n, j] * p[b, n, j], computed as one (batch * k) x (k * k)
+            # product per pair, without the batch * k * pair * k intermediate of the elementwise form
+            # pair * batch * k
+            pk = torch.bmm(p.transpose(0, 1), self.kernel.permute(1, 2, 0))
             # batch * pair
-            kp = torch.sum(
-
-                # batch * pair * k
-
-                torch.mul(
-
-                    # batch * pair * k
-
-                    torch.transpose(
-
-                        # batch * k * pair
-
-                        torch.sum(
-
-                            # batch * k * pair * k
-
-                            torch.mul(
-
-                                p, self.kernel),
-
-                            dim=-1),
-
-                        2, 1),
-
-                    q),
-
-                dim=-1)
+            kp = torch.sum(pk.transpose(0, 1) * q, dim=-1)
         else:
             # 1 * pair * (k or 1)
 
@@ -58,9 +58,7 @@ class SequencePoolingLayer(nn.Module):
                                        dtype=torch.float32)  # [B, 1, maxlen]
             mask = torch.transpose(mask, 1, 2)  # [B, maxlen, 1]
 
-        embedding_size = uiseq_embed_list.shape[-1]
-
-        mask = torch.repeat_interleave(mask, embedding_size, dim=2)  # [B, maxlen, E]
+        # mask [B, maxlen, 1] is broadcast over the embedding dimension
 
         if self.mode == 'max':
             hist = uiseq_embed_list - (1 - mask) * 1e9
@@ -259,7 +257,7 @@ class AUGRUCell(nn.Module):
             self.register_parameter('bias_ih', self.bias_ih)
             # (b_hr|b_hz|b_hh)
             self.bias_hh = nn.Parameter(torch.Tensor(3 * hidden_size))
-            self.register_parameter('bias_ih', self.bias_hh)
+            self.register_parameter('bias_hh', self.bias_hh)
             for tensor in [self.bias_ih, self.bias_hh]:
                 nn.init.zeros_(tensor, )
         else:
@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+"""
+Author:
+    Weichen Shen,weichenswc@163.com
+"""
+from collections import OrderedDict
+from copy import copy
+
+import torch
+
+
+def _as_columns(y_true, y_pred):
+    # labels and predictions as float64 (batch_size, num_outputs) matrices, `y_pred` may have been squeezed
+    num_columns = y_true.shape[-1] if y_true.dim() > 1 else 1
+    y_true = y_true.detach().reshape(-1, num_columns).double()
+    y_pred = y_pred.detach().reshape(-1, num_columns).double()
+    return y_true, y_pred
+
+
+class Metric(object):
+    """Accumulator of a metric over batches.
+
+    ``update`` only runs tensor operations on the device of the predictions, without copying them to the host,
+    so it can be called at every training step. ``result`` synchronizes once and returns the metric of all the
+    samples seen since the last ``reset``. Multi-output labels are averaged over the outputs.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = None
+        self.count = 0
+
+    def copy(self):
+        """Return a new accumulator with the same configuration and no accumulated values."""
+        metric = copy(self)
+        metric.reset()
+        return metric
+
+    def update(self, y_true, y_pred):
+        """Accumulate a batch.
+
+        :param y_true: tensor of labels, with shape ``(batch_size,)`` or ``(batch_size, num_outputs)``.
+        :param y_pred: tensor of predictions, with the number of elements of ``y_true``.
+        """
+        y_true, y_pred = _as_columns(y_true, y_pred)
+        values = self.compute(y_true, y_pred).sum()
+        self.total = values if self.total is None else self.total + values
+        self.count += y_true.numel()
+
+    def compute(self, y_true, y_pred):
+        # per-element values, averaged by `result`
+        raise NotImplementedError
+
+    def result(self):
+        if self.total is None:
+            return float('nan')
+        return self.total.item() / self.count
+
+
+class LogLoss(Metric):
+    """Binary cross entropy, with the predictions clipped to ``[eps, 1 - eps]``.
+
+    The default ``eps=1e-15`` is the clipping of ``sklearn.metrics.log_loss`` before scikit-learn 1.3, which clips
+    at the machine epsilon of the predictions' dtype since. The two only differ when some predictions saturate to
+    exactly 0 or 1, whose loss then depends on the dtype with sklearn>=1.3.
+
+    :param eps: float, clipping of the predictions.
+    """
+
+    def __init__(self, eps=1e-15):
+        self.eps = eps
+        super(LogLoss, self).__init__()
+
+    def compute(self, y_true, y_pred):
+        y_pred = y_pred.clamp(self.eps, 1 - self.eps)
+        return -(y_true * torch.log(y_pred) + (1 - y_true) * torch.log(1 - y_pred))
+
+
+class MeanSquaredError(Metric):
+    """Mean squared error."""
+
+    def compute(self, y_true, y_pred):
+        return (y_true - y_pred) ** 2
+
+
+class Accuracy(Metric):
+    """Binary accuracy, predictions above ``threshold`` are positive.
+
+    :param threshold: float, decision threshold.
+    """
+
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        super(Accuracy, self).__init__()
+
+    def compute(self, y_true, y_pred):
+        return ((y_pred > self.threshold).double() == y_true).double()
+
+
+class AUC(Metric):
+    """Area under the ROC curve, estimated from histograms of the predictions of the positive and negative samples.
+
+    The predictions are bucketed into ``num_bins`` equal-width bins of ``[0, 1]``, pairs in the same bin count as
+    ties, so the result is within ``1 / num_bins`` of the exact AUC for typical score distributions. Unlike an
+    average of per-batch AUCs, it ranks all the samples of the epoch together.
+
+    :param num_bins: int, number of bins of the histograms.
+    """
+
+    def __init__(self, num_bins=10000):
+        self.num_bins = num_bins
+        super(AUC, self).__init__()
+
+    def reset(self):
+        self.positives = None
+        self.negatives = None
+
+    def update(self, y_true, y_pred):
+        y_true, y_pred = _as_columns(y_true, y_pred)
+        num_columns = y_true.shape[1]
+        if self.positives is None:
+            self.positives = torch.zeros(num_columns * self.num_bins, dtype=torch.float64, device=y_pred.device)
+            self.negatives = torch.zeros_like(self.positives)
+        bins = (y_pred * self.num_bins).long().clamp(0, self.num_bins - 1)
+        # one histogram per output, laid out one after another
+        bins = (bins + torch.arange(num_columns, device=bins.device) * self.num_bins).reshape(-1)
+        y_true = y_true.reshape(-1)
+        self.positives.index_add_(0, bins, y_true)
+        self.negatives.index_add_(0, bins, 1 - y_true)
+
+    def result(self):
+        if self.positives is None:
+            return float('nan')
+        positives = self.positives.reshape(-1, self.num_bins)
+        negatives = self.negatives.reshape(-1, self.num_bins)
+        # negatives ranked strictly below every bin, ties count for one half
+        negatives_below = torch.cumsum(negatives, dim=1) - negatives
+        area = (positives * (negatives_below + 0.5 * negatives)).sum(dim=1)
+        auc = area / (positives.sum(dim=1) * negatives.sum(dim=1))
+        return auc.mean().item()
+
+
+def get_metric(name, **kwargs):
+    """Return a new accumulator of a metric by name.
+
+    :param name: str, one of ``binary_crossentropy``/``logloss``, ``auc``, ``mse``, ``accuracy``/``acc``.
+    :param kwargs: passed to the accumulator, e.g. ``eps`` of ``LogLoss``.
+    :return: a ``Metric``, or None if ``name`` is unknown.
+    """
+    if name == "binary_crossentropy" or name == "logloss":
+        return LogLoss(**kwargs)
+    if name == "auc":
+        return AUC(**kwargs)
+    if name == "mse":
+        return MeanSquaredError(**kwargs)
+    if name == "accuracy" or name == "acc":
+        return Accuracy(**kwargs)
+    return None
+
+
+def evaluate_metrics(metrics, batches):
+    """Accumulate ``(y_true, y_pred)`` batches into new copies of ``metrics``.
+
+    :param metrics: dict ``{name: Metric}``, left unchanged.
+    :param batches: iterable of ``(y_true, y_pred)`` tensors.
+    :return: dict ``{name: value}``.
+    """
+    metrics = OrderedDict((name, metric.copy()) for name, metric in metrics.items())
+    for y_true, y_pred in batches:
+        for metric in metrics.values():
+            metric.update(y_true, y_pred)
+    return OrderedDict((name, metric.result()) for name, metric in metrics.items())
@@ -6,8 +6,6 @@ Reference:
     [1] Xiao J, Ye H, He X, et al. Attentional factorization machines: Learning the weight of feature interactions via attention networks[J]. arXiv preprint arXiv:1708.04617, 2017.
     (https://arxiv.org/abs/1708.04617)
 """
-import torch
-
 from .basemodel import BaseModel
 from ..layers import FM, AFMLayer
 
@@ -52,14 +50,11 @@ class AFM(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, _ = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                   self.embedding_dict, support_dense=False)
+        sparse_embedding, _ = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                      self.embedding_dict, support_dense=False)
         logit = self.linear_model(X)
-        if len(sparse_embedding_list) > 0:
-            if self.use_attention:
-                logit += self.fm(sparse_embedding_list)
-            else:
-                logit += self.fm(torch.cat(sparse_embedding_list, dim=1))
+        if sparse_embedding is not None:
+            logit += self.fm(sparse_embedding)
 
         y_pred = self.out(logit)
 
@@ -7,7 +7,6 @@ Reference:
     [1] Cheng, W., Shen, Y. and Huang, L. 2020. Adaptive Factorization Network: Learning Adaptive-Order Feature
          Interactions. Proceedings of the AAAI Conference on Artificial Intelligence. 34, 04 (Apr. 2020), 3609-3616.
 """
-import torch
 import torch.nn as nn
 
 from .basemodel import BaseModel
@@ -57,13 +56,12 @@ class AFN(BaseModel):
     
     def forward(self, X):
 
-        sparse_embedding_list, _ = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                   self.embedding_dict)
+        afn_input, _ = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                               self.embedding_dict)
         logit = self.linear_model(X)
-        if len(sparse_embedding_list) == 0:
+        if afn_input is None:
             raise ValueError('Sparse embeddings not provided. AFN only accepts sparse embeddings as input.')
             
-        afn_input = torch.cat(sparse_embedding_list, dim=1)
         ltl_result = self.ltl(afn_input)
         afn_logit = self.afn_dnn(ltl_result)
         afn_logit = self.afn_dnn_linear(afn_logit)
@@ -76,18 +76,18 @@ class AutoInt(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
+        sparse_embedding, dense_value_list = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                                     self.embedding_dict)
         logit = self.linear_model(X)
 
-        att_input = concat_fun(sparse_embedding_list, axis=1)
+        att_input = sparse_embedding
 
         for layer in self.int_layers:
             att_input = layer(att_input)
 
         att_output = torch.flatten(att_input, start_dim=1)
 
-        dnn_input = combined_dnn_input(sparse_embedding_list, dense_value_list)
+        dnn_input = combined_dnn_input(sparse_embedding, dense_value_list)
 
         if len(self.dnn_hidden_units) > 0 and self.att_layer_num > 0:  # Deep & Interacting Layer
             deep_out = self.dnn(dnn_input)
@@ -8,15 +8,19 @@ Author:
 """
 from __future__ import print_function
 
+import inspect
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
 
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import torch.utils.data as Data
 from sklearn.metrics import *
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, IterableDataset
 from tqdm import tqdm
 
 try:
@@ -24,11 +28,16 @@ try:
 except ImportError:
     from tensorflow.python.keras._impl.keras.callbacks import CallbackList
 
-from ..inputs import build_input_features, SparseFeat, DenseFeat, VarLenSparseFeat, get_varlen_pooling_list, \
-    create_embedding_matrix, varlen_embedding_lookup
+from ..inputs import build_typed_input_features, SparseFeat, DenseFeat, VarLenSparseFeat, create_embedding_matrix, \
+    get_feature_input, get_sparse_input_dtype, get_hash_features, FeaturePlan, EmbeddingView, EmbeddingColumns, \
+    FusedEmbedding, BatchLookups, FeatureBatch, fuse_embedding_matrix, share_linear_embedding, RAGGED_INPUT
 from ..layers import PredictionLayer
-from ..layers.utils import slice_arrays
 from ..callbacks import History
+from ..metrics import get_metric, evaluate_metrics, LogLoss, Accuracy
+from ..optimizers import MultiOptimizer, RowWiseAdagrad
+from ..data import is_batch_stream, is_reiterable, stream_length, build_feature_batch, convert_batch, \
+    split_tensor_batch, batch_to_device, slice_feature_batch, take_feature_batch, TensorBatchIterator, BatchLoader, \
+    BackgroundPrefetcher
 
 
 class Linear(nn.Module):
@@ -55,6 +64,8 @@ class Linear(nn.Module):
         for tensor in self.embedding_dict.values():
             nn.init.normal_(tensor.weight, mean=0, std=init_std)
 
+        self.feature_plan = FeaturePlan(feature_columns, feature_index, device=device)
+
         if len(self.dense_feature_columns) > 0:
             self.weight = nn.Parameter(torch.Tensor(sum(fc.dimension for fc in self.dense_feature_columns), 1).to(
                 device))
@@ -62,21 +73,11 @@ class Linear(nn.Module):
 
     def forward(self, X, sparse_feat_refine_weight=None):
 
-        sparse_embedding_list = [self.embedding_dict[feat.embedding_name](
-            X[:, self.feature_index[feat.name][0]:self.feature_index[feat.name][1]].long()) for
-            feat in self.sparse_feature_columns]
-
-        dense_value_list = [X[:, self.feature_index[feat.name][0]:self.feature_index[feat.name][1]] for feat in
-                            self.dense_feature_columns]
-
-        sequence_embed_dict = varlen_embedding_lookup(X, self.embedding_dict, self.feature_index,
-                                                      self.varlen_sparse_feature_columns)
-        varlen_embedding_list = get_varlen_pooling_list(sequence_embed_dict, X, self.feature_index,
-                                                        self.varlen_sparse_feature_columns, self.device)
-
-        sparse_embedding_list += varlen_embedding_list
+        sparse_embedding_list = self.feature_plan.sparse_embeddings(X, self.embedding_dict) + \
+                                self.feature_plan.varlen_embeddings(X, self.embedding_dict)
+        dense_value_list = self.feature_plan.dense_values(X)
 
-        linear_logit = torch.zeros([X.shape[0], 1]).to(self.device)
+        linear_logit = torch.zeros([X[0].shape[0], 1], device=X[0].device)
         if len(sparse_embedding_list) > 0:
             sparse_embedding_cat = torch.cat(sparse_embedding_list, dim=-1)
             if sparse_feat_refine_weight is not None:
@@ -92,6 +93,25 @@ class Linear(nn.Module):
         return linear_logit
 
 
+@contextmanager
+def _full_precision():
+    yield
+
+
+class FlatInputModel(nn.Module):
+    """A model called with the tensors of a ``FeatureBatch`` as separate arguments, so that it can be traced.
+
+    The arguments are ``sparse, dense, length`` followed by ``values, offsets`` of every ragged feature.
+    """
+
+    def __init__(self, model):
+        super(FlatInputModel, self).__init__()
+        self.model = model
+
+    def forward(self, sparse, dense, length, *ragged):
+        return self.model(FeatureBatch(sparse, dense, length, zip(ragged[0::2], ragged[1::2])))
+
+
 class BaseModel(nn.Module):
     def __init__(self, linear_feature_columns, dnn_feature_columns, l2_reg_linear=1e-5, l2_reg_embedding=1e-5,
                  init_std=0.0001, seed=1024, task='binary', device='cpu', gpus=None):
@@ -108,11 +128,16 @@ class BaseModel(nn.Module):
             raise ValueError(
                 "`gpus[0]` should be the same gpu with `device`")
 
-        self.feature_index = build_input_features(
+        self.feature_index = build_typed_input_features(
             linear_feature_columns + dnn_feature_columns)
+        self.sparse_input_dtype = get_sparse_input_dtype(linear_feature_columns + dnn_feature_columns)
+        self.hash_features = get_hash_features(linear_feature_columns + dnn_feature_columns)
         self.dnn_feature_columns = dnn_feature_columns
 
         self.embedding_dict = create_embedding_matrix(dnn_feature_columns, init_std, sparse=False, device=device)
+        # slices of the inputs and pooling layers of `dnn_feature_columns`, used by `input_from_feature_columns`
+        self.dnn_feature_plan = FeaturePlan(dnn_feature_columns, self.feature_index, device=device)
+        self._feature_plans = {}
         #         nn.ModuleDict(
         #             {feat.embedding_name: nn.Embedding(feat.dimension, embedding_size, sparse=True) for feat in
         #              self.dnn_feature_columns}
@@ -122,6 +147,14 @@ class BaseModel(nn.Module):
             linear_feature_columns, self.feature_index, device=device)
 
         self.regularization_weight = []
+        # embedding table -> (feature name, first row of its table) of the features looked up in it,
+        # see `embedding_regularization` of `compile`
+        self.lookup_features = {}
+        self.embedding_regularization = "full"
+        self.sparse_embedding = False
+        self._lookup_counts = {}
+        self.add_lookup_features(self.embedding_dict, dnn_feature_columns)
+        self.add_lookup_features(self.linear_model.embedding_dict, linear_feature_columns)
 
         self.add_regularization_weight(self.embedding_dict.parameters(), l2=l2_reg_embedding)
         self.add_regularization_weight(self.linear_model.parameters(), l2=l2_reg_linear)
@@ -135,28 +168,50 @@ class BaseModel(nn.Module):
         self.history = History()
 
     def fit(self, x=None, y=None, batch_size=None, epochs=1, verbose=1, initial_epoch=0, validation_split=0.,
-            validation_data=None, shuffle=True, callbacks=None):
+            validation_data=None, shuffle=True, callbacks=None, num_workers=0, prefetch_factor=2,
+            persistent_workers=False, pin_memory=False, prefetch_batches=0, validation_interval=None,
+            validation_samples=None, log_interval=None):
         """
 
         :param x: Numpy array of training data (if the model has a single input), or list of Numpy arrays (if the model has multiple inputs).If input layers in the model are named, you can also pass a
-            dictionary mapping input names to Numpy arrays.
+            dictionary mapping input names to Numpy arrays, or a pandas DataFrame. In-memory inputs are converted once into compact tensors, without intermediate copies. `x` can also be a stream of batches: a `torch.utils.data.IterableDataset`, a generator, or a function returning a generator, which yields `(x_dict, y)` tuples. In that case `y` must be `None` and the data is never materialised in memory at once.
         :param y: Numpy array of target (label) data (if the model has a single output), or list of Numpy arrays (if the model has multiple outputs).
-        :param batch_size: Integer or `None`. Number of samples per gradient update. If unspecified, `batch_size` will default to 256.
+        :param batch_size: Integer or `None`. Number of samples per gradient update. If unspecified, `batch_size` will default to 256. Ignored when `x` is a stream of batches.
         :param epochs: Integer. Number of epochs to train the model. An epoch is an iteration over the entire `x` and `y` data provided. Note that in conjunction with `initial_epoch`, `epochs` is to be understood as "final epoch". The model is not trained for a number of iterations given by `epochs`, but merely until the epoch of index `epochs` is reached.
         :param verbose: Integer. 0, 1, or 2. Verbosity mode. 0 = silent, 1 = progress bar, 2 = one line per epoch.
         :param initial_epoch: Integer. Epoch at which to start training (useful for resuming a previous training run).
-        :param validation_split: Float between 0 and 1. Fraction of the training data to be used as validation data. The model will set apart this fraction of the training data, will not train on it, and will evaluate the loss and any model metrics on this data at the end of each epoch. The validation data is selected from the last samples in the `x` and `y` data provided, before shuffling.
-        :param validation_data: tuple `(x_val, y_val)` or tuple `(x_val, y_val, val_sample_weights)` on which to evaluate the loss and any model metrics at the end of each epoch. The model will not be trained on this data. `validation_data` will override `validation_split`.
+        :param validation_split: Float between 0 and 1. Fraction of the training data to be used as validation data. The model will set apart this fraction of the training data, will not train on it, and will evaluate the loss and any model metrics on this data at the end of each epoch. The validation data is selected from the last samples in the `x` and `y` data provided, before shuffling, as a view of the converted inputs. Not supported when `x` is a stream of batches.
+        :param validation_data: tuple `(x_val, y_val)` or tuple `(x_val, y_val, val_sample_weights)` on which to evaluate the loss and any model metrics at the end of each epoch. The model will not be trained on this data. `validation_data` will override `validation_split`. It can also be a re-iterable stream of `(x_dict, y)` batches.
         :param shuffle: Boolean. Whether to shuffle the order of the batches at the beginning of each epoch.
         :param callbacks: List of `deepctr_torch.callbacks.Callback` instances. List of callbacks to apply during training and validation (if ). See [callbacks](https://tensorflow.google.cn/api_docs/python/tf/keras/callbacks). Now available: `EarlyStopping` , `ModelCheckpoint`
+        :param num_workers: Integer. Number of `DataLoader` worker processes reading and converting batches when `x` is an `IterableDataset`, 0 means the batches are loaded in the main process. In-memory arrays are always sliced in the main process.
+        :param prefetch_factor: Integer. Number of batches loaded in advance by each worker. Only used when `num_workers > 0`, values other than 2 require torch>=1.7.
+        :param persistent_workers: Boolean. Whether to keep the worker processes alive between epochs. Only used when `num_workers > 0`, `True` requires torch>=1.7.
+        :param pin_memory: Boolean. Whether to copy the batches into pinned memory before the asynchronous transfer to a cuda `device`.
+        :param prefetch_batches: Integer. Number of batches prepared and moved to `device` by a background thread while the model computes the current one, 0 disables the background thread.
+        :param validation_interval: Integer or `None`. If set, also evaluate the model every `validation_interval` training steps. The results are recorded in `model.step_history` and passed to the `on_batch_end` method of the callbacks, which can stop the training by setting `model.stop_training = True`.
+        :param validation_samples: Integer or `None`. Number of validation samples used by the evaluations every `validation_interval` steps. They are drawn once before training (the first batches of a stream), so that successive evaluations are comparable. If `None`, the whole validation data is used.
+        :param log_interval: Integer or `None`. The training loss is summed on the device and read once per epoch, so that the training steps never wait for the device. If set, the average loss of the epoch is also read every `log_interval` steps and shown in the progress bar.
 
         :return: A `History` object. Its `History.history` attribute is a record of training loss values and metrics values at successive epochs, as well as validation loss values and validation metrics values (if applicable).
         """
-        if isinstance(x, dict):
-            x = [x[feature] for feature in self.feature_index]
+        stream = is_batch_stream(x)
+        if stream:
+            if y is not None:
+                raise ValueError('`y` should be None when `x` is a stream of batches, '
+                                 'yield `(x_dict, y)` tuples from the stream instead.')
+            if not is_reiterable(x) and epochs - initial_epoch > 1:
+                raise ValueError('A generator can only be consumed once, pass an `IterableDataset` or a function '
+                                 'returning a new generator to train for more than one epoch.')
 
         do_validation = False
-        if validation_data:
+        if validation_data is not None and is_batch_stream(validation_data):
+            if not is_reiterable(validation_data) and epochs - initial_epoch > 1:
+                raise ValueError('A generator can only be consumed once, pass an `IterableDataset` or a function '
+                                 'returning a new generator as `validation_data`.')
+            do_validation = True
+            val_x, val_y = validation_data, None
+        elif validation_data:
             do_validation = True
             if len(validation_data) == 2:
                 val_x, val_y = validation_data
@@ -171,50 +226,60 @@ class BaseModel(nn.Module):
                     'or alternatively it could be a dataset or a '
                     'dataset or a dataset iterator. '
                     'However we received `validation_data=%s`' % validation_data)
-            if isinstance(val_x, dict):
-                val_x = [val_x[feature] for feature in self.feature_index]
+            val_x, val_y = self._prepare_inputs(val_x, val_y)
 
         elif validation_split and 0. < validation_split < 1.:
+            if stream:
+                raise ValueError('`validation_split` is not supported when `x` is a stream of batches, '
+                                 'use `validation_data` instead.')
             do_validation = True
-            if hasattr(x[0], 'shape'):
-                split_at = int(x[0].shape[0] * (1. - validation_split))
-            else:
-                split_at = int(len(x[0]) * (1. - validation_split))
-            x, val_x = (slice_arrays(x, 0, split_at),
-                        slice_arrays(x, split_at))
-            y, val_y = (slice_arrays(y, 0, split_at),
-                        slice_arrays(y, split_at))
 
         else:
             val_x = []
             val_y = []
-        for i in range(len(x)):
-            if len(x[i].shape) == 1:
-                x[i] = np.expand_dims(x[i], axis=1)
-
-        train_tensor_data = Data.TensorDataset(
-            torch.from_numpy(
-                np.concatenate(x, axis=-1)),
-            torch.from_numpy(y))
+
+        if not stream:
+            # in-memory inputs are converted once, the validation split is a range of rows of the converted tensors
+            x, y = self._prepare_inputs(x, y)
+            if do_validation and not validation_data:
+                split_at = int(x.sparse.shape[0] * (1. - validation_split))
+                x, val_x = slice_feature_batch(x, 0, split_at), slice_feature_batch(x, split_at)
+                y, val_y = y[:split_at], y[split_at:]
+
         if batch_size is None:
             batch_size = 256
 
-        model = self.train()
+        model = self
         loss_func = self.loss_func
         optim = self.optim
 
         if self.gpus:
+            if any(group == RAGGED_INPUT for group, _, _ in self.feature_index.values()):
+                raise ValueError("Ragged VarLenSparseFeat can not be split across `gpus`, pad them instead.")
             print('parallel running on these gpus:', self.gpus)
             model = torch.nn.DataParallel(model, device_ids=self.gpus)
             batch_size *= len(self.gpus)  # input `batch_size` is batch_size per gpu
         else:
             print(self.device)
-
-        train_loader = DataLoader(
-            dataset=train_tensor_data, shuffle=shuffle, batch_size=batch_size)
-
-        sample_num = len(train_tensor_data)
-        steps_per_epoch = (sample_num - 1) // batch_size + 1
+            model = self._compiled()
+
+        loader_kwargs = dict(num_workers=num_workers, prefetch_factor=prefetch_factor,
+                             persistent_workers=persistent_workers)
+        train_loader = self._get_batch_loader(x, y, batch_size, shuffle, **loader_kwargs)
+        sample_num = None if stream else train_loader.batches.num_samples
+        steps_per_epoch = stream_length(train_loader)
+
+        # validation inputs are converted once and reused by every evaluation
+        val_loader = self._get_batch_loader(val_x, val_y, batch_size, **loader_kwargs) if do_validation else None
+        step_val_loader = None
+        self.step_history = {"step": []}
+        if validation_interval:
+            if not do_validation:
+                raise ValueError('`validation_interval` requires `validation_data` or `validation_split`.')
+            step_val_loader = val_loader
+            if validation_samples is not None:
+                step_val_loader = self._get_validation_subsample(val_x, val_y, val_loader, validation_samples,
+                                                                 batch_size)
 
         # configure callbacks
         callbacks = (callbacks or []) + [self.history]  # add history callback
@@ -227,22 +292,35 @@ class BaseModel(nn.Module):
         callbacks.model.stop_training = False
 
         # Train
-        print("Train on {0} samples, validate on {1} samples, {2} steps per epoch".format(
-            len(train_tensor_data), len(val_y), steps_per_epoch))
+        if stream:
+            print("Train on a stream of batches, {0} steps per epoch".format(
+                steps_per_epoch if steps_per_epoch is not None else "unknown"))
+        else:
+            print("Train on {0} samples, validate on {1} samples, {2} steps per epoch".format(
+                sample_num, len(val_y) if val_y is not None else "unknown", steps_per_epoch))
+        global_step = 0
         for epoch in range(initial_epoch, epochs):
+            model.train()
             callbacks.on_epoch_begin(epoch)
+            if hasattr(x, 'set_epoch'):
+                # the workers of a DataLoader shuffle a copy of the dataset taken at the start of every epoch
+                x.set_epoch(epoch)
             epoch_logs = {}
             start_time = time.time()
-            loss_epoch = 0
-            total_loss_epoch = 0
-            train_result = {}
+            # running sum of the loss on the device, read at the end of the epoch and every `log_interval` steps
+            total_loss_epoch = torch.zeros((1,), device=self.device)
+            seen_samples = 0
+            for metric in self.metrics.values():
+                metric.reset()
             try:
-                with tqdm(enumerate(train_loader), disable=verbose != 1) as t:
-                    for _, (x_train, y_train) in t:
-                        x = x_train.to(self.device).float()
-                        y = y_train.to(self.device).float()
+                with tqdm(enumerate(self._device_batches(train_loader, prefetch_batches, pin_memory)),
+                          total=steps_per_epoch, disable=verbose != 1) as t:
+                    for _, (x, y_train) in t:
+                        y = y_train.float()
 
-                        y_pred = model(x).squeeze()
+                        with self._autocast():
+                            y_pred = model(x).squeeze()
+                        y_pred = y_pred.float()  # the loss is computed in float32
 
                         optim.zero_grad()
                         if isinstance(loss_func, list):
@@ -252,22 +330,29 @@ class BaseModel(nn.Module):
                                 [loss_func[i](y_pred[:, i], y[:, i], reduction='sum') for i in range(self.num_tasks)])
                         else:
                             loss = loss_func(y_pred, y.squeeze(), reduction='sum')
-                        reg_loss = self.get_regularization_loss()
+                        reg_loss = self.get_regularization_loss(x)
 
                         total_loss = loss + reg_loss + self.aux_loss
 
-                        loss_epoch += loss.item()
-                        total_loss_epoch += total_loss.item()
+                        total_loss_epoch += total_loss.detach()
                         total_loss.backward()
                         optim.step()
-
-                        if verbose > 0:
-                            for name, metric_fun in self.metrics.items():
-                                if name not in train_result:
-                                    train_result[name] = []
-                                train_result[name].append(metric_fun(
-                                    y.cpu().data.numpy(), y_pred.cpu().data.numpy().astype("float64")))
-
+                        seen_samples += y.shape[0]
+                        global_step += 1
+                        if log_interval and global_step % log_interval == 0 and verbose == 1:
+                            t.set_postfix(loss="{0: .4f}".format(total_loss_epoch.item() / seen_samples))
+
+                        # accumulated on the device, read once per epoch
+                        with torch.no_grad():
+                            for metric in self.metrics.values():
+                                metric.update(y, y_pred)
+
+                        if validation_interval and global_step % validation_interval == 0:
+                            self._validate_step(global_step, step_val_loader, callbacks, verbose,
+                                                prefetch_batches, pin_memory)
+                            model.train()
+                            if self.stop_training:
+                                break
 
             except KeyboardInterrupt:
                 t.close()
@@ -275,12 +360,12 @@ class BaseModel(nn.Module):
             t.close()
 
             # Add epoch_logs
-            epoch_logs["loss"] = total_loss_epoch / sample_num
-            for name, result in train_result.items():
-                epoch_logs[name] = np.sum(result) / steps_per_epoch
+            epoch_logs["loss"] = total_loss_epoch.item() / max(seen_samples, 1)
+            for name, metric in self.metrics.items():
+                epoch_logs[name] = metric.result()
 
             if do_validation:
-                eval_result = self.evaluate(val_x, val_y, batch_size)
+                eval_result = self._evaluate_batches(val_loader, prefetch_batches, pin_memory)
                 for name, result in eval_result.items():
                     epoch_logs["val_" + name] = result
             # verbose
@@ -308,76 +393,223 @@ class BaseModel(nn.Module):
 
         return self.history
 
-    def evaluate(self, x, y, batch_size=256):
+    def evaluate(self, x, y=None, batch_size=256, num_workers=0, prefetch_factor=2, persistent_workers=False,
+                 pin_memory=False, prefetch_batches=0):
         """
 
-        :param x: Numpy array of test data (if the model has a single input), or list of Numpy arrays (if the model has multiple inputs).
-        :param y: Numpy array of target (label) data (if the model has a single output), or list of Numpy arrays (if the model has multiple outputs).
+        :param x: Numpy array of test data (if the model has a single input), or list of Numpy arrays (if the model has multiple inputs). It can also be a stream of `(x_dict, y)` batches, see `fit`.
+        :param y: Numpy array of target (label) data (if the model has a single output), or list of Numpy arrays (if the model has multiple outputs). Must be `None` when `x` is a stream of batches.
         :param batch_size: Integer or `None`. Number of samples per evaluation step. If unspecified, `batch_size` will default to 256.
+        :param num_workers: Integer. See `fit`.
+        :param prefetch_factor: Integer. See `fit`.
+        :param persistent_workers: Boolean. See `fit`.
+        :param pin_memory: Boolean. See `fit`.
+        :param prefetch_batches: Integer. See `fit`.
         :return: Dict contains metric names and metric values.
         """
-        pred_ans = self.predict(x, batch_size)
-        eval_result = {}
-        for name, metric_fun in self.metrics.items():
-            eval_result[name] = metric_fun(y, pred_ans)
-        return eval_result
-
-    def predict(self, x, batch_size=256):
+        loader = self._get_batch_loader(x, y, batch_size, num_workers=num_workers, prefetch_factor=prefetch_factor,
+                                        persistent_workers=persistent_workers)
+        return self._evaluate_batches(loader, prefetch_batches, pin_memory)
+
+    def _evaluate_batches(self, loader, prefetch_batches=0, pin_memory=False):
+        # Stream the predictions into copies of the metric accumulators, without keeping them in memory
+        self.eval()
+        model = self._compiled()
+
+        def labeled_predictions():
+            with torch.no_grad():
+                for x, y in self._device_batches(loader, prefetch_batches, pin_memory):
+                    if y is None:
+                        raise ValueError('Batches must contain labels to evaluate the model, yield `(x_dict, y)`.')
+                    with self._autocast():
+                        y_pred = model(x)
+                    yield y, y_pred.float()
+
+        return evaluate_metrics(self.metrics, labeled_predictions())
+
+    def _get_validation_subsample(self, val_x, val_y, val_loader, num_samples, batch_size, seed=1024):
+        # Return a fixed subsample of the validation data: random rows of in-memory arrays,
+        # or the first batches of a stream, kept in memory
+        if is_batch_stream(val_x):
+            batches = []
+            seen_samples = 0
+            for x_batch, y_batch in val_loader:
+                batches.append((x_batch, y_batch))
+                seen_samples += y_batch.shape[0]
+                if seen_samples >= num_samples:
+                    break
+            return batches
+        num_rows = val_y.shape[0]
+        index = np.sort(np.random.RandomState(seed).choice(num_rows, min(num_samples, num_rows), replace=False))
+        index = torch.from_numpy(index)
+        return self._get_batch_loader(take_feature_batch(val_x, index), val_y[index], batch_size)
+
+    def _validate_step(self, step, loader, callbacks, verbose, prefetch_batches=0, pin_memory=False):
+        # Evaluate every `validation_interval` training steps, the callbacks get the results in `on_batch_end`
+        logs = {"val_" + name: result
+                for name, result in self._evaluate_batches(loader, prefetch_batches, pin_memory).items()}
+        self.step_history["step"].append(step)
+        for name, result in logs.items():
+            self.step_history.setdefault(name, []).append(result)
+        if verbose > 0:
+            tqdm.write(" - ".join(["step {0}".format(step)] + ["{0}: {1: .4f}".format(name, result)
+                                                         for name, result in logs.items()]))
+        callbacks.on_batch_end(step, logs)
+
+    def predict(self, x, batch_size=256, num_workers=0, prefetch_factor=2, persistent_workers=False,
+                pin_memory=False, prefetch_batches=0):
         """
 
-        :param x: The input data, as a Numpy array (or list of Numpy arrays if the model has multiple inputs).
+        :param x: The input data, as a Numpy array (or list of Numpy arrays if the model has multiple inputs), a dict of Numpy arrays or a pandas DataFrame. It can also be a stream of `x_dict` or `(x_dict, y)` batches, see `fit`.
         :param batch_size: Integer. If unspecified, it will default to 256.
+        :param num_workers: Integer. See `fit`.
+        :param prefetch_factor: Integer. See `fit`.
+        :param persistent_workers: Boolean. See `fit`.
+        :param pin_memory: Boolean. See `fit`.
+        :param prefetch_batches: Integer. See `fit`.
         :return: Numpy array(s) of predictions.
         """
-        model = self.eval()
-        if isinstance(x, dict):
-            x = [x[feature] for feature in self.feature_index]
-        for i in range(len(x)):
-            if len(x[i].shape) == 1:
-                x[i] = np.expand_dims(x[i], axis=1)
-
-        tensor_data = Data.TensorDataset(
-            torch.from_numpy(np.concatenate(x, axis=-1)))
-        test_loader = DataLoader(
-            dataset=tensor_data, shuffle=False, batch_size=batch_size)
+        loader = self._get_batch_loader(x, None, batch_size, num_workers=num_workers, prefetch_factor=prefetch_factor,
+                                        persistent_workers=persistent_workers)
+        return self._predict_batches(self._device_batches(loader, prefetch_batches, pin_memory))
 
+    def _predict_batches(self, batches):
+        self.eval()
+        model = self._compiled()
         pred_ans = []
         with torch.no_grad():
-            for _, x_test in enumerate(test_loader):
-                x = x_test[0].to(self.device).float()
-
-                y_pred = model(x).cpu().data.numpy()  # .squeeze()
+            for x, _ in batches:
+                with self._autocast():
+                    y_pred = model(x)
+                y_pred = y_pred.float().cpu().data.numpy()  # .squeeze()
                 pred_ans.append(y_pred)
 
         return np.concatenate(pred_ans).astype("float64")
 
-    def input_from_feature_columns(self, X, feature_columns, embedding_dict, support_dense=True):
-
-        sparse_feature_columns = list(
-            filter(lambda x: isinstance(x, SparseFeat), feature_columns)) if len(feature_columns) else []
-        dense_feature_columns = list(
-            filter(lambda x: isinstance(x, DenseFeat), feature_columns)) if len(feature_columns) else []
-
-        varlen_sparse_feature_columns = list(
-            filter(lambda x: isinstance(x, VarLenSparseFeat), feature_columns)) if feature_columns else []
+    def _autocast(self):
+        # context of the forward passes of `fit`, `evaluate` and `predict`, see `mixed_precision` of `compile`
+        if getattr(self, "mixed_precision", None) is None:
+            return _full_precision()
+        return torch.autocast(device_type="cuda" if "cuda" in str(self.device) else "cpu", dtype=torch.bfloat16)
+
+    def _compiled(self):
+        # the model, or its `torch.compile` version after `compile(..., jit_compile=True)`
+        compiled = self.__dict__.get("_compiled_model")
+        return self if compiled is None else compiled
+
+    def __getstate__(self):
+        # the compiled model is rebuilt by `compile`, it can not be pickled
+        state = self.__dict__.copy()
+        state.pop("_compiled_model", None)
+        return state
+
+    def __dir__(self):
+        # torch.jit.trace calls hasattr on every name listed by dir, and `embedding_size` raises a ValueError for the
+        # models with several embedding dims
+        return [name for name in super(BaseModel, self).__dir__() if name != 'embedding_size']
+
+    def to_torchscript(self, x, path=None, batch_size=256):
+        """Trace the inference of the model into a TorchScript module, which serves predictions without the Python
+        code of the model.
+
+        The module is called with the tensors of a ``FeatureBatch`` as arguments: ``sparse, dense, length``, then
+        ``values, offsets`` of every ragged feature, with the integer tensors as ``torch.long``. They can be built
+        with ``deepctr_torch.data.build_feature_batch(x, model.feature_index, model.sparse_input_dtype,
+        model.hash_features)``. The forward pass is traced, not scripted: Python control flow that depends on the
+        values of the inputs is recorded for the example batch only. The traced ``DIEN`` therefore only serves
+        batches with the sequence lengths of the example, while models that mask sequences with tensors, such as
+        ``DIN``, serve any batch size and lengths.
+
+        :param x: example inputs, as accepted by ``predict``, the first batch is used for tracing.
+        :param path: str or None, if given the module is also saved there with ``torch.jit.save``.
+        :param batch_size: Integer. Number of samples of the example batch.
+        :return: a ``torch.jit.ScriptModule`` returning the predictions of the model.
+        """
+        loader = self._get_batch_loader(x, None, batch_size)
+        inputs, _ = next(iter(self._device_batches(loader)))
+        example = tuple(inputs[:3]) + tuple(chain.from_iterable(inputs.ragged))
+        self.eval()
+        with torch.no_grad():
+            traced = torch.jit.trace(FlatInputModel(self), example)
+        if path is not None:
+            torch.jit.save(traced, path)
+        return traced
+
+    def _get_batch_loader(self, x, y=None, batch_size=256, shuffle=False, num_workers=0, prefetch_factor=2,
+                          persistent_workers=False):
+        # Return a re-iterable `BatchLoader` of `(FeatureBatch, y)` CPU batches, `y` is None for unlabeled inputs
+        convert = partial(convert_batch, feature_index=self.feature_index, sparse_dtype=self.sparse_input_dtype,
+                          hash_features=self.hash_features)
+        if isinstance(x, IterableDataset):
+            if num_workers > 0:
+                # each worker converts its own batches, so that only three tensors per batch cross processes
+                worker_kwargs = {}
+                if prefetch_factor != 2 or persistent_workers:
+                    # DataLoader takes `prefetch_factor` and `persistent_workers` since torch 1.7, their defaults
+                    # are not passed so that older versions still read with workers
+                    if 'persistent_workers' not in inspect.signature(DataLoader.__init__).parameters:
+                        raise ValueError("`prefetch_factor` and `persistent_workers` require torch>=1.7")
+                    worker_kwargs = dict(prefetch_factor=prefetch_factor, persistent_workers=persistent_workers)
+                return BatchLoader(DataLoader(x, batch_size=None, collate_fn=convert, num_workers=num_workers,
+                                              **worker_kwargs))
+            return BatchLoader(x, convert)
+        if is_batch_stream(x):
+            return BatchLoader(x, convert)
+
+        inputs, y = self._prepare_inputs(x, y)
+        tensors = list(inputs[:3])
+        if y is not None:
+            tensors.append(y)
+        if len(inputs.ragged) > 0:
+            # ragged rows can not be sliced like the other tensors, they are taken by row number
+            tensors.append(torch.arange(inputs.sparse.shape[0]))
+        return BatchLoader(TensorBatchIterator(tensors, batch_size=batch_size, shuffle=shuffle),
+                           partial(split_tensor_batch, ragged=inputs.ragged))
+
+    def _prepare_inputs(self, x, y=None):
+        # Convert in-memory inputs into a `FeatureBatch` and a label tensor, a no-op for converted inputs.
+        # Features are read column by column from dicts and DataFrames, without intermediate copies
+        x = build_feature_batch(x, self.feature_index, self.sparse_input_dtype, self.hash_features)
+        if y is not None and not isinstance(y, torch.Tensor):
+            y = torch.from_numpy(np.asarray(y))
+        return x, y
+
+    def _device_batches(self, loader, prefetch_batches=0, pin_memory=False):
+        # Move the batches of `loader` to `self.device`, in a background thread when `prefetch_batches > 0`
+        to_device = partial(batch_to_device, device=self.device, pin_memory=pin_memory and 'cuda' in str(self.device))
+        if prefetch_batches > 0:
+            return BackgroundPrefetcher(loader, prefetch_batches, transform=to_device)
+        return BatchLoader(loader, to_device)
 
-        if not support_dense and len(dense_feature_columns) > 0:
+    def input_from_feature_columns(self, X, feature_columns, embedding_dict, support_dense=True):
+        plan = self.get_feature_plan(feature_columns)
+        if not support_dense and len(plan.dense_features) > 0:
             raise ValueError(
                 "DenseFeat is not supported in dnn_feature_columns")
 
-        sparse_embedding_list = [embedding_dict[feat.embedding_name](
-            X[:, self.feature_index[feat.name][0]:self.feature_index[feat.name][1]].long()) for
-            feat in sparse_feature_columns]
-
-        sequence_embed_dict = varlen_embedding_lookup(X, self.embedding_dict, self.feature_index,
-                                                      varlen_sparse_feature_columns)
-        varlen_sparse_embedding_list = get_varlen_pooling_list(sequence_embed_dict, X, self.feature_index,
-                                                               varlen_sparse_feature_columns, self.device)
+        sparse_embedding_list = plan.sparse_embeddings(X, embedding_dict) + plan.varlen_embeddings(X, embedding_dict)
+        return sparse_embedding_list, plan.dense_values(X)
 
-        dense_value_list = [X[:, self.feature_index[feat.name][0]:self.feature_index[feat.name][1]] for feat in
-                            dense_feature_columns]
-
-        return sparse_embedding_list + varlen_sparse_embedding_list, dense_value_list
+    def stacked_input_from_feature_columns(self, X, feature_columns, embedding_dict, support_dense=True):
+        """As ``input_from_feature_columns``, with the sparse embeddings returned as one ``(batch_size, num_features,
+        embedding_dim)`` tensor, or None without sparse features, for the models that require one embedding_dim."""
+        plan = self.get_feature_plan(feature_columns)
+        if not support_dense and len(plan.dense_features) > 0:
+            raise ValueError(
+                "DenseFeat is not supported in dnn_feature_columns")
+        return plan.stacked_embeddings(X, embedding_dict), plan.dense_values(X)
+
+    def get_feature_plan(self, feature_columns):
+        """Return the ``FeaturePlan`` of ``feature_columns``, built on the first call for a list of columns."""
+        if feature_columns is self.dnn_feature_columns:
+            return self.dnn_feature_plan
+        key = id(feature_columns)
+        if key not in self._feature_plans:
+            # the columns are kept alive with their plan, so that their id is not reused
+            plan = FeaturePlan(feature_columns, self.feature_index, device=self.device)
+            plan.fuse(self.embedding_dict)
+            self._feature_plans[key] = (feature_columns, plan)
+        return self._feature_plans[key][1]
 
     def compute_input_dim(self, feature_columns, include_sparse=True, include_dense=True, feature_group=False):
         sparse_feature_columns = list(
@@ -409,23 +641,204 @@ class BaseModel(nn.Module):
             weight_list = list(weight_list)
         self.regularization_weight.append((weight_list, l1, l2))
 
-    def get_regularization_loss(self, ):
-        total_reg_loss = torch.zeros((1,), device=self.device)
+    def add_lookup_features(self, embedding_dict, feature_columns):
+        """Record which features are looked up in the tables of ``embedding_dict``, so that the regularization of
+        these tables can be restricted to the rows of the batch (see ``embedding_regularization`` of ``compile``).
+
+        :param embedding_dict: nn.ModuleDict ``{embedding_name: nn.Embedding}``.
+        :param feature_columns: list of the features looked up in ``embedding_dict``.
+        """
+        for feat in feature_columns:
+            if isinstance(feat, (SparseFeat, VarLenSparseFeat)) and feat.embedding_name in embedding_dict:
+                embedding = embedding_dict[feat.embedding_name]
+                if isinstance(embedding, EmbeddingView):
+                    weight, offset = embedding.fused.weight, embedding.offset
+                else:
+                    weight, offset = embedding.weight, 0
+                features = self.lookup_features.setdefault(weight, [])
+                if (feat.name, offset) not in features:
+                    features.append((feat.name, offset))
+
+    def get_regularization_loss(self, X=None):
+        # the penalties are summed out of place, without a new zero tensor per call
+        penalties = []
         for weight_list, l1, l2 in self.regularization_weight:
             for w in weight_list:
                 if isinstance(w, tuple):
                     parameter = w[1]  # named_parameters
                 else:
                     parameter = w
+                # (name, table, columns) for the columns of a table shared with the first-order weights
+                columns = w[2] if isinstance(w, tuple) and len(w) > 2 else None
+                if X is not None and self.embedding_regularization != "full" and parameter in self.lookup_features:
+                    if l1 > 0 or l2 > 0:
+                        penalties.append(self._get_lookup_regularization(X, parameter, l1, l2, columns))
+                    continue
+                if columns is not None:
+                    parameter = parameter[:, columns]
                 if l1 > 0:
-                    total_reg_loss += torch.sum(l1 * torch.abs(parameter))
+                    penalties.append(torch.sum(l1 * torch.abs(parameter)))
                 if l2 > 0:
                     try:
-                        total_reg_loss += torch.sum(l2 * torch.square(parameter))
+                        penalties.append(torch.sum(l2 * torch.square(parameter)))
                     except AttributeError:
-                        total_reg_loss += torch.sum(l2 * parameter * parameter)
-
-        return total_reg_loss
+                        penalties.append(torch.sum(l2 * parameter * parameter))
+
+        if len(penalties) == 0:
+            return self.reg_loss  # a constant zero, shared by the calls
+        return sum(penalties[1:], penalties[0]).reshape(1)
+
+    def _get_lookup_regularization(self, X, weight, l1, l2, columns=None):
+        # Penalize only the rows of `weight` looked up by the batch `X`, restricted to `columns` if given.
+        # In "frequency" mode every row is divided by its number of lookups since the start of training
+        # (mini-batch aware regularization of DIN)
+        index = []
+        for name, offset in self.lookup_features[weight]:
+            feature_input = get_feature_input(X, self.feature_index, name)
+            if isinstance(feature_input, tuple):
+                feature_input = feature_input[0]  # values of a ragged feature
+            index.append(feature_input.reshape(-1) + offset)
+        rows, counts = torch.unique(torch.cat(index), return_counts=True)
+        embedding = F.embedding(rows, weight, sparse=self.sparse_embedding)
+        if columns is not None:
+            embedding = embedding[:, columns]
+
+        penalty = torch.zeros(rows.shape, device=weight.device)
+        if l1 > 0:
+            penalty = penalty + l1 * torch.abs(embedding).sum(dim=1)
+        if l2 > 0:
+            penalty = penalty + l2 * (embedding * embedding).sum(dim=1)
+        if self.embedding_regularization == "frequency":
+            # the columns of a shared table count the lookups of their own regularization
+            key = weight if columns is None else (weight, columns.start)
+            if key not in self._lookup_counts:
+                self._lookup_counts[key] = torch.zeros(weight.shape[0], device=weight.device)
+            lookup_counts = self._lookup_counts[key]
+            lookup_counts.index_add_(0, rows, counts.float())
+            penalty = penalty / lookup_counts[rows]
+        return penalty.sum()
+
+    def fuse_embeddings(self):
+        """Pack the embedding tables of the same dimension into one table, so that the ``SparseFeat`` of a batch are
+        looked up with one gather per dimension instead of one per feature. Features sharing an ``embedding_name``
+        keep sharing their rows, the regularization of the tables is unchanged.
+
+        It must be called after building the model and before ``compile``. The embedding weights of the fused model
+        have different names, ``fuse_state_dict`` and ``unfuse_state_dict`` of ``deepctr_torch.inputs`` convert the
+        state_dicts between the two layouts.
+
+        :return: the model.
+        """
+        if hasattr(self, "optim"):
+            raise ValueError("`fuse_embeddings` must be called before `compile`.")
+        if self.gpus:
+            raise ValueError("Fused embedding tables can not be replicated across `gpus`.")
+        if any(isinstance(module, EmbeddingColumns) for module in self.modules()):
+            raise ValueError("Embedding tables shared by `share_linear_embeddings` can not be fused.")
+        fused_weights = fuse_embedding_matrix(self.embedding_dict)
+        fused_weights.update(fuse_embedding_matrix(self.linear_model.embedding_dict))
+        if len(fused_weights) == 0:
+            return self
+
+        # a fused table replaces its tables in the regularization, with the same coefficients
+        packed_weights = {}
+        for weight, (fused, _) in fused_weights.items():
+            packed_weights.setdefault(fused, []).append(weight)
+        regularization_weight = []
+        for weight_list, l1, l2 in self.regularization_weight:
+            fused_list = []
+            for w in weight_list:
+                parameter = w[1] if isinstance(w, tuple) else w
+                if parameter in fused_weights:
+                    fused = fused_weights[parameter][0]
+                    if not all(any(p is (v[1] if isinstance(v, tuple) else v) for v in weight_list)
+                               for p in packed_weights[fused]):
+                        raise ValueError("The embedding tables of the same dimension must be regularized together "
+                                         "to be fused.")
+                    if any(fused is (v[1] if isinstance(v, tuple) else v) for v in fused_list):
+                        continue
+                    w = (w[0], fused) if isinstance(w, tuple) else fused
+                fused_list.append(w)
+            regularization_weight.append((fused_list, l1, l2))
+        self.regularization_weight = regularization_weight
+
+        lookup_features = {}
+        for weight, features in self.lookup_features.items():
+            fused, offset = fused_weights[weight] if weight in fused_weights else (weight, 0)
+            fused_features = lookup_features.setdefault(fused, [])
+            for name, feature_offset in features:
+                if (name, offset + feature_offset) not in fused_features:
+                    fused_features.append((name, offset + feature_offset))
+        self.lookup_features = lookup_features
+        self._lookup_counts = {}
+
+        # the plans of other `Linear` modules look up their own tables, which are not fused
+        linear_plans = set(id(module) for linear in self.modules() if isinstance(linear, Linear)
+                           for module in linear.modules())
+        self.linear_model.feature_plan.fuse(self.linear_model.embedding_dict)
+        plans = [plan for _, plan in self._feature_plans.values()]
+        plans += [module for module in self.modules()
+                  if isinstance(module, FeaturePlan) and id(module) not in linear_plans]
+        for plan in plans:
+            plan.fuse(self.embedding_dict)
+        return self
+
+    def share_linear_embeddings(self):
+        """Store the first-order weight of the sparse features of ``Linear`` as an extra column of their embedding
+        table, so that every id of a batch is looked up once for the linear logit and the DNN embeddings, instead
+        of once in each table. The predictions and the regularization of the model are unchanged.
+
+        A table is shared when the linear and the DNN parts look up the same features in it. It must be called after
+        building the model and before ``compile``, and can not be combined with ``fuse_embeddings``. The shared
+        table of ``embedding_name`` is saved as ``embedding_dict.__shared_<embedding_name>.weight``.
+
+        :return: the model.
+        """
+        if hasattr(self, "optim"):
+            raise ValueError("`share_linear_embeddings` must be called before `compile`.")
+        if self.gpus:
+            raise ValueError("Shared embedding tables can not be replicated across `gpus`.")
+        if any(isinstance(module, FusedEmbedding) for module in self.modules()):
+            raise ValueError("Fused embedding tables can not be shared with the linear part.")
+
+        linear_embedding_dict = self.linear_model.embedding_dict
+        embedding_names = []
+        for name, embedding in self.embedding_dict.items():
+            linear = linear_embedding_dict[name] if name in linear_embedding_dict else None
+            if type(embedding) is nn.Embedding and type(linear) is nn.Embedding and \
+                    embedding.num_embeddings == linear.num_embeddings and \
+                    set(self.lookup_features.get(embedding.weight, [])) == set(
+                        self.lookup_features.get(linear.weight, [None])):
+                embedding_names.append(name)
+        if len(embedding_names) == 0:
+            return self
+        if not hasattr(self, "_batch_lookups"):
+            self._batch_lookups = BatchLookups()
+            self.register_forward_pre_hook(self._batch_lookups.clear)
+            self.register_forward_hook(self._batch_lookups.clear)
+        shared_weights = share_linear_embedding(self.embedding_dict, linear_embedding_dict, embedding_names,
+                                                self._batch_lookups)
+
+        # each part keeps regularizing its own columns of the shared table
+        regularization_weight = []
+        for weight_list, l1, l2 in self.regularization_weight:
+            shared_list = []
+            for w in weight_list:
+                parameter = w[1] if isinstance(w, tuple) else w
+                if parameter in shared_weights:
+                    table, columns = shared_weights[parameter]
+                    w = (w[0] if isinstance(w, tuple) else None, table, columns)
+                shared_list.append(w)
+            regularization_weight.append((shared_list, l1, l2))
+        self.regularization_weight = regularization_weight
+
+        lookup_features = {}
+        for weight, features in self.lookup_features.items():
+            table = shared_weights[weight][0] if weight in shared_weights else weight
+            lookup_features[table] = features
+        self.lookup_features = lookup_features
+        self._lookup_counts = {}
+        return self
 
     def add_auxiliary_loss(self, aux_loss, alpha):
         self.aux_loss = aux_loss * alpha
@@ -433,33 +846,129 @@ class BaseModel(nn.Module):
     def compile(self, optimizer,
                 loss=None,
                 metrics=None,
+                embedding_regularization=None,
+                jit_compile=False,
+                mixed_precision=None,
                 ):
         """
-        :param optimizer: String (name of optimizer) or optimizer instance. See [optimizers](https://pytorch.org/docs/stable/optim.html).
+        :param optimizer: String (name of optimizer) or optimizer instance. See [optimizers](https://pytorch.org/docs/stable/optim.html). `rowwise_adagrad` is Adagrad with one accumulator per row of the embedding tables (see `deepctr_torch.optimizers.RowWiseAdagrad`). It can also be a dict `{"embedding": embedding_optimizer, "dense": dense_optimizer}` splitting the parameters in two groups (see `split_parameters`): the embedding tables are then trained with sparse gradients by `embedding_optimizer` (`sparse_adam`, `adagrad`, `rowwise_adagrad`, `sgd` or an optimizer instance over the embedding parameters), so that a step only updates the rows of the batch, and the other parameters by `dense_optimizer` (a name as above or an instance, `adam` by default).
         :param loss: String (name of objective function) or objective function. See [losses](https://pytorch.org/docs/stable/nn.functional.html#loss-functions).
-        :param metrics: List of metrics to be evaluated by the model during training and testing. Typically you will use `metrics=['accuracy']`.
+        :param metrics: List of metrics to be evaluated by the model during training and testing. Typically you will use `metrics=['accuracy']`. Available: `binary_crossentropy` (or `logloss`), `auc`, `mse`, `accuracy` (or `acc`), see `deepctr_torch.metrics`.
+        :param embedding_regularization: String. How the L1/L2 regularization of the embedding tables (`l2_reg_embedding`, `l2_reg_linear`) is computed at every training step: `full` penalizes every row of the tables, `batch` only the rows looked up by the batch, `frequency` the rows looked up by the batch divided by their number of lookups since the start of training, so that frequent ids are less regularized. With `batch` and `frequency` the cost of the regularization depends on the batch size instead of the vocabulary sizes. Defaults to `full`, or to `batch` with sparse embedding gradients, which `full` does not support.
+        :param jit_compile: Boolean. Whether to run the forward pass of the training and inference steps through `torch.compile`, which requires torch>=2.0. The first steps are slower while the model is compiled. The model itself is unchanged, its compiled version is rebuilt by every call to `compile`.
+        :param mixed_precision: String or `None`. `bfloat16` runs the forward passes of `fit`, `evaluate` and `predict` under `torch.autocast` with bfloat16, on cpu or cuda (torch>=1.10): the matrix products of the DNN towers, interaction and attention layers are computed in bfloat16, while the embedding tables, the parameters, the loss and the predictions stay in float32. `None` computes everything in float32.
         """
+        sparse = isinstance(optimizer, dict)
+        if embedding_regularization is None:
+            embedding_regularization = "batch" if sparse else "full"
+        if embedding_regularization not in ("full", "batch", "frequency"):
+            raise ValueError("embedding_regularization must be one of 'full', 'batch' or 'frequency'")
+        self.embedding_regularization = embedding_regularization
+        if mixed_precision not in (None, "bfloat16"):
+            raise ValueError("mixed_precision must be None or 'bfloat16'")
+        if mixed_precision is not None and not hasattr(torch, "autocast"):
+            raise ValueError("`mixed_precision` requires torch>=1.10")
+        self.mixed_precision = mixed_precision
+        self._lookup_counts = {}
+        self._set_sparse_embedding(sparse)
         self.metrics_names = ["loss"]
+        self.__dict__["_compiled_model"] = None
+        if jit_compile:
+            if not hasattr(torch, "compile"):
+                raise ValueError("`jit_compile` requires torch>=2.0, use `to_torchscript` to trace the model instead.")
+            if self.gpus:
+                raise ValueError("`jit_compile` is not supported with `gpus`.")
+            # not registered as a submodule, so that the parameters are not listed twice
+            self.__dict__["_compiled_model"] = torch.compile(self)
         self.optim = self._get_optim(optimizer)
         self.loss_func = self._get_loss_func(loss)
         self.metrics = self._get_metrics(metrics)
 
+    def split_parameters(self):
+        """Split the parameters into the weights of the embedding tables and the other parameters.
+
+        :return: tuple `(embedding_parameters, dense_parameters)` of lists, e.g. to build the optimizers of
+            `compile({"embedding": ..., "dense": ...})`.
+        """
+        embedding_parameters = []
+        for module in self.modules():
+            if isinstance(module, nn.Embedding) and all(module.weight is not p for p in embedding_parameters):
+                embedding_parameters.append(module.weight)
+        embedding_ids = set(id(p) for p in embedding_parameters)
+        dense_parameters = [p for p in self.parameters() if id(p) not in embedding_ids]
+        return embedding_parameters, dense_parameters
+
+    def _set_sparse_embedding(self, sparse):
+        # Make every embedding table produce sparse gradients, their regularization must then be per batch
+        if sparse:
+            if self.embedding_regularization == "full":
+                raise ValueError("embedding_regularization='full' gives dense gradients to the embedding tables, "
+                                 "use 'batch' or 'frequency' with sparse embedding gradients.")
+            embedding_parameters, _ = self.split_parameters()
+            for weight_list, l1, l2 in self.regularization_weight:
+                for w in weight_list:
+                    parameter = w[1] if isinstance(w, tuple) else w
+                    if (l1 > 0 or l2 > 0) and parameter not in self.lookup_features and \
+                            any(parameter is p for p in embedding_parameters):
+                        raise ValueError("A regularized embedding table is not registered with "
+                                         "`add_lookup_features`, its regularization would give it dense gradients.")
+        self.sparse_embedding = sparse
+        for module in self.modules():
+            if isinstance(module, nn.Embedding):
+                module.sparse = sparse
+
     def _get_optim(self, optimizer):
+        if isinstance(optimizer, dict):
+            if "embedding" not in optimizer or set(optimizer) - {"embedding", "dense"}:
+                raise ValueError('The parameter groups of `optimizer` must be {"embedding": ..., "dense": ...}')
+            embedding_parameters, dense_parameters = self.split_parameters()
+            optims = [self._get_sparse_optim(optimizer["embedding"], embedding_parameters)]
+            if len(dense_parameters) > 0:
+                optims.append(self._get_optim_single(optimizer.get("dense", "adam"), dense_parameters))
+            return MultiOptimizer(optims)
+        if optimizer == "rowwise_adagrad":
+            # one accumulator per row of the embedding tables, per element of the other parameters
+            embedding_parameters, dense_parameters = self.split_parameters()
+            groups = [{"params": embedding_parameters}, {"params": dense_parameters, "rowwise": False}]
+            return RowWiseAdagrad([group for group in groups if len(group["params"]) > 0])  # 0.01
+        return self._get_optim_single(optimizer, self.parameters())
+
+    @staticmethod
+    def _get_optim_single(optimizer, parameters):
         if isinstance(optimizer, str):
             if optimizer == "sgd":
-                optim = torch.optim.SGD(self.parameters(), lr=0.01)
+                optim = torch.optim.SGD(parameters, lr=0.01)
             elif optimizer == "adam":
-                optim = torch.optim.Adam(self.parameters())  # 0.001
+                optim = torch.optim.Adam(parameters)  # 0.001
             elif optimizer == "adagrad":
-                optim = torch.optim.Adagrad(self.parameters())  # 0.01
+                optim = torch.optim.Adagrad(parameters)  # 0.01
             elif optimizer == "rmsprop":
-                optim = torch.optim.RMSprop(self.parameters())
+                optim = torch.optim.RMSprop(parameters)
             else:
                 raise NotImplementedError
         else:
             optim = optimizer
         return optim
 
+    @staticmethod
+    def _get_sparse_optim(optimizer, parameters):
+        # optimizers of the embedding tables, they must support sparse gradients
+        if isinstance(optimizer, str):
+            if optimizer == "sparse_adam":
+                optim = torch.optim.SparseAdam(parameters)  # 0.001
+            elif optimizer == "adagrad":
+                optim = torch.optim.Adagrad(parameters)  # 0.01
+            elif optimizer == "rowwise_adagrad":
+                optim = RowWiseAdagrad(parameters)  # 0.01
+            elif optimizer == "sgd":
+                optim = torch.optim.SGD(parameters, lr=0.01)
+            else:
+                raise ValueError("The embedding optimizer must support sparse gradients: "
+                                 "'sparse_adam', 'adagrad', 'rowwise_adagrad' or 'sgd', got '{0}'".format(optimizer))
+        else:
+            optim = optimizer
+        return optim
+
     def _get_loss_func(self, loss):
         if isinstance(loss, str):
             loss_func = self._get_loss_func_single(loss)
@@ -482,32 +991,29 @@ class BaseModel(nn.Module):
 
     def _log_loss(self, y_true, y_pred, eps=1e-7, normalize=True, sample_weight=None, labels=None):
         # change eps to improve calculation accuracy
-        return log_loss(y_true,
-                        y_pred,
-                        eps,
-                        normalize,
-                        sample_weight,
-                        labels)
+        if sample_weight is not None or labels is not None:
+            return log_loss(y_true, y_pred, normalize=normalize, sample_weight=sample_weight, labels=labels)
+        metric = LogLoss(eps)
+        metric.update(torch.as_tensor(y_true), torch.as_tensor(y_pred))
+        return metric.result() if normalize else metric.total.item()
 
     @staticmethod
     def _accuracy_score(y_true, y_pred):
-        return accuracy_score(y_true, np.where(y_pred > 0.5, 1, 0))
+        metric = Accuracy()
+        metric.update(torch.as_tensor(y_true), torch.as_tensor(y_pred))
+        return metric.result()
 
     def _get_metrics(self, metrics, set_eps=False):
-        metrics_ = {}
+        # Return the on-device accumulators of the metric names, `set_eps` clips logloss predictions to 1e-7
+        metrics_ = OrderedDict()
         if metrics:
             for metric in metrics:
-                if metric == "binary_crossentropy" or metric == "logloss":
-                    if set_eps:
-                        metrics_[metric] = self._log_loss
-                    else:
-                        metrics_[metric] = log_loss
-                if metric == "auc":
-                    metrics_[metric] = roc_auc_score
-                if metric == "mse":
-                    metrics_[metric] = mean_squared_error
-                if metric == "accuracy" or metric == "acc":
-                    metrics_[metric] = self._accuracy_score
+                if (metric == "binary_crossentropy" or metric == "logloss") and set_eps:
+                    accumulator = get_metric(metric, eps=1e-7)
+                else:
+                    accumulator = get_metric(metric)
+                if accumulator is not None:
+                    metrics_[metric] = accumulator
                 self.metrics_names.append(metric)
         return metrics_
 
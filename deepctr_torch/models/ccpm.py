@@ -15,7 +15,6 @@ import torch.nn as nn
 from .basemodel import BaseModel
 from ..layers.core import DNN
 from ..layers.interaction import ConvLayer
-from ..layers.utils import concat_fun
 
 
 class CCPM(BaseModel):
@@ -68,11 +67,10 @@ class CCPM(BaseModel):
 
     def forward(self, X):
         linear_logit = self.linear_model(X)
-        sparse_embedding_list, _ = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                   self.embedding_dict, support_dense=False)
-        if len(sparse_embedding_list) == 0:
+        conv_input, _ = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                self.embedding_dict, support_dense=False)
+        if conv_input is None:
             raise ValueError("must have the embedding feature,now the embedding feature is None!")
-        conv_input = concat_fun(sparse_embedding_list, axis=1)
         conv_input_concact = torch.unsqueeze(conv_input, 1)
         pooling_result = self.conv_layer(conv_input_concact)
         flatten_result = pooling_result.view(pooling_result.size(0), -1)
@@ -5,7 +5,6 @@ Author:
 Reference:
     [1] Guo H, Tang R, Ye Y, et al. Deepfm: a factorization-machine based neural network for ctr prediction[J]. arXiv preprint arXiv:1703.04247, 2017.(https://arxiv.org/abs/1703.04247)
 """
-import torch
 import torch.nn as nn
 
 from .basemodel import BaseModel
@@ -66,13 +65,17 @@ class DeepFM(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
+        if self.use_fm:
+            # FM requires one embedding_dim, so the embeddings come as one (batch_size, num_features, dim) tensor
+            sparse_embedding_list, dense_value_list = self.stacked_input_from_feature_columns(
+                X, self.dnn_feature_columns, self.embedding_dict)
+        else:
+            sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                                      self.embedding_dict)
         logit = self.linear_model(X)
 
-        if self.use_fm and len(sparse_embedding_list) > 0:
-            fm_input = torch.cat(sparse_embedding_list, dim=1)
-            logit += self.fm(fm_input)
+        if self.use_fm and sparse_embedding_list is not None:
+            logit += self.fm(sparse_embedding_list)
 
         if self.use_dnn:
             dnn_input = combined_dnn_input(
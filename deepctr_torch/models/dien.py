@@ -53,6 +53,12 @@ class DIEN(BaseModel):
         self.use_negsampling = use_negsampling
         self.alpha = alpha
         self._split_columns()
+        behavior_fc_names = ["hist_" + name for name in history_feature_list] + [
+            "neg_hist_" + name for name in history_feature_list]
+        for fc in self.varlen_sparse_feature_columns:
+            if fc.ragged and fc.name in behavior_fc_names:
+                raise ValueError("Behavior sequence %s of DIEN should be padded, not ragged" % fc.name)
+        self._build_feature_plans(device)
 
         # structure: embedding layer -> interest extractor layer -> interest evolution layer -> DNN layer -> out
 
@@ -96,18 +102,17 @@ class DIEN(BaseModel):
         # [B, H2]
         deep_input_emb = self._get_deep_input_emb(X)
         deep_input_emb = concat_fun([hist, deep_input_emb])
-        dense_value_list = get_dense_input(X, self.feature_index, self.dense_feature_columns)
+        dense_value_list = self.dnn_feature_plan.dense_values(X)
         dnn_input = combined_dnn_input([deep_input_emb], dense_value_list)
         # [B, 1]
         output = self.linear(self.dnn(dnn_input))
         y_pred = self.out(output)
         return y_pred
 
-    def _get_emb(self, X):
+    def _build_feature_plans(self, device):
         # history feature columns : pos, neg
         history_feature_columns = []
         neg_history_feature_columns = []
-        sparse_varlen_feature_columns = []
         history_fc_names = list(map(lambda x: "hist_" + x, self.item_features))
         neg_history_fc_names = list(map(lambda x: "neg_" + x, history_fc_names))
         for fc in self.varlen_sparse_feature_columns:
@@ -116,29 +121,32 @@ class DIEN(BaseModel):
                 history_feature_columns.append(fc)
             elif feature_name in neg_history_fc_names:
                 neg_history_feature_columns.append(fc)
-            else:
-                sparse_varlen_feature_columns.append(fc)
 
+        # lookups resolved once, used by every forward pass
+        self.query_feature_plan = FeaturePlan(
+            [fc for fc in self.sparse_feature_columns if fc.name in self.item_features], self.feature_index,
+            device=device)
+        self.keys_feature_plan = FeaturePlan(history_feature_columns, self.feature_index, device=device)
+        self.neg_keys_feature_plan = FeaturePlan(neg_history_feature_columns, self.feature_index, device=device)
+        self.sparse_feature_plan = FeaturePlan(self.sparse_feature_columns, self.feature_index, device=device)
+        self.keys_length_feature_name = [feat.length_name for feat in self.varlen_sparse_feature_columns if
+                                         feat.length_name is not None]
+
+    def _get_emb(self, X):
         # convert input to emb
-        features = self.feature_index
-        query_emb_list = embedding_lookup(X, self.embedding_dict, features, self.sparse_feature_columns,
-                                          return_feat_list=self.item_features, to_list=True)
+        query_emb_list = self.query_feature_plan.lookup(X, self.embedding_dict)
         # [batch_size, dim]
         query_emb = torch.squeeze(concat_fun(query_emb_list), 1)
 
-        keys_emb_list = embedding_lookup(X, self.embedding_dict, features, history_feature_columns,
-                                         return_feat_list=history_fc_names, to_list=True)
+        keys_emb_list = self.keys_feature_plan.lookup(X, self.embedding_dict)
         # [batch_size, max_len, dim]
         keys_emb = concat_fun(keys_emb_list)
 
-        keys_length_feature_name = [feat.length_name for feat in self.varlen_sparse_feature_columns if
-                                    feat.length_name is not None]
         # [batch_size]
-        keys_length = torch.squeeze(maxlen_lookup(X, features, keys_length_feature_name), 1)
+        keys_length = torch.squeeze(maxlen_lookup(X, self.feature_index, self.keys_length_feature_name), 1)
 
         if self.use_negsampling:
-            neg_keys_emb_list = embedding_lookup(X, self.embedding_dict, features, neg_history_feature_columns,
-                                                 return_feat_list=neg_history_fc_names, to_list=True)
+            neg_keys_emb_list = self.neg_keys_feature_plan.lookup(X, self.embedding_dict)
             neg_keys_emb = concat_fun(neg_keys_emb_list)
         else:
             neg_keys_emb = None
@@ -172,8 +180,7 @@ class DIEN(BaseModel):
         return dnn_input_dim
 
     def _get_deep_input_emb(self, X):
-        dnn_input_emb_list = embedding_lookup(X, self.embedding_dict, self.feature_index, self.sparse_feature_columns,
-                                              mask_feat_list=self.item_features, to_list=True)
+        dnn_input_emb_list = self.sparse_feature_plan.lookup(X, self.embedding_dict)
         dnn_input_emb = concat_fun(dnn_input_emb_list)
         return dnn_input_emb.squeeze(1)
 
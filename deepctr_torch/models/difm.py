@@ -5,12 +5,11 @@ Author:
 Reference:
     [1] Lu W, Yu Y, Chang Y, et al. A Dual Input-aware Factorization Machine for CTR Prediction[C]//IJCAI. 2020: 3139-3145.(https://www.ijcai.org/Proceedings/2020/0434.pdf)
 """
-import torch
 import torch.nn as nn
 
 from .basemodel import BaseModel
 from ..inputs import combined_dnn_input, SparseFeat, VarLenSparseFeat
-from ..layers import FM, DNN, InteractingLayer, concat_fun
+from ..layers import FM, DNN, InteractingLayer
 
 
 class DIFM(BaseModel):
@@ -79,17 +78,15 @@ class DIFM(BaseModel):
         self.to(device)
 
     def forward(self, X):
-        sparse_embedding_list, _ = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                   self.embedding_dict)
-        if not len(sparse_embedding_list) > 0:
+        fm_input, _ = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns, self.embedding_dict)
+        if fm_input is None:
             raise ValueError("there are no sparse features")
 
-        att_input = concat_fun(sparse_embedding_list, axis=1)
-        att_out = self.vector_wise_net(att_input)
+        att_out = self.vector_wise_net(fm_input)
         att_out = att_out.reshape(att_out.shape[0], -1)
         m_vec = self.transform_matrix_P_vec(att_out)
 
-        dnn_input = combined_dnn_input(sparse_embedding_list, [])
+        dnn_input = combined_dnn_input(fm_input, [])
         dnn_output = self.bit_wise_net(dnn_input)
         m_bit = self.transform_matrix_P_bit(dnn_output)
 
@@ -97,7 +94,6 @@ class DIFM(BaseModel):
 
         logit = self.linear_model(X, sparse_feat_refine_weight=m_x)
 
-        fm_input = torch.cat(sparse_embedding_list, dim=1)
         refined_fm_input = fm_input * m_x.unsqueeze(-1)  # \textbf{v}_{x,i}=m_{x,i} * \textbf{v}_i
         logit += self.fm(refined_fm_input)
 
@@ -57,10 +57,22 @@ class DIN(BaseModel):
         for fc in self.varlen_sparse_feature_columns:
             feature_name = fc.name
             if feature_name in self.history_fc_names:
+                if fc.ragged:
+                    raise ValueError("Behavior sequence %s of DIN should be padded, not ragged" % feature_name)
                 self.history_feature_columns.append(fc)
             else:
                 self.sparse_varlen_feature_columns.append(fc)
 
+        # lookups of the query items, the behavior sequences and the other features, resolved once
+        self.query_feature_plan = FeaturePlan(
+            [fc for fc in self.sparse_feature_columns if fc.name in history_feature_list], self.feature_index,
+            device=device)
+        self.keys_feature_plan = FeaturePlan(self.history_feature_columns, self.feature_index, device=device)
+        self.sparse_feature_plan = FeaturePlan(self.sparse_feature_columns, self.feature_index, device=device)
+        self.varlen_feature_plan = FeaturePlan(self.sparse_varlen_feature_columns, self.feature_index, device=device)
+        self.keys_length_feature_name = [feat.length_name for feat in self.varlen_sparse_feature_columns if
+                                         feat.length_name is not None]
+
         att_emb_dim = self._compute_interest_dim()
 
         self.attention = AttentionSequencePoolingLayer(att_hidden_units=att_hidden_size,
@@ -81,21 +93,14 @@ class DIN(BaseModel):
 
 
     def forward(self, X):
-        _, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns, self.embedding_dict)
+        dense_value_list = self.dnn_feature_plan.dense_values(X)
 
         # sequence pooling part
-        query_emb_list = embedding_lookup(X, self.embedding_dict, self.feature_index, self.sparse_feature_columns,
-                                          return_feat_list=self.history_feature_list, to_list=True)
-        keys_emb_list = embedding_lookup(X, self.embedding_dict, self.feature_index, self.history_feature_columns,
-                                         return_feat_list=self.history_fc_names, to_list=True)
-        dnn_input_emb_list = embedding_lookup(X, self.embedding_dict, self.feature_index, self.sparse_feature_columns,
-                                              to_list=True)
-
-        sequence_embed_dict = varlen_embedding_lookup(X, self.embedding_dict, self.feature_index,
-                                                      self.sparse_varlen_feature_columns)
+        query_emb_list = self.query_feature_plan.lookup(X, self.embedding_dict)
+        keys_emb_list = self.keys_feature_plan.lookup(X, self.embedding_dict)
+        dnn_input_emb_list = self.sparse_feature_plan.lookup(X, self.embedding_dict)
 
-        sequence_embed_list = get_varlen_pooling_list(sequence_embed_dict, X, self.feature_index,
-                                                      self.sparse_varlen_feature_columns, self.device)
+        sequence_embed_list = self.varlen_feature_plan.varlen_embeddings(X, self.embedding_dict)
 
         dnn_input_emb_list += sequence_embed_list
         deep_input_emb = torch.cat(dnn_input_emb_list, dim=-1)
@@ -104,9 +109,7 @@ class DIN(BaseModel):
         query_emb = torch.cat(query_emb_list, dim=-1)                     # [B, 1, E]
         keys_emb = torch.cat(keys_emb_list, dim=-1)                       # [B, T, E]
 
-        keys_length_feature_name = [feat.length_name for feat in self.varlen_sparse_feature_columns if
-                                    feat.length_name is not None]
-        keys_length = torch.squeeze(maxlen_lookup(X, self.feature_index, keys_length_feature_name), 1)  # [B, 1]
+        keys_length = torch.squeeze(maxlen_lookup(X, self.feature_index, self.keys_length_feature_name), 1)  # [B, 1]
 
         hist = self.attention(query_emb, keys_emb, keys_length)           # [B, 1, E]
 
@@ -74,9 +74,8 @@ class FiBiNET(BaseModel):
         return input_dim
 
     def forward(self, X):
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
-        sparse_embedding_input = torch.cat(sparse_embedding_list, dim=1)
+        sparse_embedding_input, dense_value_list = self.stacked_input_from_feature_columns(
+            X, self.dnn_feature_columns, self.embedding_dict)
 
         senet_output = self.SE(sparse_embedding_input)
         senet_bilinear_out = self.Bilinear(senet_output)
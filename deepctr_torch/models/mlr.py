@@ -10,7 +10,7 @@ import torch
 import torch.nn as nn
 
 from .basemodel import Linear, BaseModel
-from ..inputs import build_input_features
+from ..inputs import build_typed_input_features, get_sparse_input_dtype, get_hash_features
 from ..layers import PredictionLayer
 
 
@@ -55,7 +55,11 @@ class MLR(BaseModel):
         if bias_feature_columns is None:
             self.bias_feature_columns = []
 
-        self.feature_index = build_input_features(
+        self.feature_index = build_typed_input_features(
+            self.region_feature_columns + self.base_feature_columns + self.bias_feature_columns)
+        self.sparse_input_dtype = get_sparse_input_dtype(
+            self.region_feature_columns + self.base_feature_columns + self.bias_feature_columns)
+        self.hash_features = get_hash_features(
             self.region_feature_columns + self.base_feature_columns + self.bias_feature_columns)
 
         self.region_linear_model = nn.ModuleList([Linear(
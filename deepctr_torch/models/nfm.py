@@ -5,7 +5,6 @@ Author:
 Reference:
     [1] He X, Chua T S. Neural factorization machines for sparse predictive analytics[C]//Proceedings of the 40th International ACM SIGIR conference on Research and Development in Information Retrieval. ACM, 2017: 355-364. (https://arxiv.org/abs/1708.05027)
 """
-import torch
 import torch.nn as nn
 
 from .basemodel import BaseModel
@@ -59,10 +58,9 @@ class NFM(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
+        fm_input, dense_value_list = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                             self.embedding_dict)
         linear_logit = self.linear_model(X)
-        fm_input = torch.cat(sparse_embedding_list, dim=1)
         bi_out = self.bi_pooling(fm_input)
         if self.bi_dropout:
             bi_out = self.dropout(bi_out)
@@ -7,7 +7,7 @@ Reference:
 """
 
 from .basemodel import *
-from ..inputs import combined_dnn_input
+from ..inputs import combined_dnn_input, get_feature_input
 from ..layers import DNN
 
 
@@ -71,6 +71,11 @@ class ONN(BaseModel):
 
         # add regularization for second_order_embedding
         self.add_regularization_weight(self.second_order_embedding_dict.parameters(), l2=l2_reg_embedding)
+        # the two tables of a pair are looked up by the first and the second feature of the pair
+        for name, interac in self.second_order_embedding_dict.items():
+            first_name, second_name = self.__second_order_pairs[name]
+            self.lookup_features.setdefault(interac.emb1.weight, []).append((first_name, 0))
+            self.lookup_features.setdefault(interac.emb2.weight, []).append((second_name, 0))
 
         dim = self.__compute_nffm_dnn_dim(
             feature_columns=dnn_feature_columns, embedding_size=embedding_size)
@@ -102,21 +107,15 @@ class ONN(BaseModel):
         :param second_order_embedding_dict: ex: {'A1+A2': Interac model} created by function create_second_order_embedding_matrix
         :return:
         '''
-        sparse_feature_columns = list(
-            filter(lambda x: isinstance(x, SparseFeat), feature_columns)) if len(feature_columns) else []
+        # the pairs of `feature_columns` are resolved once by `__create_second_order_embedding_matrix`
         second_order_embedding_list = []
-        for first_index in range(len(sparse_feature_columns) - 1):
-            for second_index in range(first_index + 1, len(sparse_feature_columns)):
-                first_name = sparse_feature_columns[first_index].embedding_name
-                second_name = sparse_feature_columns[second_index].embedding_name
-                second_order_embedding_list.append(
-                    second_order_embedding_dict[first_name + "+" + second_name](
-                        X[:, self.feature_index[first_name][0]
-                             :self.feature_index[first_name][1]].long(),
-                        X[:, self.feature_index[second_name][0]
-                             :self.feature_index[second_name][1]].long()
-                    )
+        for name, (first_name, second_name) in self.__second_order_pairs.items():
+            second_order_embedding_list.append(
+                second_order_embedding_dict[name](
+                    get_feature_input(X, self.feature_index, first_name),
+                    get_feature_input(X, self.feature_index, second_name)
                 )
+            )
         return second_order_embedding_list
 
     def __create_second_order_embedding_matrix(self, feature_columns, embedding_size, init_std=0.0001, sparse=False):
@@ -124,10 +123,12 @@ class ONN(BaseModel):
         sparse_feature_columns = list(
             filter(lambda x: isinstance(x, SparseFeat), feature_columns)) if len(feature_columns) else []
         temp_dict = {}
+        self.__second_order_pairs = {}
         for first_index in range(len(sparse_feature_columns) - 1):
             for second_index in range(first_index + 1, len(sparse_feature_columns)):
                 first_name = sparse_feature_columns[first_index].embedding_name
                 second_name = sparse_feature_columns[second_index].embedding_name
+                self.__second_order_pairs[first_name + "+" + second_name] = (first_name, second_name)
                 temp_dict[first_name + "+" + second_name] = Interac(sparse_feature_columns[first_index].vocabulary_size,
                                                                     sparse_feature_columns[
                                                                         second_index].vocabulary_size,
@@ -138,8 +139,7 @@ class ONN(BaseModel):
 
     def forward(self, X):
 
-        _, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                              self.embedding_dict)
+        dense_value_list = self.dnn_feature_plan.dense_values(X)
         linear_logit = self.linear_model(X)
         spare_second_order_embedding_list = self.__input_from_second_order_column(X, self.dnn_feature_columns,
                                                                                   self.second_order_embedding_dict)
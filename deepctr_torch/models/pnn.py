@@ -11,7 +11,7 @@ import torch.nn as nn
 
 from .basemodel import BaseModel
 from ..inputs import combined_dnn_input
-from ..layers import DNN, concat_fun, InnerProductLayer, OutterProductLayer
+from ..layers import DNN, InnerProductLayer, OutterProductLayer
 
 
 class PNN(BaseModel):
@@ -77,17 +77,17 @@ class PNN(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
-        linear_signal = torch.flatten(
-            concat_fun(sparse_embedding_list), start_dim=1)
+        # batch * field * k, shared by the linear signal and the product layers
+        sparse_embedding, dense_value_list = self.stacked_input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                                     self.embedding_dict)
+        linear_signal = torch.flatten(sparse_embedding, start_dim=1)
 
         if self.use_inner:
             inner_product = torch.flatten(
-                self.innerproduct(sparse_embedding_list), start_dim=1)
+                self.innerproduct(sparse_embedding), start_dim=1)
 
         if self.use_outter:
-            outer_product = self.outterproduct(sparse_embedding_list)
+            outer_product = self.outterproduct(sparse_embedding)
 
         if self.use_outter and self.use_inner:
             product_layer = torch.cat(
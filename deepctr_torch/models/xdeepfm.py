@@ -6,7 +6,6 @@ Reference:
     [1] Guo H, Tang R, Ye Y, et al. Deepfm: a factorization-machine based neural network for ctr prediction[J]. arXiv preprint arXiv:1703.04247, 2017.(https://arxiv.org/abs/1703.04247)
 """
 
-import torch
 import torch.nn as nn
 
 from .basemodel import BaseModel
@@ -35,6 +34,8 @@ class xDeepFM(BaseModel):
     :param task: str, ``"binary"`` for  binary logloss or  ``"regression"`` for regression loss
     :param device: str, ``"cpu"`` or ``"cuda:0"``
     :param gpus: list of int or torch.device for multiple gpus. If None, run on `device`. `gpus[0]` should be the same gpu with `device`.
+    :param cin_chunk_size: positive integer or None. If set, CIN builds the outer product of each layer with the input fields for at most ``cin_chunk_size`` of its fields at a time, which bounds its memory.
+    :param cin_checkpoint: bool. Whether CIN recomputes the outer products in the backward pass instead of keeping them.
     :return: A PyTorch model instance.
 
     """
@@ -42,7 +43,8 @@ class xDeepFM(BaseModel):
     def __init__(self, linear_feature_columns, dnn_feature_columns, dnn_hidden_units=(256, 256),
                  cin_layer_size=(256, 128,), cin_split_half=True, cin_activation='relu', l2_reg_linear=0.00001,
                  l2_reg_embedding=0.00001, l2_reg_dnn=0, l2_reg_cin=0, init_std=0.0001, seed=1024, dnn_dropout=0,
-                 dnn_activation='relu', dnn_use_bn=False, task='binary', device='cpu', gpus=None):
+                 dnn_activation='relu', dnn_use_bn=False, task='binary', device='cpu', gpus=None, cin_chunk_size=None,
+                 cin_checkpoint=False):
 
         super(xDeepFM, self).__init__(linear_feature_columns, dnn_feature_columns, l2_reg_linear=l2_reg_linear,
                                       l2_reg_embedding=l2_reg_embedding, init_std=init_std, seed=seed, task=task,
@@ -69,7 +71,8 @@ class xDeepFM(BaseModel):
             else:
                 self.featuremap_num = sum(cin_layer_size)
             self.cin = CIN(field_num, cin_layer_size,
-                           cin_activation, cin_split_half, l2_reg_cin, seed, device=device)
+                           cin_activation, cin_split_half, l2_reg_cin, seed, device=device, chunk_size=cin_chunk_size,
+                           use_checkpoint=cin_checkpoint)
             self.cin_linear = nn.Linear(self.featuremap_num, 1, bias=False).to(device)
             self.add_regularization_weight(filter(lambda x: 'weight' in x[0], self.cin.named_parameters()),
                                            l2=l2_reg_cin)
@@ -78,13 +81,17 @@ class xDeepFM(BaseModel):
 
     def forward(self, X):
 
-        sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
-                                                                                  self.embedding_dict)
+        if self.use_cin:
+            # CIN requires one embedding_dim, so the embeddings come as one (batch_size, num_features, dim) tensor
+            sparse_embedding_list, dense_value_list = self.stacked_input_from_feature_columns(
+                X, self.dnn_feature_columns, self.embedding_dict)
+        else:
+            sparse_embedding_list, dense_value_list = self.input_from_feature_columns(X, self.dnn_feature_columns,
+                                                                                      self.embedding_dict)
 
         linear_logit = self.linear_model(X)
         if self.use_cin:
-            cin_input = torch.cat(sparse_embedding_list, dim=1)
-            cin_output = self.cin(cin_input)
+            cin_output = self.cin(sparse_embedding_list)
             cin_logit = self.cin_linear(cin_output)
         if self.use_dnn:
             dnn_input = combined_dnn_input(sparse_embedding_list, dense_value_list)
@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+"""
+Author:
+    Weichen Shen,weichenswc@163.com
+"""
+import torch
+
+
+class RowWiseAdagrad(torch.optim.Optimizer):
+    """Adagrad with one accumulator per row of the embedding tables.
+
+    The accumulator of a row is the running sum of the mean squared gradient of its elements, so the optimizer
+    state of a ``(num_rows, embedding_dim)`` table is ``num_rows`` scalars instead of a copy of the table. Sparse
+    gradients only read and update the accumulators and weights of the rows of the batch.
+
+    :param params: iterable of parameters or dicts defining parameter groups.
+    :param lr: float, learning rate.
+    :param lr_decay: float, learning rate decay.
+    :param weight_decay: float, L2 penalty, not supported with sparse gradients.
+    :param initial_accumulator_value: float, initial value of the accumulators.
+    :param eps: float, term added to the denominator.
+    :param rowwise: bool, one accumulator per row of 2-D parameters, or one per element as in ``torch.optim.Adagrad``.
+        1-D parameters always have one accumulator per element. Can be set per parameter group.
+    """
+
+    def __init__(self, params, lr=0.01, lr_decay=0, weight_decay=0, initial_accumulator_value=0, eps=1e-10,
+                 rowwise=True):
+        if lr < 0.0:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        defaults = dict(lr=lr, lr_decay=lr_decay, weight_decay=weight_decay,
+                        initial_accumulator_value=initial_accumulator_value, eps=eps, rowwise=rowwise)
+        super(RowWiseAdagrad, self).__init__(params, defaults)
+
+    def _init_state(self, p, group):
+        state = self.state[p]
+        state['step'] = 0
+        shape = p.shape[:1] if group['rowwise'] and p.dim() == 2 else p.shape
+        state['sum'] = torch.full(shape, group['initial_accumulator_value'], dtype=p.dtype, device=p.device)
+        return state
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for group in self.param_groups:
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+                grad = p.grad
+                state = self.state[p] if len(self.state[p]) > 0 else self._init_state(p, group)
+                state['step'] += 1
+                clr = group['lr'] / (1 + (state['step'] - 1) * group['lr_decay'])
+                rowwise = state['sum'].dim() < p.dim()
+
+                if grad.is_sparse:
+                    if group['weight_decay'] != 0:
+                        raise RuntimeError("weight_decay option is not compatible with sparse gradients")
+                    # only the rows of the batch are read and written
+                    grad = grad.coalesce()
+                    rows, values = grad._indices()[0], grad._values()
+                    if rowwise:
+                        state['sum'].index_add_(0, rows, (values * values).mean(dim=1))
+                        std = state['sum'][rows].sqrt().add_(group['eps']).unsqueeze(1)
+                    else:
+                        state['sum'].index_add_(0, rows, values * values)
+                        std = state['sum'][rows].sqrt().add_(group['eps'])
+                    p.index_add_(0, rows, values / std * -clr)
+                    continue
+
+                if group['weight_decay'] != 0:
+                    grad = grad + group['weight_decay'] * p
+                if rowwise:
+                    state['sum'].add_((grad * grad).mean(dim=1))
+                    std = state['sum'].sqrt().add_(group['eps']).unsqueeze(1)
+                else:
+                    state['sum'].add_(grad * grad)
+                    std = state['sum'].sqrt().add_(group['eps'])
+                p.sub_(clr * grad / std)
+
+        return loss
+
+
+class MultiOptimizer(object):
+    """Several optimizers stepped together, each over its own parameters.
+
+    It is used by ``BaseModel.compile`` to train the embedding tables with sparse gradients and the rest of the
+    model with a dense optimizer. Learning rate schedulers should be attached to the wrapped ``optimizers``.
+
+    :param optimizers: list of ``torch.optim.Optimizer`` over disjoint parameters.
+    """
+
+    def __init__(self, optimizers):
+        self.optimizers = list(optimizers)
+
+    @property
+    def param_groups(self):
+        return [group for optimizer in self.optimizers for group in optimizer.param_groups]
+
+    def zero_grad(self, *args, **kwargs):
+        for optimizer in self.optimizers:
+            optimizer.zero_grad(*args, **kwargs)
+
+    def step(self, closure=None):
+        # the closure is evaluated once for all the optimizers, so those that re-evaluate it, like LBFGS, can not be
+        # wrapped
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for optimizer in self.optimizers:
+            optimizer.step()
+        return loss
+
+    def state_dict(self):
+        return {"optimizers": [optimizer.state_dict() for optimizer in self.optimizers]}
+
+    def load_state_dict(self, state_dict):
+        if len(state_dict["optimizers"]) != len(self.optimizers):
+            raise ValueError("The state holds {0} optimizers, but {1} are wrapped".format(
+                len(state_dict["optimizers"]), len(self.optimizers)))
+        for optimizer, optimizer_state in zip(self.optimizers, state_dict["optimizers"]):
+            optimizer.load_state_dict(optimizer_state)
@@ -0,0 +1,254 @@
+# -*- coding:utf-8 -*-
+"""
+Author:
+    Weichen Shen,weichenswc@163.com
+"""
+import json
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+
+from .data import hash_ids
+from .inputs import SparseFeat, VarLenSparseFeat
+
+
+def _as_keys(values):
+    # raw ids are compared either as integers or as strings
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        return values.astype(np.int64)
+    return values.astype(np.str_)
+
+
+def _as_keys_like(values, keys):
+    # raw ids with the kind (integer or string) of the vocabulary keys, strings are never truncated
+    values = _as_keys(values)
+    if len(keys) == 0 or values.dtype.kind == keys.dtype.kind:
+        return values
+    if keys.dtype.kind == "i":
+        return values.astype(np.int64)
+    return values.astype(np.str_)
+
+
+def _is_sequence_column(values):
+    return values.dtype.kind == "O" and len(values) > 0 and isinstance(values[0], (list, tuple, np.ndarray))
+
+
+def flatten_sequences(values, sep=None):
+    """Flatten a multi-value column into one array of raw ids and the number of ids of every row.
+
+    :param values: array-like of strings joined by ``sep``, or of lists of ids.
+    :param sep: str, separator of the ids in a row, or None if the rows are already lists.
+    :return: tuple ``(ids, lengths)``.
+    """
+    if sep is not None:
+        values = [str(row).split(sep) for row in values]
+    lengths = np.fromiter((len(row) for row in values), dtype=np.int64, count=len(values))
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.str_), lengths
+    return _as_keys(np.concatenate([np.asarray(row) for row in values if len(row) > 0])), lengths
+
+
+def count_ids(values, sep=None):
+    """Count the distinct raw ids of a column, vectorised with ``np.unique``.
+
+    :param values: array-like of ids, or a multi-value column (see ``flatten_sequences``).
+    :param sep: str, separator of multi-value strings.
+    :return: tuple ``(keys, counts)``.
+    """
+    values = np.asarray(values)
+    if sep is not None or _is_sequence_column(values):
+        values, _ = flatten_sequences(values, sep)
+    return np.unique(_as_keys(values).ravel(), return_counts=True)
+
+
+def _merge_counts(keys_list, counts_list):
+    keys, inverse = np.unique(np.concatenate(keys_list), return_inverse=True)
+    return keys, np.bincount(inverse, weights=np.concatenate(counts_list)).astype(np.int64)
+
+
+class Vocabulary(object):
+    """Mapping of the raw ids of a feature to embedding indices, with a frequency cut-off and OOV buckets.
+
+    Indices are laid out as: ``0`` for padding, ``[1, num_oov_buckets]`` for out-of-vocabulary ids, then the
+    kept ids from the most to the least frequent. Ids seen less than ``min_freq`` times, or beyond the
+    ``max_size`` most frequent ones, fall into the OOV buckets (hashed into one of them if there are several).
+
+    :param name: str, feature name.
+    :param min_freq: int, minimum number of occurrences of an id to get its own index.
+    :param max_size: int or None, maximum number of kept ids.
+    :param num_oov_buckets: int, number of indices shared by out-of-vocabulary ids.
+    :param sep: str or None, separator of the ids of a multi-value (``VarLenSparseFeat``) string feature.
+    """
+
+    def __init__(self, name, min_freq=1, max_size=None, num_oov_buckets=1, sep=None):
+        if num_oov_buckets < 1:
+            raise ValueError("num_oov_buckets must be at least 1")
+        self.name = name
+        self.min_freq = min_freq
+        self.max_size = max_size
+        self.num_oov_buckets = num_oov_buckets
+        self.sep = sep
+        self.counts = None
+        self.keys = np.empty(0, dtype=np.int64)
+        self.key_counts = np.empty(0, dtype=np.int64)
+        self._lookup = None
+
+    @property
+    def vocabulary_size(self):
+        return 1 + self.num_oov_buckets + len(self.keys)
+
+    def update(self, values):
+        """Count the ids of one chunk of raw data."""
+        return self.update_counts(*count_ids(values, self.sep))
+
+    def update_counts(self, keys, counts):
+        """Add the counts of ``keys``, e.g. computed by ``count_ids`` in another process."""
+        if self.counts is not None:
+            keys, counts = _merge_counts([self.counts[0], keys], [self.counts[1], counts])
+        self.counts = (keys, counts)
+        self._select_keys()
+        return self
+
+    def fit(self, values):
+        self.counts = None
+        return self.update(values)
+
+    def _select_keys(self):
+        keys, counts = self.counts
+        keep = counts >= self.min_freq
+        keys, counts = keys[keep], counts[keep]
+        # most frequent first, stable on the sorted keys
+        order = np.argsort(-counts, kind="mergesort")
+        if self.max_size is not None:
+            order = order[:self.max_size]
+        self.keys, self.key_counts = keys[order], counts[order]
+        self._lookup = None
+
+    def encode(self, values):
+        """Map raw ids to indices, vectorised with a binary search over the sorted vocabulary.
+
+        :param values: array-like of raw ids, of any shape.
+        :return: int64 array of indices with the shape of ``values``.
+        """
+        if self._lookup is None:
+            order = np.argsort(self.keys, kind="mergesort")
+            self._lookup = (self.keys[order], order.astype(np.int64) + 1 + self.num_oov_buckets)
+        sorted_keys, sorted_index = self._lookup
+
+        keys = _as_keys_like(values, sorted_keys)
+        if self.num_oov_buckets > 1:
+            index = 1 + hash_ids(keys, self.num_oov_buckets)
+        else:
+            index = np.ones(keys.shape, dtype=np.int64)
+        if len(sorted_keys) > 0:
+            position = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+            found = sorted_keys[position] == keys
+            index[found] = sorted_index[position[found]]
+        return index
+
+    def encode_sequences(self, values):
+        """Map a multi-value column to indices.
+
+        :param values: array-like of strings joined by ``sep``, or of lists of raw ids.
+        :return: tuple ``(ids, lengths)``, the indices of all rows concatenated and the number of ids of every row.
+        """
+        ids, lengths = flatten_sequences(values, self.sep)
+        return self.encode(ids), lengths
+
+    def oov_rate(self):
+        """Fraction of the counted occurrences mapped to the OOV buckets."""
+        if self.counts is None:
+            return 0.
+        return 1 - float(self.key_counts.sum()) / max(self.counts[1].sum(), 1)
+
+    def sparse_feat(self, embedding_dim=4, **kwargs):
+        """Return the ``SparseFeat`` of this vocabulary, ``kwargs`` are passed to ``SparseFeat``."""
+        return SparseFeat(self.name, self.vocabulary_size, embedding_dim, **kwargs)
+
+    def varlen_sparse_feat(self, maxlen, embedding_dim=4, combiner="mean", length_name=None, ragged=False,
+                           **kwargs):
+        """Return the ``VarLenSparseFeat`` of this vocabulary, ``kwargs`` are passed to ``SparseFeat``."""
+        return VarLenSparseFeat(self.sparse_feat(embedding_dim, **kwargs), maxlen, combiner, length_name, ragged)
+
+    def get_config(self):
+        return {"name": self.name, "min_freq": self.min_freq, "max_size": self.max_size,
+                "num_oov_buckets": self.num_oov_buckets, "sep": self.sep}
+
+
+def build_vocabularies(data, vocabularies, num_workers=0):
+    """Count the ids of several features over chunks of data, in parallel processes.
+
+    :param data: a dict of arrays or a pandas DataFrame, or an iterable of them, e.g.
+        ``pd.read_csv(path, chunksize=1000000)``. At most one chunk per worker is held in memory.
+    :param vocabularies: list of ``Vocabulary``, updated in place.
+    :param num_workers: int, number of worker processes counting chunks, 0 counts in the main process.
+    :return: ``vocabularies``.
+    """
+    if isinstance(data, dict) or hasattr(data, "columns"):
+        data = [data]
+    specs = [(vocab.name, vocab.sep) for vocab in vocabularies]
+    # send only the needed columns to the workers
+    chunks = ({name: np.asarray(chunk[name]) for name, _ in specs} for chunk in data)
+
+    pool = Pool(num_workers) if num_workers > 0 else None
+    counts = [([], []) for _ in vocabularies]
+    try:
+        while True:
+            # read one chunk per worker at a time, `Pool.imap` would read the whole iterable ahead
+            window = list(islice(chunks, max(num_workers, 1)))
+            if len(window) == 0:
+                break
+            if pool is not None:
+                results = pool.map(partial(_count_chunk, specs=specs), window)
+            else:
+                results = [_count_chunk(chunk, specs) for chunk in window]
+            for result in results:
+                for (keys, key_counts), (keys_list, counts_list) in zip(result, counts):
+                    keys_list.append(keys)
+                    counts_list.append(key_counts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    for vocab, (keys_list, counts_list) in zip(vocabularies, counts):
+        if len(keys_list) > 0:
+            vocab.update_counts(*_merge_counts(keys_list, counts_list))
+    return vocabularies
+
+
+def _count_chunk(chunk, specs):
+    return [count_ids(chunk[name], sep) for name, sep in specs]
+
+
+def save_vocabularies(path, vocabularies):
+    """Save vocabularies into a single compressed ``.npz`` file, only the kept ids and their counts are stored.
+
+    :param path: str, file path.
+    :param vocabularies: list of ``Vocabulary``.
+    """
+    arrays = {"config": np.array(json.dumps([vocab.get_config() for vocab in vocabularies]))}
+    for i, vocab in enumerate(vocabularies):
+        arrays["keys_%d" % i] = vocab.keys
+        arrays["counts_%d" % i] = vocab.key_counts
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+
+
+def load_vocabularies(path):
+    """Load vocabularies saved by ``save_vocabularies``.
+
+    :param path: str, file path.
+    :return: OrderedDict ``{feature_name: Vocabulary}`` in the saved order.
+    """
+    vocabularies = OrderedDict()
+    with np.load(path) as arrays:
+        for i, config in enumerate(json.loads(str(arrays["config"]))):
+            vocab = Vocabulary(**config)
+            vocab.update_counts(arrays["keys_%d" % i], arrays["counts_%d" % i])
+            vocabularies[vocab.name] = vocab
+    return vocabularies
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Compare the memory and the speed of `CIN` with field chunks and activation checkpointing, versus `layer_size` and
+the field count.
+
+Without chunks every layer builds a (batch, hidden fields * fields, k) outer product, which is kept for the backward
+pass. `chunk_size` bounds it to (batch, chunk_size * fields, k) and `use_checkpoint` recomputes it in the backward pass
+instead of keeping it. A forward and backward step is timed for each setting, and the peak memory is measured on cuda
+(on cpu the size of the largest outer product is reported).
+"""
+import time
+
+import torch
+
+from deepctr_torch.layers import CIN
+
+BATCH_SIZE = 1024
+EMBEDDING_SIZE = 8
+STEPS = 10
+SETTINGS = [(None, False), (None, True), (16, False), (16, True)]
+
+
+def run(layer, inputs, device):
+    if 'cuda' in device:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.time()
+    for _ in range(STEPS):
+        layer.zero_grad()
+        layer(inputs).sum().backward()
+    if 'cuda' in device:
+        torch.cuda.synchronize()
+        peak = "{0:8.1f} MB".format(torch.cuda.max_memory_allocated() / 2 ** 20)
+    else:
+        peak = "     n/a"
+    return (time.time() - start) / STEPS * 1000, peak
+
+
+if __name__ == "__main__":
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    for layer_size in [(128, 128), (256, 256)]:
+        for field_size in [13, 26, 39]:
+            inputs = torch.randn(BATCH_SIZE, field_size, EMBEDDING_SIZE, device=device, requires_grad=True)
+            hidden_size = max([field_size] + [size // 2 for size in layer_size[:-1]])
+            for chunk_size, use_checkpoint in SETTINGS:
+                layer = CIN(field_size, layer_size, chunk_size=chunk_size, use_checkpoint=use_checkpoint,
+                            device=device)
+                chunk = min(chunk_size or hidden_size, hidden_size)
+                intermediate = BATCH_SIZE * chunk * field_size * EMBEDDING_SIZE * 4 / 2 ** 20
+                step_time, peak = run(layer, inputs, device)
+                print("layer_size {0} fields {1:3d} chunk_size {2!s:>4} checkpoint {3!s:>5}: {4:8.2f} ms/step, "
+                      "peak {5} (outer product {6:8.1f} MB)".format(layer_size, field_size, chunk_size, use_checkpoint,
+                                                                    step_time, peak, intermediate))
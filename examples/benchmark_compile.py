@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Compare the throughput of DeepFM on the criteo sample in eager mode, with `torch.compile` and traced with TorchScript.
+
+The sample is tiled to get a meaningful number of batches, then one pass over the data is timed for
+  - the inference step, eager, `compile(..., jit_compile=True)` and `to_torchscript`,
+  - the training step, eager and `compile(..., jit_compile=True)`.
+A warm-up pass is run first, so that the compilation time is not counted.
+"""
+import time
+from itertools import chain
+
+import torch
+import torch.nn.functional as F
+
+from benchmark_batch_iterator import load_criteo_sample, BATCH_SIZE
+from deepctr_torch.models import DeepFM
+
+
+def device_batches(model, x, y):
+    loader = model._get_batch_loader(x, y, BATCH_SIZE)
+    return list(model._device_batches(loader))
+
+
+def run_inference(forward, batches):
+    start = time.time()
+    num_samples = 0
+    with torch.no_grad():
+        for x, _ in batches:
+            forward(x)
+            num_samples += x.sparse.shape[0]
+    return num_samples / (time.time() - start)
+
+
+def run_training(model, batches):
+    forward = model._compiled()
+    start = time.time()
+    num_samples = 0
+    for x, y in batches:
+        model.optim.zero_grad()
+        loss = F.binary_cross_entropy(forward(x).squeeze(), y.float(), reduction='sum')
+        loss.backward()
+        model.optim.step()
+        num_samples += y.shape[0]
+    return num_samples / (time.time() - start)
+
+
+if __name__ == "__main__":
+    x, y, feature_columns = load_criteo_sample()
+    model = DeepFM(feature_columns, feature_columns, task='binary', device='cpu')
+    batches = device_batches(model, x, y)
+
+    model.compile("adagrad", "binary_crossentropy")
+    traced = model.to_torchscript(x, batch_size=BATCH_SIZE)
+    model.eval()
+    results = [("eager", lambda batch: model(batch)),
+               ("torchscript", lambda batch: traced(*(tuple(batch[:3]) + tuple(chain.from_iterable(batch.ragged)))))]
+    if hasattr(torch, "compile"):
+        compiled = torch.compile(model)
+        results.append(("torch.compile", compiled))
+    # the last batch of the tiled sample can be smaller than the traced one
+    batches = [batch for batch in batches if batch[0].sparse.shape[0] == BATCH_SIZE]
+    for name, forward in results:
+        run_inference(forward, batches[:10])
+        print("{0:>14} inference: {1:10.0f} samples/s".format(name, run_inference(forward, batches)))
+
+    for jit_compile in [False, True] if hasattr(torch, "compile") else [False]:
+        model = DeepFM(feature_columns, feature_columns, task='binary', device='cpu')
+        model.compile("adagrad", "binary_crossentropy", jit_compile=jit_compile)
+        model.train()
+        run_training(model, batches[:10])
+        print("{0:>14} training:  {1:10.0f} samples/s".format("torch.compile" if jit_compile else "eager",
+                                                              run_training(model, batches)))
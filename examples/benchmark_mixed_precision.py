@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Compare the throughput of float32 and bfloat16 autocast (`compile(..., mixed_precision='bfloat16')`) on the criteo
+sample, for models whose cost is in the DNN towers and the interaction layers.
+
+Bfloat16 pays off on cores with native bfloat16 instructions (e.g. AVX512-BF16 or AMX), on other cpus the conversions
+can make it slower than float32.
+"""
+import time
+
+import torch
+
+from benchmark_batch_iterator import load_criteo_sample, BATCH_SIZE
+from deepctr_torch.models import DeepFM, xDeepFM, AutoInt, DCN
+
+if __name__ == "__main__":
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    x, y, feature_columns = load_criteo_sample()
+    for model_class in [DeepFM, xDeepFM, AutoInt, DCN]:
+        for mixed_precision in [None, "bfloat16"]:
+            model = model_class(feature_columns, feature_columns, dnn_hidden_units=(256, 128), device=device)
+            model.compile("adagrad", "binary_crossentropy", mixed_precision=mixed_precision)
+            model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0)  # warm-up
+            start = time.time()
+            model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0)
+            train = len(y) / (time.time() - start)
+            start = time.time()
+            model.predict(x, batch_size=BATCH_SIZE)
+            predict = len(y) / (time.time() - start)
+            print("{0:>8} {1:>9}: train {2:10.0f} samples/s, predict {3:10.0f} samples/s".format(
+                model_class.__name__, mixed_precision or "float32", train, predict))
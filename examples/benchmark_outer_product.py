@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Compare the 'mat' kernel of `OutterProductLayer` with the elementwise form it replaces, versus the field count.
+
+The elementwise form materialises a (batch, k, pairs, k) tensor, the layer computes one (batch x k) @ (k x k) product
+per pair instead, whose largest intermediate is (pairs, batch, k). A forward and backward step is timed for both, and
+the memory is reported three ways:
+  - the peak memory of the step, on cuda only,
+  - the largest single allocation of an operator in the step, from the memory profile of the autograd profiler, on any
+    device,
+  - the theoretical size of the largest intermediate of each form.
+"""
+import time
+
+import torch
+
+from deepctr_torch.layers import OutterProductLayer
+
+BATCH_SIZE = 256
+EMBEDDING_SIZE = 8
+STEPS = 10
+
+
+def elementwise_mat(layer, inputs):
+    p, q = layer.pair_index.pairs(inputs)
+    return torch.sum(torch.sum(p.unsqueeze(1) * layer.kernel, dim=-1).transpose(2, 1) * q, dim=-1)
+
+
+def run(forward, layer, inputs, device):
+    if 'cuda' in device:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.time()
+    for _ in range(STEPS):
+        layer.zero_grad()
+        forward(layer, inputs).sum().backward()
+    if 'cuda' in device:
+        torch.cuda.synchronize()
+        peak = "{0:8.1f} MB".format(torch.cuda.max_memory_allocated() / 2 ** 20)
+    else:
+        peak = "     n/a"
+    return (time.time() - start) / STEPS * 1000, peak
+
+
+def largest_allocation(forward, layer, inputs):
+    # MB of the largest tensor allocated by an operator during one step
+    layer.zero_grad()
+    with torch.autograd.profiler.profile(profile_memory=True) as prof:
+        forward(layer, inputs).sum().backward()
+    usage = [max(event.self_cpu_memory_usage, getattr(event, 'self_cuda_memory_usage', 0) or 0)
+             for event in prof.function_events]
+    return max(usage) / 2 ** 20
+
+
+if __name__ == "__main__":
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    for field_size in [10, 20, 40, 80]:
+        layer = OutterProductLayer(field_size, EMBEDDING_SIZE, kernel_type='mat', device=device)
+        inputs = torch.randn(BATCH_SIZE, field_size, EMBEDDING_SIZE, device=device, requires_grad=True)
+        num_pairs = field_size * (field_size - 1) // 2
+        intermediates = {"elementwise": BATCH_SIZE * EMBEDDING_SIZE * num_pairs * EMBEDDING_SIZE * 4 / 2 ** 20,
+                         "bmm": num_pairs * BATCH_SIZE * EMBEDDING_SIZE * 4 / 2 ** 20}
+        for name, forward in [("elementwise", elementwise_mat), ("bmm", lambda layer, x: layer(x))]:
+            step_time, peak = run(forward, layer, inputs, device)
+            largest = largest_allocation(forward, layer, inputs)
+            print("fields {0:3d} {1:>11}: {2:8.2f} ms/step, peak {3}, largest allocation {4:8.1f} MB "
+                  "(largest intermediate {5:8.1f} MB)".format(field_size, name, step_time, peak, largest,
+                                                             intermediates[name]))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Measure the cost of reading the training loss at every step of `fit`, with a small DeepFM on the criteo sample.
+
+The loss is summed on the device and read once per epoch by default, `log_interval=1` reads it at every step, as
+`fit` used to. The difference is the host synchronization per step, which matters most for small models and
+on accelerators.
+"""
+import time
+
+import torch
+
+from benchmark_batch_iterator import load_criteo_sample, BATCH_SIZE
+from deepctr_torch.models import DeepFM
+
+if __name__ == "__main__":
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    x, y, feature_columns = load_criteo_sample()
+    for log_interval in [1, 100, None]:
+        model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), task='binary', device=device)
+        model.compile("adagrad", "binary_crossentropy", metrics=["binary_crossentropy"])
+        model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0)  # warm-up
+        start = time.time()
+        model.fit(x, y, batch_size=BATCH_SIZE, epochs=1, verbose=0, log_interval=log_interval)
+        print("log_interval={0!s:>5}: {1:10.0f} samples/s".format(log_interval, len(y) / (time.time() - start)))
@@ -1,21 +1,10 @@
-import numpy as np
 import pandas as pd
 import torch
-from sklearn.preprocessing import LabelEncoder
-from tensorflow.python.keras.preprocessing.sequence import pad_sequences
 
-from deepctr_torch.inputs import SparseFeat, VarLenSparseFeat, get_feature_names
+from deepctr_torch.data import RaggedArray, pad_sequences
+from deepctr_torch.inputs import get_feature_names
 from deepctr_torch.models import DeepFM
-
-
-def split(x):
-    key_ans = x.split('|')
-    for key in key_ans:
-        if key not in key2index:
-            # Notice : input value 0 is a special "padding",so we do not use 0 to encode valid feature for sequence input
-            key2index[key] = len(key2index) + 1
-    return list(map(lambda x: key2index[x], key_ans))
-
+from deepctr_torch.vocabulary import Vocabulary, build_vocabularies
 
 if __name__ == "__main__":
     data = pd.read_csv("./movielens_sample.txt")
@@ -23,26 +12,27 @@ if __name__ == "__main__":
                        "gender", "age", "occupation", "zip", ]
     target = ['rating']
 
-    # 1.Label Encoding for sparse features,and process sequence features
-    for feat in sparse_features:
-        lbe = LabelEncoder()
-        data[feat] = lbe.fit_transform(data[feat])
-    # preprocess the sequence feature
+    # 1.build vocabularies for sparse features and the sequence feature
+    # Notice : index 0 is a special "padding" and index 1 is for out of vocabulary ids
+    vocabularies = build_vocabularies(data, [Vocabulary(feat) for feat in sparse_features] +
+                                      [Vocabulary('genres', sep='|')])
+    genres_vocabulary = vocabularies[-1]
 
-    key2index = {}
-    genres_list = list(map(split, data['genres'].values))
-    genres_length = np.array(list(map(len, genres_list)))
-    max_len = max(genres_length)
+    for vocab in vocabularies[:-1]:
+        data[vocab.name] = vocab.encode(data[vocab.name])
+    # preprocess the sequence feature
+    genres_list = RaggedArray.from_lengths(*genres_vocabulary.encode_sequences(data['genres']))
+    max_len = max(genres_list.lengths())
     # Notice : padding=`post`
+    # `genres_list` can also be used without padding, with `varlen_sparse_feat(..., ragged=True)`
     genres_list = pad_sequences(genres_list, maxlen=max_len, padding='post', )
 
-    # 2.count #unique features for each sparse field and generate feature config for sequence feature
+    # 2.generate feature config for sparse features and sequence feature
 
-    fixlen_feature_columns = [SparseFeat(feat, data[feat].nunique(), embedding_dim=4)
-                              for feat in sparse_features]
+    fixlen_feature_columns = [vocab.sparse_feat(embedding_dim=4) for vocab in vocabularies[:-1]]
 
-    varlen_feature_columns = [VarLenSparseFeat(SparseFeat('genres', vocabulary_size=len(
-        key2index) + 1, embedding_dim=4), maxlen=max_len, combiner='mean')]  # Notice : value 0 is for padding for sequence input feature
+    varlen_feature_columns = [genres_vocabulary.varlen_sparse_feat(maxlen=max_len, embedding_dim=4,
+                                                                   combiner='mean')]  # Notice : value 0 is for padding for sequence input feature
 
     linear_feature_columns = fixlen_feature_columns + varlen_feature_columns
     dnn_feature_columns = fixlen_feature_columns + varlen_feature_columns
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import inspect
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from deepctr_torch.data import build_feature_batch, save_columnar_dataset, ColumnarDataset, TensorBatchIterator, \
+    BackgroundPrefetcher, hash_ids, hash_collision_report, pack_sequences, pad_sequences, take_ragged, \
+    slice_feature_batch, take_feature_batch
+from deepctr_torch.inputs import SparseFeat, DenseFeat, VarLenSparseFeat, build_typed_input_features, \
+    get_sparse_input_dtype, get_feature_input, get_hash_features, FeaturePlan, create_embedding_matrix, \
+    embedding_lookup, varlen_embedding_lookup, get_varlen_pooling_list, get_dense_input
+from deepctr_torch.models import DeepFM
+from .utils import get_test_data, SAMPLE_SIZE, get_device
+
+PERSISTENT_WORKERS = 'persistent_workers' in inspect.signature(DataLoader.__init__).parameters
+
+
+def test_build_feature_batch():
+    feature_columns = [SparseFeat('user', 2 ** 41, dtype='int64'), DenseFeat('score', 2),
+                       VarLenSparseFeat(SparseFeat('hist', 10), maxlen=3, length_name='hist_length')]
+    feature_index = build_typed_input_features(feature_columns)
+    x = {'user': np.array([2 ** 40 + 1, 3]), 'score': np.array([[0.1, 0.2], [0.3, 0.4]]),
+         'hist': np.array([[1, 2, 0], [3, 0, 0]]), 'hist_length': np.array([2, 1])}
+
+    batch = build_feature_batch(x, feature_index, get_sparse_input_dtype(feature_columns))
+
+    assert tuple(batch.sparse.shape) == (2, 4) and tuple(batch.dense.shape) == (2, 2)
+    assert get_feature_input(batch, feature_index, 'user')[0, 0].item() == 2 ** 40 + 1
+    assert get_feature_input(batch, feature_index, 'hist').tolist() == [[1, 2, 0], [3, 0, 0]]
+    assert get_feature_input(batch, feature_index, 'hist_length').tolist() == [[2], [1]]
+    assert np.allclose(get_feature_input(batch, feature_index, 'score').numpy(), x['score'])
+
+
+@pytest.mark.parametrize(
+    'shuffle, block_size',
+    [(False, 1), (True, 1), (True, 4)]
+)
+def test_TensorBatchIterator(shuffle, block_size):
+    x = torch.arange(10).unsqueeze(1)
+    y = torch.arange(10) * 2
+    iterator = TensorBatchIterator([x, y], batch_size=3, shuffle=shuffle, block_size=block_size)
+    batches = list(iterator)
+
+    assert len(batches) == len(iterator) == 4
+    assert sorted(torch.cat([x_batch[:, 0] for x_batch, _ in batches]).tolist()) == list(range(10))
+    for x_batch, y_batch in batches:
+        assert (x_batch[:, 0] * 2 == y_batch).all()
+
+
+def test_columnar_dataset(tmpdir):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    path = str(tmpdir.join('columnar'))
+    save_columnar_dataset(path, x, feature_columns, y, shard_size=SAMPLE_SIZE // 2)
+
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    dataset = ColumnarDataset(path, columns=model.feature_index, batch_size=16, shuffle=True)
+    assert dataset.num_samples() == SAMPLE_SIZE
+    assert len(dataset) == 2 * 2
+
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'])
+    model.fit(dataset, epochs=2)
+    pred_ans = model.predict(ColumnarDataset(path, columns=model.feature_index, batch_size=16))
+    assert pred_ans.shape == (SAMPLE_SIZE, 1)
+
+
+def test_BackgroundPrefetcher():
+    prefetcher = BackgroundPrefetcher(range(10), max_prefetch=2, transform=lambda i: i * 2)
+    assert list(prefetcher) == list(range(0, 20, 2))
+    assert list(prefetcher) == list(range(0, 20, 2))
+
+    def failing():
+        yield 1
+        raise KeyError('broken batch')
+
+    with pytest.raises(KeyError):
+        list(BackgroundPrefetcher(failing()))
+
+
+@pytest.mark.parametrize(
+    'num_workers, persistent_workers, prefetch_batches',
+    [(0, False, 2), (2, False, 0),
+     pytest.param(2, True, 2, marks=pytest.mark.skipif(not PERSISTENT_WORKERS,
+                                                       reason='persistent_workers requires torch>=1.7'))]
+)
+def test_columnar_dataset_workers(tmpdir, num_workers, persistent_workers, prefetch_batches):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    path = str(tmpdir.join('columnar'))
+    save_columnar_dataset(path, x, feature_columns, y, shard_size=SAMPLE_SIZE // 4)
+
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'])
+    dataset = ColumnarDataset(path, columns=model.feature_index, batch_size=8)
+    model.fit(dataset, epochs=2, validation_data=dataset, num_workers=num_workers,
+              persistent_workers=persistent_workers, prefetch_batches=prefetch_batches)
+    pred_ans = model.predict(x, num_workers=num_workers, prefetch_batches=prefetch_batches)
+    assert pred_ans.shape == (SAMPLE_SIZE, 1)
+
+
+@pytest.mark.skipif(PERSISTENT_WORKERS, reason='persistent_workers is supported since torch 1.7')
+def test_columnar_dataset_persistent_workers_unsupported(tmpdir):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    path = str(tmpdir.join('columnar'))
+    save_columnar_dataset(path, x, feature_columns, y)
+
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    model.compile('adam', 'binary_crossentropy')
+    with pytest.raises(ValueError, match='torch>=1.7'):
+        model.fit(ColumnarDataset(path, columns=model.feature_index), num_workers=2, persistent_workers=True)
+
+
+def test_columnar_dataset_epochs_with_workers(tmpdir):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    path = str(tmpdir.join('columnar'))
+    save_columnar_dataset(path, x, feature_columns, y, shard_size=SAMPLE_SIZE // 8)
+    dataset = ColumnarDataset(path, batch_size=4, shuffle=True)
+    loader = DataLoader(dataset, batch_size=None, num_workers=2)
+
+    def epoch_order(epoch):
+        dataset.set_epoch(epoch)
+        return np.concatenate([batch_x['dense_feature_0'] for batch_x, _ in loader])
+
+    first = epoch_order(0)
+    assert np.array_equal(np.sort(first), np.sort(x['dense_feature_0']))
+    assert np.array_equal(epoch_order(0), first)
+    assert not np.array_equal(epoch_order(1), first)
+
+
+@pytest.mark.parametrize(
+    'values',
+    [np.array([[5, 0, 2 ** 40], [7, 7, 0]]), np.array([['a', '', 'long id'], ['b', 'b', '0']], dtype=object)]
+)
+def test_hash_ids(values):
+    buckets = hash_ids(values, 10)
+    assert buckets.shape == values.shape and buckets.dtype == np.int64
+    assert ((buckets >= 0) & (buckets < 10)).all()
+    assert buckets[1, 0] == buckets[1, 1]
+    assert (hash_ids(values, 10) == buckets).all()
+
+    masked = hash_ids(values, 10, mask_zero=True)
+    assert masked[0, 1] == 0 and masked[1, 2] == 0
+    assert ((masked[0, [0, 2]] >= 1) & (masked[0, [0, 2]] < 10)).all()
+
+
+def test_hash_features():
+    feature_columns = [SparseFeat('item', 100, use_hash=True, dtype='string'), SparseFeat('user', 10),
+                       VarLenSparseFeat(SparseFeat('hist_item', 100, use_hash=True, dtype='string',
+                                                   embedding_name='item'), maxlen=2)]
+    hash_features = get_hash_features(feature_columns)
+    assert hash_features == {'item': (100, True), 'hist_item': (100, True)}
+
+    feature_index = build_typed_input_features(feature_columns)
+    x = {'item': np.array(['x', 'y']), 'user': np.array([1, 2]), 'hist_item': np.array([['x', '0'], ['y', 'x']])}
+    batch = build_feature_batch(x, feature_index, hash_features=hash_features)
+    item = get_feature_input(batch, feature_index, 'item')[:, 0]
+    hist_item = get_feature_input(batch, feature_index, 'hist_item')
+    assert hist_item[0, 0] == item[0] and hist_item[1, 1] == item[0] and hist_item[0, 1] == 0
+    assert get_feature_input(batch, feature_index, 'user').tolist() == [[1], [2]]
+
+    report = hash_collision_report({'item': np.arange(1, 1001).astype(str), 'hist_item': x['hist_item']},
+                                   feature_columns)
+    assert report['item']['distinct_ids'] == 1000 and report['item']['used_buckets'] <= 99
+    assert 0 < report['item']['collision_rate'] < 1
+    assert report['hist_item']['distinct_ids'] == 2
+
+
+def test_pad_sequences():
+    sequences = [[1, 2, 3], [], [4, 5]]
+    packed = pack_sequences(sequences, dtype=np.int64)
+    assert packed.values.tolist() == [1, 2, 3, 4, 5] and packed.offsets.tolist() == [0, 3, 3, 5]
+    assert packed[[2, 0]].values.tolist() == [4, 5, 1, 2, 3]
+    assert packed[1:].offsets.tolist() == [0, 0, 2]
+
+    assert pad_sequences(sequences).tolist() == [[1, 2, 3], [0, 0, 0], [0, 4, 5]]
+    assert pad_sequences(packed, maxlen=2, padding='post').tolist() == [[2, 3], [0, 0], [4, 5]]
+    assert pad_sequences(sequences, maxlen=2, padding='post', truncating='post', value=-1).tolist() == [
+        [1, 2], [-1, -1], [4, 5]]
+
+    values, offsets = take_ragged(torch.tensor([1, 2, 3, 4, 5]), torch.tensor([0, 3, 3]), torch.tensor([2, 0]))
+    assert values.tolist() == [4, 5, 1, 2, 3] and offsets.tolist() == [0, 2]
+
+
+@pytest.mark.parametrize(
+    'combiner',
+    ['sum', 'mean', 'max']
+)
+def test_ragged_varlen_feature(combiner):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2,
+                                          sequence_feature=[])
+    lengths = np.random.randint(1, 5, SAMPLE_SIZE)
+    sequences = [np.random.randint(1, 10, length) for length in lengths]
+
+    def build_model(ragged):
+        varlen = VarLenSparseFeat(SparseFeat('seq', 10, embedding_dim=4), maxlen=4, combiner=combiner, ragged=ragged)
+        model = DeepFM(feature_columns + [varlen], feature_columns + [varlen], dnn_hidden_units=(8,),
+                       device=get_device())
+        model.compile('adam', 'binary_crossentropy')
+        return model
+
+    padded_x = dict(x, seq=pad_sequences(sequences, maxlen=4, padding='post'))
+    ragged_x = dict(x, seq=pack_sequences(sequences))
+    padded_pred = build_model(False).predict(padded_x, batch_size=16)
+    ragged_model = build_model(True)
+    assert np.allclose(ragged_model.predict(ragged_x, batch_size=16), padded_pred, atol=1e-6)
+
+    ragged_model.fit(ragged_x, y, batch_size=16, epochs=1, validation_split=0.5)
+
+
+def test_slice_feature_batch():
+    feature_columns = [SparseFeat('user', 10), DenseFeat('score', 1),
+                       VarLenSparseFeat(SparseFeat('hist', 10), maxlen=3, ragged=True)]
+    feature_index = build_typed_input_features(feature_columns)
+    x = {'user': np.array([1, 2, 3]), 'score': np.array([0.1, 0.2, 0.3]),
+         'hist': pack_sequences([[1, 2], [3], [4, 5, 6]])}
+    batch = build_feature_batch(x, feature_index)
+
+    tail = slice_feature_batch(batch, 1)
+    assert tail.sparse.data_ptr() == batch.sparse[1:].data_ptr()
+    assert tail.sparse[:, 0].tolist() == [2, 3]
+    values, offsets = tail.ragged[0]
+    assert values.tolist() == [3, 4, 5, 6] and offsets.tolist() == [0, 1]
+
+    rows = take_feature_batch(batch, torch.tensor([2, 0]))
+    assert rows.sparse[:, 0].tolist() == [3, 1]
+    values, offsets = rows.ragged[0]
+    assert values.tolist() == [4, 5, 6, 1, 2] and offsets.tolist() == [0, 3]
+
+
+def test_dataframe_input():
+    pd = pytest.importorskip('pandas')
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2,
+                                          sequence_feature=[])
+    data = pd.DataFrame(x)
+
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'])
+    history = model.fit(data, y, batch_size=16, epochs=1, validation_split=0.25)
+    assert 'val_binary_crossentropy' in history.history
+    assert np.allclose(model.predict(data, batch_size=16), model.predict(x, batch_size=16))
+
+
+def test_FeaturePlan():
+    x, _, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    feature_columns += [SparseFeat('grouped', 5, group_name='other'),
+                        VarLenSparseFeat(SparseFeat('bag', 10), maxlen=3, ragged=True)]
+    x['grouped'] = np.random.randint(0, 5, SAMPLE_SIZE)
+    x['bag'] = pack_sequences([np.random.randint(1, 10, np.random.randint(1, 4)) for _ in range(SAMPLE_SIZE)])
+    feature_index = build_typed_input_features(feature_columns)
+    embedding_dict = create_embedding_matrix(feature_columns)
+    batch = build_feature_batch(x, feature_index)
+    sparse_feature_columns = [fc for fc in feature_columns if isinstance(fc, SparseFeat)]
+    varlen_feature_columns = [fc for fc in feature_columns if isinstance(fc, VarLenSparseFeat)]
+    padded_feature_columns = [fc for fc in varlen_feature_columns if not fc.ragged]
+
+    plan = FeaturePlan(feature_columns, feature_index)
+    expected = [embedding_dict[fc.embedding_name](get_feature_input(batch, feature_index, fc.name))
+                for fc in sparse_feature_columns]
+    expected += get_varlen_pooling_list(varlen_embedding_lookup(batch, embedding_dict, feature_index,
+                                                                varlen_feature_columns),
+                                        batch, feature_index, varlen_feature_columns, 'cpu')
+    actual = plan.sparse_embeddings(batch, embedding_dict) + plan.varlen_embeddings(batch, embedding_dict)
+    assert len(actual) == len(expected)
+    assert all(torch.equal(a, e) for a, e in zip(actual, expected))
+    assert torch.equal(plan.stacked_embeddings(batch, embedding_dict), torch.cat(expected, dim=1))
+    assert all(torch.equal(a, e) for a, e in zip(plan.dense_values(batch),
+                                                 get_dense_input(batch, feature_index, feature_columns)))
+
+    lookup_plan = FeaturePlan(sparse_feature_columns + padded_feature_columns, feature_index)
+    expected = embedding_lookup(batch, embedding_dict, feature_index, sparse_feature_columns + padded_feature_columns,
+                                to_list=True)
+    actual = lookup_plan.lookup(batch, embedding_dict)
+    assert [tuple(e.shape) for e in actual] == [tuple(e.shape) for e in expected]
+    assert all(torch.equal(a, e) for a, e in zip(actual, expected))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import pytest
+import torch
+import torch.nn as nn
+
+from deepctr_torch.layers import InnerProductLayer, OutterProductLayer, AFMLayer, BilinearInteraction, CIN, \
+    InteractingLayer
+
+BATCH_SIZE = 5
+EMBEDDING_SIZE = 4
+
+
+def _pairs(embed_list):
+    # reference: one slice per field pair
+    p = torch.cat([v_i for v_i, _ in itertools.combinations(embed_list, 2)], dim=1)
+    q = torch.cat([v_j for _, v_j in itertools.combinations(embed_list, 2)], dim=1)
+    return p, q
+
+
+def _embed_list(field_size):
+    torch.manual_seed(1024)
+    return [torch.randn(BATCH_SIZE, 1, EMBEDDING_SIZE) for _ in range(field_size)]
+
+
+@pytest.mark.parametrize(
+    'field_size, reduce_sum',
+    [(2, True), (3, False), (7, True)]
+)
+def test_InnerProductLayer(field_size, reduce_sum):
+    embed_list = _embed_list(field_size)
+    layer = InnerProductLayer(reduce_sum=reduce_sum)
+    p, q = _pairs(embed_list)
+    expected = torch.sum(p * q, dim=2, keepdim=True) if reduce_sum else p * q
+    assert torch.equal(layer(embed_list), expected)
+    assert torch.equal(layer(torch.cat(embed_list, dim=1)), expected)
+
+
+@pytest.mark.parametrize(
+    'field_size, kernel_type',
+    [(2, 'vec'), (5, 'vec'), (5, 'num'), (5, 'mat')]
+)
+def test_OutterProductLayer(field_size, kernel_type):
+    embed_list = _embed_list(field_size)
+    layer = OutterProductLayer(field_size, EMBEDDING_SIZE, kernel_type=kernel_type)
+    p, q = _pairs(embed_list)
+    if kernel_type == 'mat':
+        expected = torch.sum(torch.sum(p.unsqueeze(1) * layer.kernel, dim=-1).transpose(2, 1) * q, dim=-1)
+    else:
+        expected = torch.sum(p * q * layer.kernel.unsqueeze(0), dim=-1)
+    assert torch.allclose(layer(embed_list), expected, atol=1e-6)
+    assert torch.allclose(layer(torch.cat(embed_list, dim=1)), expected, atol=1e-6)
+
+
+def test_AFMLayer():
+    embed_list = _embed_list(6)
+    layer = AFMLayer(EMBEDDING_SIZE).eval()
+    p, q = _pairs(embed_list)
+    bi_interaction = p * q
+    attention_temp = torch.relu(torch.tensordot(bi_interaction, layer.attention_W, dims=([-1], [0])) +
+                                layer.attention_b)
+    score = torch.softmax(torch.tensordot(attention_temp, layer.projection_h, dims=([-1], [0])), dim=1)
+    expected = torch.tensordot(torch.sum(score * bi_interaction, dim=1), layer.projection_p, dims=([-1], [0]))
+    assert torch.equal(layer(embed_list), expected)
+
+
+@pytest.mark.parametrize(
+    'field_size, bilinear_type',
+    [(2, 'all'), (5, 'all'), (2, 'each'), (5, 'each'), (2, 'interaction'), (5, 'interaction')]
+)
+def test_BilinearInteraction(field_size, bilinear_type):
+    embed_list = _embed_list(field_size)
+    # reference: one nn.Linear per field or pair, as in checkpoints saved before the weights were stacked
+    old = nn.Module()
+    if bilinear_type == 'all':
+        old.bilinear = nn.Linear(EMBEDDING_SIZE, EMBEDDING_SIZE, bias=False)
+        expected = [old.bilinear(v_i) * v_j for v_i, v_j in itertools.combinations(embed_list, 2)]
+    elif bilinear_type == 'each':
+        old.bilinear = nn.ModuleList([nn.Linear(EMBEDDING_SIZE, EMBEDDING_SIZE, bias=False)
+                                      for _ in range(field_size)])
+        expected = [old.bilinear[i](embed_list[i]) * embed_list[j]
+                    for i, j in itertools.combinations(range(field_size), 2)]
+    else:
+        old.bilinear = nn.ModuleList([nn.Linear(EMBEDDING_SIZE, EMBEDDING_SIZE, bias=False)
+                                      for _ in itertools.combinations(range(field_size), 2)])
+        expected = [bilinear(v[0]) * v[1]
+                    for v, bilinear in zip(itertools.combinations(embed_list, 2), old.bilinear)]
+    expected = torch.cat(expected, dim=1)
+
+    layer = BilinearInteraction(field_size, EMBEDDING_SIZE, bilinear_type)
+    layer.load_state_dict(old.state_dict())
+    assert torch.allclose(layer(torch.cat(embed_list, dim=1)), expected, atol=1e-6)
+
+    restored = BilinearInteraction(field_size, EMBEDDING_SIZE, bilinear_type)
+    restored.load_state_dict(layer.state_dict())
+    assert torch.equal(restored(torch.cat(embed_list, dim=1)), layer(torch.cat(embed_list, dim=1)))
+
+
+@pytest.mark.parametrize(
+    'layer_size, split_half, chunk_size, use_checkpoint',
+    [((4, 4), True, 1, False),
+     ((4, 4), True, 3, True),
+     ((4, 3), False, 2, False),
+     ((4, 4), True, None, True)]
+)
+def test_CIN_chunks(layer_size, split_half, chunk_size, use_checkpoint):
+    field_size = 5
+    inputs = torch.cat(_embed_list(field_size), dim=1).requires_grad_()
+    layer = CIN(field_size, layer_size, split_half=split_half)
+    chunked = CIN(field_size, layer_size, split_half=split_half, chunk_size=chunk_size, use_checkpoint=use_checkpoint)
+    chunked.load_state_dict(layer.state_dict())
+
+    expected = layer(inputs)
+    expected_grads = torch.autograd.grad(expected.sum(), [inputs] + list(layer.parameters()))
+    result = chunked(inputs)
+    grads = torch.autograd.grad(result.sum(), [inputs] + list(chunked.parameters()))
+    assert torch.allclose(result, expected, atol=1e-6)
+    for grad, expected_grad in zip(grads, expected_grads):
+        assert torch.allclose(grad, expected_grad, atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    'head_num, use_res, scaling',
+    [(1, True, False), (2, True, False), (2, False, True), (4, True, True)]
+)
+def test_InteractingLayer(head_num, use_res, scaling):
+    inputs = torch.cat(_embed_list(6), dim=1)
+    # reference: separate projections, as in checkpoints saved before they were fused
+    torch.manual_seed(1024)
+    old = {name: torch.randn(EMBEDDING_SIZE, EMBEDDING_SIZE) * 0.05 for name in ['W_Query', 'W_key', 'W_Value']}
+    if use_res:
+        old['W_Res'] = torch.randn(EMBEDDING_SIZE, EMBEDDING_SIZE) * 0.05
+    querys, keys, values = [torch.stack(torch.split(torch.tensordot(inputs, old[name], dims=([-1], [0])),
+                                                    EMBEDDING_SIZE // head_num, dim=2))
+                            for name in ['W_Query', 'W_key', 'W_Value']]
+    inner_product = torch.einsum('bnik,bnjk->bnij', querys, keys)
+    if scaling:
+        inner_product /= (EMBEDDING_SIZE // head_num) ** 0.5
+    scores = torch.softmax(inner_product, dim=-1)
+    expected = torch.matmul(scores, values)
+    expected = torch.squeeze(torch.cat(torch.split(expected, 1, ), dim=-1), dim=0)
+    if use_res:
+        expected = expected + torch.tensordot(inputs, old['W_Res'], dims=([-1], [0]))
+    expected = torch.relu(expected)
+
+    layer = InteractingLayer(EMBEDDING_SIZE, head_num, use_res, scaling)
+    layer.load_state_dict(old)
+    assert torch.allclose(layer(inputs), expected, atol=1e-6)
+
+    restored = InteractingLayer(EMBEDDING_SIZE, head_num, use_res, scaling)
+    restored.load_state_dict(layer.state_dict())
+    assert torch.equal(restored(inputs), layer(inputs))
+    assert restored.normalized_att_scores is None
+
+    restored.store_attention = True
+    assert torch.allclose(restored(inputs), expected, atol=1e-6)
+    assert torch.allclose(restored.normalized_att_scores, scores, atol=1e-6)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import torch
+from sklearn.metrics import log_loss, roc_auc_score, mean_squared_error, accuracy_score
+
+from deepctr_torch.metrics import get_metric, evaluate_metrics
+from deepctr_torch.models import DeepFM
+from .utils import get_test_data, SAMPLE_SIZE, get_device
+
+
+@pytest.mark.parametrize(
+    'name, sklearn_metric, rtol, atol',
+    [('logloss', log_loss, 1e-6, 0),
+     ('mse', mean_squared_error, 1e-6, 0),
+     ('acc', lambda y, p: accuracy_score(y, p > 0.5), 0, 1e-10),
+     ('auc', roc_auc_score, 0, 1e-3)]
+)
+def test_metric(name, sklearn_metric, rtol, atol):
+    rng = np.random.RandomState(1024)
+    y = rng.randint(0, 2, 1000)
+    pred = np.clip(0.3 * y + 0.7 * rng.rand(1000), 0, 1)
+
+    metric = get_metric(name)
+    for start in range(0, 1000, 128):
+        metric.update(torch.from_numpy(y[start:start + 128]), torch.from_numpy(pred[start:start + 128]).float())
+    # the accumulators work in float64 on the float32 predictions
+    expected = sklearn_metric(y, pred.astype(np.float32).astype(np.float64))
+    assert abs(metric.result() - expected) <= atol + rtol * abs(expected)
+
+    metric.reset()
+    assert np.isnan(metric.result())
+
+
+def test_multi_output_auc():
+    rng = np.random.RandomState(1024)
+    y = rng.randint(0, 2, (500, 2))
+    pred = rng.rand(500, 2)
+    result = evaluate_metrics({'auc': get_metric('auc')}, [(torch.from_numpy(y), torch.from_numpy(pred))])
+    assert abs(result['auc'] - roc_auc_score(y, pred)) < 1e-3
+
+
+def test_evaluate_metrics():
+    np.random.seed(1024)
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy', 'auc'])
+    history = model.fit(x, y, batch_size=16, epochs=1, verbose=0)
+    assert 'auc' in history.history
+
+    result = model.evaluate(x, y, batch_size=16)
+    pred = model.predict(x, batch_size=16)
+    # LogLoss clips at 1e-15, sklearn>=1.3 at the float eps, which differs on saturated predictions
+    assert abs(result['binary_crossentropy'] - log_loss(y, np.clip(pred, 1e-15, 1 - 1e-15))) < 1e-5
+    assert abs(result['auc'] - roc_auc_score(y, pred)) < 1e-2
+
+
+def test_basemodel_metric_functions():
+    rng = np.random.RandomState(1024)
+    y = rng.randint(0, 2, 200)
+    pred = np.clip(0.3 * y + 0.7 * rng.rand(200), 0, 1)
+    x, _, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, device=get_device())
+    assert abs(model._log_loss(y, pred) - log_loss(y, pred)) <= 1e-6 * log_loss(y, pred)
+    assert abs(model._accuracy_score(y, pred) - accuracy_score(y, pred > 0.5)) < 1e-10
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+import torch
+from sklearn.metrics import roc_auc_score
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+
+from deepctr_torch.inputs import SparseFeat, DenseFeat
+from deepctr_torch.models import DeepFM, xDeepFM, AutoInt, DCN
+from .utils import get_device
+
+CRITEO_SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', 'criteo_sample.txt')
+
+
+def get_criteo_sample():
+    pd = pytest.importorskip('pandas')
+    data = pd.read_csv(CRITEO_SAMPLE)
+    sparse_features = ['C' + str(i) for i in range(1, 27)]
+    dense_features = ['I' + str(i) for i in range(1, 14)]
+    data[sparse_features] = data[sparse_features].fillna('-1', )
+    data[dense_features] = data[dense_features].fillna(0, )
+    for feat in sparse_features:
+        data[feat] = LabelEncoder().fit_transform(data[feat])
+    data[dense_features] = MinMaxScaler(feature_range=(0, 1)).fit_transform(data[dense_features])
+
+    feature_columns = [SparseFeat(feat, vocabulary_size=data[feat].max() + 1, embedding_dim=4)
+                       for feat in sparse_features] + [DenseFeat(feat, 1, ) for feat in dense_features]
+    x = {name: data[name].values for name in sparse_features + dense_features}
+    return x, data['label'].values, feature_columns
+
+
+@pytest.mark.skipif(not hasattr(torch, 'autocast'), reason='autocast requires torch>=1.10')
+@pytest.mark.parametrize(
+    'model_class',
+    [DeepFM, xDeepFM, AutoInt, DCN]
+)
+def test_mixed_precision(model_class):
+    x, y, feature_columns = get_criteo_sample()
+    auc = {}
+    for mixed_precision in [None, 'bfloat16']:
+        model = model_class(feature_columns, feature_columns, device=get_device())
+        model.compile('adagrad', 'binary_crossentropy', metrics=['auc'], mixed_precision=mixed_precision)
+        model.fit(x, y, batch_size=32, epochs=10, verbose=0)
+        pred = model.predict(x, batch_size=64)
+        auc[mixed_precision] = roc_auc_score(y, pred)
+        assert all(parameter.dtype == torch.float32 for parameter in model.parameters())
+    assert abs(auc[None] - auc['bfloat16']) < 0.05
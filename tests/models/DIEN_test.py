@@ -3,8 +3,9 @@ import pytest
 import torch
 
 from deepctr_torch.inputs import SparseFeat, DenseFeat, VarLenSparseFeat, get_feature_names
+from deepctr_torch.layers.sequence import AUGRUCell
 from deepctr_torch.models.dien import InterestEvolving, DIEN
-from ..utils import check_model, get_device
+from ..utils import check_model, get_device, traced_predict
 
 
 @pytest.mark.parametrize(
@@ -32,6 +33,18 @@ def test_InterestEvolving(gru_type):
     assert output.size()[1] == 3
 
 
+def test_AUGRUCell_parameters():
+    cell = AUGRUCell(3, 4)
+    assert [name for name, _ in cell.named_parameters()] == ['weight_ih', 'weight_hh', 'bias_ih', 'bias_hh']
+
+    # checkpoints saved when bias_ih was registered as bias_hh hold the same values under both names
+    bias = torch.randn(12)
+    state_dict = {'weight_ih': torch.randn(12, 3), 'weight_hh': torch.randn(12, 4), 'bias_ih': bias, 'bias_hh': bias}
+    cell.load_state_dict(state_dict)
+    assert torch.equal(cell.bias_ih, bias) and torch.equal(cell.bias_hh, bias)
+    assert cell.bias_ih is not cell.bias_hh
+
+
 def get_xy_fd(use_neg=False, hash_flag=False):
     feature_columns = [SparseFeat('user', 4, embedding_dim=4, use_hash=hash_flag),
                        SparseFeat('gender', 2, embedding_dim=4, use_hash=hash_flag),
@@ -96,5 +109,22 @@ def test_DIEN(gru_type, use_neg):
     check_model(model, model_name, x, y)
 
 
+@pytest.mark.parametrize(
+    'gru_type',
+    ["AUGRU", "GRU"]
+)
+def test_DIEN_torchscript_lengths(gru_type):
+    x, y, feature_columns, behavior_feature_list = get_xy_fd()
+    model = DIEN(feature_columns, behavior_feature_list, gru_type=gru_type, dnn_hidden_units=[4, 4, 4],
+                 device=get_device())
+    traced = model.to_torchscript(x, batch_size=4)
+
+    # the GRUs of DIEN run over the sequence lengths of the traced batch, so the trace only holds for batches of the
+    # same lengths, whatever their items
+    x_items = dict(x, hist_item_id=np.where(x['hist_item_id'] > 0, 3, 0), item_id=np.array([3, 1, 1, 2]))
+    np.testing.assert_allclose(traced_predict(traced, model, x_items, 4), model.predict(x_items, batch_size=4),
+                               rtol=1e-4, atol=1e-6)
+
+
 if __name__ == "__main__":
     pass
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import numpy as np
+import pytest
+import torch
 
 from deepctr_torch.inputs import SparseFeat, VarLenSparseFeat, DenseFeat, get_feature_names
 from deepctr_torch.models.din import DIN
-from ..utils import check_model, get_device
+from ..utils import check_model, get_device, traced_predict
 
 
 def get_xy_fd(hash_flag=False):
@@ -14,9 +16,11 @@ def get_xy_fd(hash_flag=False):
                        DenseFeat('pay_score', 1)]
 
     feature_columns += [
-        VarLenSparseFeat(SparseFeat('hist_item_id', vocabulary_size=3 + 1, embedding_dim=8, embedding_name='item_id'),
+        VarLenSparseFeat(SparseFeat('hist_item_id', vocabulary_size=3 + 1, embedding_dim=8, use_hash=hash_flag,
+                                    embedding_name='item_id'),
                          maxlen=4, length_name="seq_length"),
-        VarLenSparseFeat(SparseFeat('hist_cate_id', vocabulary_size=2 + 1, embedding_dim=4, embedding_name='cate_id'),
+        VarLenSparseFeat(SparseFeat('hist_cate_id', vocabulary_size=2 + 1, embedding_dim=4, use_hash=hash_flag,
+                                    embedding_name='cate_id'),
                          maxlen=4,
                          length_name="seq_length")]
 
@@ -41,14 +45,42 @@ def get_xy_fd(hash_flag=False):
     return x, y, feature_columns, behavior_feature_list
 
 
-def test_DIN():
+@pytest.mark.parametrize(
+    'hash_flag',
+    [False, True]
+)
+def test_DIN(hash_flag):
     model_name = "DIN"
 
-    x, y, feature_columns, behavior_feature_list = get_xy_fd()
+    x, y, feature_columns, behavior_feature_list = get_xy_fd(hash_flag)
     model = DIN(feature_columns, behavior_feature_list, dnn_dropout=0.5, device=get_device())
 
     check_model(model, model_name, x, y)  # only have 3 train data so we set validation ratio at 0
 
 
+def test_DIN_torchscript_lengths():
+    x, y, feature_columns, behavior_feature_list = get_xy_fd()
+    model = DIN(feature_columns, behavior_feature_list, device=get_device())
+    traced = model.to_torchscript(x, batch_size=4)
+
+    # DIN masks the behavior sequences with tensors, so the trace holds for other lengths and batch sizes
+    x_lengths = dict(x, seq_length=np.array([1, 4, 3, 1]))
+    np.testing.assert_allclose(traced_predict(traced, model, x_lengths, 4), model.predict(x_lengths, batch_size=4),
+                               rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(traced_predict(traced, model, x_lengths, 3),
+                               model.predict(x_lengths, batch_size=3)[:3], rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.skipif(not hasattr(torch, 'compile'), reason='torch.compile requires torch>=2.0')
+def test_DIN_jit_compile():
+    x, y, feature_columns, behavior_feature_list = get_xy_fd()
+    model = DIN(feature_columns, behavior_feature_list, device=get_device())
+    eager_pred = model.predict(x, batch_size=4)
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'], jit_compile=True)
+    assert abs(model.predict(x, batch_size=4) - eager_pred).max() < 1e-5
+
+    model.fit(x, y, batch_size=4, epochs=1)
+
+
 if __name__ == "__main__":
     pass
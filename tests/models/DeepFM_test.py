@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import pytest
+import torch
 
+from deepctr_torch.inputs import get_feature_input, fuse_state_dict, unfuse_state_dict
 from deepctr_torch.models import DeepFM
 from ..utils import get_test_data, SAMPLE_SIZE, check_model, get_device
 
@@ -34,5 +36,162 @@ def test_DeepFM(use_fm, hidden_size, sparse_feature_num, dense_feature_num):
                    dnn_hidden_units=hidden_size, dnn_dropout=0.5, device=get_device())
     check_model(model, model_name + '_no_linear', x, y)
 
+
+def test_DeepFM_stream():
+    model_name = "DeepFM_stream"
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+
+    def batch_generator(batch_size=16):
+        for start in range(0, SAMPLE_SIZE, batch_size):
+            yield {name: value[start:start + batch_size] for name, value in x.items()}, y[start:start + batch_size]
+
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy', 'acc'])
+    history = model.fit(batch_generator, epochs=2, validation_data=batch_generator)
+    assert len(history.history['loss']) == 2
+    assert 'val_binary_crossentropy' in history.history
+
+    pred_ans = model.predict(batch_generator())
+    assert pred_ans.shape == (SAMPLE_SIZE, 1)
+    print(model_name + 'test pass!')
+
+
+def test_DeepFM_log_interval():
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    losses = []
+    for log_interval in [None, 1]:
+        model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+        model.compile('adam', 'binary_crossentropy')
+        history = model.fit(x, y, batch_size=16, epochs=1, shuffle=False, log_interval=log_interval)
+        losses.append(history.history['loss'][0])
+    assert abs(losses[0] - losses[1]) < 1e-6
+
+
+@pytest.mark.parametrize(
+    'validation_samples',
+    [None, 8]
+)
+def test_DeepFM_validation_interval(validation_samples):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'])
+    history = model.fit(x, y, batch_size=16, epochs=2, validation_split=0.5, validation_interval=1,
+                        validation_samples=validation_samples)
+    assert len(history.history['val_binary_crossentropy']) == 2
+    assert model.step_history['step'] == [1, 2, 3, 4]
+    assert len(model.step_history['val_binary_crossentropy']) == 4
+
+
+@pytest.mark.parametrize(
+    'embedding_regularization',
+    ['batch', 'frequency']
+)
+def test_DeepFM_embedding_regularization(embedding_regularization):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), l2_reg_linear=0, l2_reg_embedding=0.1,
+                   device=get_device())
+    model.compile('adam', 'binary_crossentropy', embedding_regularization=embedding_regularization)
+
+    batch, _ = model._prepare_inputs({name: value[:4] for name, value in x.items()})
+    batch = batch.to(get_device())
+    expected = 0
+    for name, table in model.embedding_dict.items():
+        rows, counts = torch.unique(get_feature_input(batch, model.feature_index, name), return_counts=True)
+        penalty = 0.1 * (table.weight[rows] ** 2).sum(dim=1)
+        if embedding_regularization == 'frequency':
+            penalty = penalty / counts.float()
+        expected += penalty.sum().item()
+    assert abs(model.get_regularization_loss(batch).item() - expected) < 1e-6 * max(expected, 1)
+    assert model.get_regularization_loss(batch).item() <= model.get_regularization_loss().item()
+
+    model.fit(x, y, batch_size=16, epochs=1)
+
+
+@pytest.mark.parametrize(
+    'embedding_optimizer',
+    ['sparse_adam', 'adagrad', 'rowwise_adagrad', 'sgd']
+)
+def test_DeepFM_sparse_embedding(embedding_optimizer):
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    model.compile({'embedding': embedding_optimizer, 'dense': 'adam'}, 'binary_crossentropy',
+                  metrics=['binary_crossentropy'])
+    assert model.embedding_regularization == 'batch'
+
+    model.fit(x, y, batch_size=16, epochs=1, validation_split=0.5)
+    embedding_parameters, dense_parameters = model.split_parameters()
+    assert all(p.grad is None or p.grad.is_sparse for p in embedding_parameters)
+    assert all(p.grad is None or not p.grad.is_sparse for p in dense_parameters)
+
+    with pytest.raises(ValueError):
+        model.compile({'embedding': 'sparse_adam'}, 'binary_crossentropy', embedding_regularization='full')
+
+
+def test_DeepFM_fuse_embeddings():
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=3, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    fused = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device()).fuse_embeddings()
+    assert '__fused_4' in fused.embedding_dict and '__fused_1' in fused.linear_model.embedding_dict
+    assert abs(model.predict(x, batch_size=16) - fused.predict(x, batch_size=16)).max() < 1e-6
+
+    for embedding_regularization in ['full', 'batch']:
+        model.compile('adam', 'binary_crossentropy', embedding_regularization=embedding_regularization)
+        fused.compile('adam', 'binary_crossentropy', embedding_regularization=embedding_regularization)
+        batch, _ = model._prepare_inputs({name: value[:4] for name, value in x.items()})
+        batch = batch.to(get_device())
+        assert abs(model.get_regularization_loss(batch).item() - fused.get_regularization_loss(batch).item()) < 1e-9
+
+    # the fused gather is handed to the models as one (batch_size, num_features, embedding_dim) tensor
+    fused.eval()
+    expected = torch.cat(fused.input_from_feature_columns(batch, fused.dnn_feature_columns, fused.embedding_dict)[0],
+                         dim=1)
+    stacked, _ = fused.stacked_input_from_feature_columns(batch, fused.dnn_feature_columns, fused.embedding_dict)
+    assert torch.equal(stacked, expected)
+
+    fused.fit(x, y, batch_size=16, epochs=1)
+    model.load_state_dict(unfuse_state_dict(fused.state_dict(), fused))
+    assert abs(model.predict(x, batch_size=16) - fused.predict(x, batch_size=16)).max() < 1e-6
+    fused.load_state_dict(fuse_state_dict(model.state_dict(), fused))
+
+    with pytest.raises(ValueError):
+        fused.fuse_embeddings()
+
+
+def test_DeepFM_share_linear_embeddings():
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=3, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    shared = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,),
+                    device=get_device()).share_linear_embeddings()
+    assert shared.embedding_dict['__shared_sparse_feature_0'].weight.shape[1] == 5
+    assert len(list(shared.linear_model.embedding_dict.parameters())) == 0
+    assert abs(model.predict(x, batch_size=16) - shared.predict(x, batch_size=16)).max() < 1e-6
+
+    for embedding_regularization in ['full', 'batch', 'frequency']:
+        model.compile('adam', 'binary_crossentropy', embedding_regularization=embedding_regularization)
+        shared.compile('adam', 'binary_crossentropy', embedding_regularization=embedding_regularization)
+        batch, _ = model._prepare_inputs({name: value[:4] for name, value in x.items()})
+        batch = batch.to(get_device())
+        assert abs(model.get_regularization_loss(batch).item() - shared.get_regularization_loss(batch).item()) < 1e-9
+
+    shared.fit(x, y, batch_size=16, epochs=1)
+    assert shared._batch_lookups.batch is None
+
+    with pytest.raises(ValueError):
+        DeepFM(feature_columns, feature_columns, device=get_device()).fuse_embeddings().share_linear_embeddings()
+
+
+@pytest.mark.skipif(not hasattr(torch, 'compile'), reason='torch.compile requires torch>=2.0')
+def test_DeepFM_jit_compile():
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,), device=get_device())
+    eager_pred = model.predict(x, batch_size=16)
+    model.compile('adam', 'binary_crossentropy', metrics=['binary_crossentropy'], jit_compile=True)
+    assert abs(model.predict(x, batch_size=16) - eager_pred).max() < 1e-5
+
+    model.fit(x, y, batch_size=16, epochs=1)
+    assert len(model.state_dict()) == len(DeepFM(feature_columns, feature_columns, dnn_hidden_units=(32,),
+                                                 device=get_device()).state_dict())
+
+
 if __name__ == "__main__":
     pass
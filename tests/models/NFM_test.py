@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import pytest
 
+from deepctr_torch.inputs import SparseFeat
 from deepctr_torch.models import NFM
 from ..utils import check_model, get_test_data, SAMPLE_SIZE, get_device
 
@@ -21,5 +22,11 @@ def test_NFM(hidden_size, sparse_feature_num):
     check_model(model, model_name, x, y)
 
 
+def test_NFM_embedding_dims():
+    feature_columns = [SparseFeat('a', 5, embedding_dim=4), SparseFeat('b', 5, embedding_dim=8)]
+    with pytest.raises(ValueError, match='embedding_dim of SparseFeat and VarlenSparseFeat must be same'):
+        NFM(feature_columns, feature_columns, device=get_device())
+
+
 if __name__ == "__main__":
     pass
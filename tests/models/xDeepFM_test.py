@@ -24,5 +24,19 @@ def test_xDeepFM(dnn_hidden_units, cin_layer_size, cin_split_half, cin_activatio
     check_model(model, model_name, x, y)
 
 
+@pytest.mark.parametrize(
+    'cin_chunk_size,cin_checkpoint',
+    [(1, False),
+     (2, True)]
+)
+def test_xDeepFM_cin_chunks(cin_chunk_size, cin_checkpoint):
+    model_name = 'xDeepFM'
+
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=3, dense_feature_num=2)
+    model = xDeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), cin_layer_size=(8, 8),
+                    cin_chunk_size=cin_chunk_size, cin_checkpoint=cin_checkpoint, device=get_device())
+    check_model(model, model_name, x, y)
+
+
 if __name__ == '__main__':
     pass
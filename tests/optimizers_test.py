@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from itertools import chain
+
+import pytest
+import torch
+
+from deepctr_torch.models import DeepFM
+from deepctr_torch.optimizers import RowWiseAdagrad, MultiOptimizer
+from .utils import get_test_data, SAMPLE_SIZE, get_device
+
+
+def _train(embedding, optimizer, steps=3):
+    for _ in range(steps):
+        optimizer.zero_grad()
+        embedding(torch.tensor([[1, 3, 3], [3, 5, 1]])).pow(2).sum().backward()
+        optimizer.step()
+    return embedding.weight.detach()
+
+
+@pytest.mark.parametrize(
+    'rowwise',
+    [True, False]
+)
+def test_RowWiseAdagrad(rowwise):
+    torch.manual_seed(1024)
+    dense = torch.nn.Embedding(8, 4)
+    sparse = torch.nn.Embedding(8, 4, sparse=True)
+    sparse.weight.data.copy_(dense.weight.data)
+    initial = dense.weight.detach().clone()
+
+    dense_weight = _train(dense, RowWiseAdagrad(dense.parameters(), lr=0.1, rowwise=rowwise))
+    optimizer = RowWiseAdagrad(sparse.parameters(), lr=0.1, rowwise=rowwise)
+    sparse_weight = _train(sparse, optimizer)
+
+    assert torch.allclose(dense_weight, sparse_weight, atol=1e-6)
+    assert torch.equal(sparse_weight[[0, 2, 4, 6, 7]], initial[[0, 2, 4, 6, 7]])
+    assert tuple(optimizer.state[sparse.weight]['sum'].shape) == ((8,) if rowwise else (8, 4))
+    if not rowwise:
+        reference = torch.nn.Embedding(8, 4)
+        reference.weight.data.copy_(initial)
+        assert torch.allclose(_train(reference, torch.optim.Adagrad(reference.parameters(), lr=0.1)), dense_weight,
+                              atol=1e-6)
+
+
+def test_rowwise_adagrad_compile():
+    x, y, feature_columns = get_test_data(SAMPLE_SIZE, sparse_feature_num=2, dense_feature_num=2)
+    model = DeepFM(feature_columns, feature_columns, dnn_hidden_units=(8,), device=get_device())
+    model.compile('rowwise_adagrad', 'binary_crossentropy')
+    assert isinstance(model.optim, RowWiseAdagrad)
+    model.fit(x, y, batch_size=16, epochs=1)
+
+    table = next(iter(model.embedding_dict.values())).weight
+    assert model.optim.state[table]['sum'].dim() == 1
+
+
+def test_MultiOptimizer_closure():
+    torch.manual_seed(1024)
+    first, second = torch.nn.Linear(4, 1), torch.nn.Linear(4, 1)
+    optimizer = MultiOptimizer([torch.optim.SGD(first.parameters(), lr=0.1),
+                                torch.optim.SGD(second.parameters(), lr=0.1)])
+    initial = [p.detach().clone() for p in chain(first.parameters(), second.parameters())]
+    calls = []
+
+    def closure():
+        calls.append(1)
+        optimizer.zero_grad()
+        loss = (first(torch.ones(2, 4)) + second(torch.ones(2, 4))).pow(2).sum()
+        loss.backward()
+        return loss
+
+    loss = optimizer.step(closure)
+    assert len(calls) == 1 and loss.dim() == 0
+    assert all(not torch.equal(p, p0) for p, p0 in zip(chain(first.parameters(), second.parameters()), initial))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
+from itertools import chain
 
 import numpy as np
 import torch as torch
@@ -36,7 +37,12 @@ def get_test_data(sample_size=1000, embedding_size=4, sparse_feature_num=1, dens
 
     for i in range(sparse_feature_num):
         dim = np.random.randint(1, 10)
-        feature_columns.append(SparseFeat(prefix + 'sparse_feature_' + str(i), dim, embedding_size, dtype=torch.int32))
+        if hash_flag:
+            feature_columns.append(SparseFeat(prefix + 'sparse_feature_' + str(i), dim + 1, embedding_size,
+                                              use_hash=True, dtype='string'))
+        else:
+            feature_columns.append(
+                SparseFeat(prefix + 'sparse_feature_' + str(i), dim, embedding_size, dtype=torch.int32))
     for i in range(dense_feature_num):
         feature_columns.append(DenseFeat(prefix + 'dense_feature_' + str(i), 1, dtype=torch.float32))
     for i, mode in enumerate(sequence_feature):
@@ -49,6 +55,8 @@ def get_test_data(sample_size=1000, embedding_size=4, sparse_feature_num=1, dens
     for fc in feature_columns:
         if isinstance(fc, SparseFeat):
             model_input[fc.name] = np.random.randint(0, fc.vocabulary_size, sample_size)
+            if fc.use_hash:
+                model_input[fc.name] = model_input[fc.name].astype(str)
         elif isinstance(fc, DenseFeat):
             model_input[fc.name] = np.random.random(sample_size)
         else:
@@ -139,7 +147,7 @@ def layer_test(layer_cls, kwargs={}, input_shape=None,
     return output
 
 
-def check_model(model, model_name, x, y, check_model_io=True):
+def check_model(model, model_name, x, y, check_model_io=True, check_model_trace=True):
     '''
     compile model,train and evaluate it,then save/load weight and model file.
     :param model:
@@ -147,6 +155,7 @@ def check_model(model, model_name, x, y, check_model_io=True):
     :param x:
     :param y:
     :param check_model_io:
+    :param check_model_trace:
     :return:
     '''
     early_stopping = EarlyStopping(monitor='val_acc', min_delta=0, verbose=1, patience=0, mode='max')
@@ -168,9 +177,31 @@ def check_model(model, model_name, x, y, check_model_io=True):
         model = torch.load(model_name + '.h5')
         os.remove(model_name + '.h5')
         print(model_name + 'test save load model pass!')
+    if check_model_trace:
+        check_torchscript(model, model_name, x)
+        print(model_name + 'test torchscript pass!')
     print(model_name + 'test pass!')
 
 
+def check_torchscript(model, model_name, x, batch_size=16):
+    """Trace the model, save and load it with TorchScript, and compare its predictions on the traced batch and on a
+    smaller one."""
+    model.to_torchscript(x, path=model_name + '.pt', batch_size=batch_size)
+    traced = torch.jit.load(model_name + '.pt', map_location=model.device)
+    os.remove(model_name + '.pt')
+    for size in [batch_size, batch_size // 2]:
+        np.testing.assert_allclose(traced_predict(traced, model, x, size),
+                                   model.predict(x, batch_size=size)[:size], rtol=1e-4, atol=1e-6)
+
+
+def traced_predict(traced, model, x, batch_size):
+    """Predictions of a traced model on the first batch of ``x``."""
+    inputs, _ = next(iter(model._device_batches(model._get_batch_loader(x, None, batch_size))))
+    with torch.no_grad():
+        pred = traced(*(tuple(inputs[:3]) + tuple(chain.from_iterable(inputs.ragged))))
+    return pred.cpu().numpy()
+
+
 def get_device(use_cuda=True):
     device = 'cpu'
     if use_cuda and torch.cuda.is_available():
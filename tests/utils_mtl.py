@@ -6,6 +6,7 @@ import torch as torch
 
 from deepctr_torch.callbacks import EarlyStopping, ModelCheckpoint
 from deepctr_torch.inputs import SparseFeat, DenseFeat, VarLenSparseFeat
+from .utils import check_torchscript
 
 SAMPLE_SIZE = 64
 
@@ -72,7 +73,7 @@ def get_mtl_test_data(sample_size=1000, embedding_size=4, sparse_feature_num=1,
     return model_input, y_list, feature_columns
 
 
-def check_mtl_model(model, model_name, x, y_list, task_types, check_model_io=True):
+def check_mtl_model(model, model_name, x, y_list, task_types, check_model_io=True, check_model_trace=True):
     '''
     compile model,train and evaluate it,then save/load weight and model file.
     :param model:
@@ -81,6 +82,7 @@ def check_mtl_model(model, model_name, x, y_list, task_types, check_model_io=Tru
     :param y_list: mutil label of y
     :param task_types:
     :param check_model_io:
+    :param check_model_trace:
     :return:
     '''
     loss_list = []
@@ -109,6 +111,9 @@ def check_mtl_model(model, model_name, x, y_list, task_types, check_model_io=Tru
         model = torch.load(model_name + '.h5')
         os.remove(model_name + '.h5')
         print(model_name + 'test save load model pass!')
+    if check_model_trace:
+        check_torchscript(model, model_name, x)
+        print(model_name + 'test torchscript pass!')
     print(model_name + 'test pass!')
 
 
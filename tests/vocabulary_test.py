@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from deepctr_torch.inputs import SparseFeat, VarLenSparseFeat
+from deepctr_torch.vocabulary import Vocabulary, build_vocabularies, save_vocabularies, load_vocabularies
+
+
+@pytest.mark.parametrize(
+    'values',
+    [np.array([3, 3, 3, 7, 7, 9]), np.array(['c', 'c', 'c', 'a long id', 'a long id', 'z'], dtype=object)]
+)
+def test_Vocabulary(values):
+    vocab = Vocabulary('item', min_freq=2).fit(values)
+    assert vocab.vocabulary_size == 1 + 1 + 2
+    # most frequent first, after padding and the OOV bucket
+    assert vocab.encode(values).tolist() == [2, 2, 2, 3, 3, 1]
+    assert vocab.encode(values[[5, 0]].reshape(1, 2)).tolist() == [[1, 2]]
+    assert abs(vocab.oov_rate() - 1. / 6) < 1e-6
+
+    feat = vocab.sparse_feat(embedding_dim=8)
+    assert isinstance(feat, SparseFeat) and feat.vocabulary_size == 4 and feat.embedding_dim == 8
+
+
+def test_Vocabulary_oov_buckets():
+    vocab = Vocabulary('item', max_size=1, num_oov_buckets=3).fit(np.array([1, 1, 2, 3, 4, 5]))
+    assert vocab.vocabulary_size == 1 + 3 + 1
+    index = vocab.encode(np.array([1, 2, 3, 4, 5, 6]))
+    assert index[0] == 4
+    assert ((index[1:] >= 1) & (index[1:] <= 3)).all()
+
+
+def test_Vocabulary_sequences():
+    vocab = Vocabulary('genres', sep='|').fit(np.array(['a|b', 'b', 'b|c|a']))
+    ids, lengths = vocab.encode_sequences(np.array(['b|a', 'd']))
+    assert lengths.tolist() == [2, 1]
+    assert ids.tolist() == [2, 3, 1]
+
+    feat = vocab.varlen_sparse_feat(maxlen=3, length_name='genres_length')
+    assert isinstance(feat, VarLenSparseFeat) and feat.vocabulary_size == 5 and feat.maxlen == 3
+
+
+@pytest.mark.parametrize(
+    'num_workers',
+    [0, 2]
+)
+def test_build_vocabularies(tmpdir, num_workers):
+    chunks = [{'user': np.array([1, 2, 2]), 'tags': np.array(['x|y', 'y', 'z'])},
+              {'user': np.array([2, 3, 1]), 'tags': np.array(['y|z', 'x', 'y'])}]
+    vocabularies = build_vocabularies(chunks, [Vocabulary('user'), Vocabulary('tags', min_freq=2, sep='|')],
+                                      num_workers=num_workers)
+    user, tags = vocabularies
+    assert user.keys.tolist() == [2, 1, 3]
+    assert tags.keys.tolist() == ['y', 'x', 'z']
+
+    path = str(tmpdir.join('vocabularies.npz'))
+    save_vocabularies(path, vocabularies)
+    loaded = load_vocabularies(path)
+    assert list(loaded) == ['user', 'tags']
+    assert loaded['tags'].sep == '|' and loaded['tags'].min_freq == 2
+    values = np.array(['z', 'y', 'unknown'])
+    assert loaded['tags'].encode(values).tolist() == tags.encode(values).tolist()
+    assert loaded['user'].encode(np.array([3, 2, 5])).tolist() == [4, 2, 1]